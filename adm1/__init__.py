@@ -1,2 +1,67 @@
-# ADM1 package init
-# Expose main modules for easy import
+"""
+ADM1 co-digestion model.
+
+Public API (loaded on first access, so `import adm1` stays cheap):
+- ADM1_coAD, setup_scenario: the simulation driver (adm1.coAD);
+- run_scenario, run_scenarios: serial / thread / process runners (adm1.runner);
+- get_influent, influent_array, get_initial_state, get_adm1_params,
+  select_parameter_set, PARAMETER_SETS: model inputs;
+- STATE_NAMES, INFLUENT_NAMES: state and influent vector layouts;
+- export_result, read_table: trajectory stores (adm1.export).
+Every submodule (adm1.bmp, adm1.digester, adm1.ensemble, ...) is also
+reachable as an attribute and imported when first used.
+
+Notes:
+- pandas and SciPy are imported by the functions that need them, not by the
+  modules, so importing the package (e.g. in runner workers or the CLI)
+  does not pay for them until a simulation runs. For the same reason this
+  module avoids importing typing.
+"""
+
+import importlib
+
+__all__ = [
+    "ADM1_coAD", "setup_scenario", "run_scenario", "run_scenarios",
+    "get_influent", "influent_array", "get_initial_state", "get_adm1_params", "select_parameter_set",
+    "PARAMETER_SETS", "STATE_NAMES", "INFLUENT_NAMES", "export_result", "read_table",
+]
+
+# Public name -> defining submodule
+_API = {
+    "ADM1_coAD": "coAD",
+    "setup_scenario": "coAD",
+    "run_scenario": "runner",
+    "run_scenarios": "runner",
+    "get_influent": "influent",
+    "influent_array": "influent",
+    "get_initial_state": "initial_state",
+    "get_adm1_params": "params",
+    "select_parameter_set": "params",
+    "PARAMETER_SETS": "params",
+    "STATE_NAMES": "constants",
+    "INFLUENT_NAMES": "constants",
+    "export_result": "export",
+    "read_table": "export",
+}
+
+_SUBMODULES = (
+    "aio", "balance", "blend", "bmp", "calibration", "cli", "coAD", "constants", "dae", "digester", "ensemble",
+    "estimation", "export", "feedstock", "forward_sensitivity", "influent", "inhibition", "initial_state", "mpc",
+    "ode", "params", "petersen", "runner", "schedule", "sensitivity", "service", "solver",
+    "surrogate", "warmstart",
+)
+
+
+def __getattr__(name: str) -> object:
+    if name in _API:
+        value = getattr(importlib.import_module(f"{__name__}.{_API[name]}"), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f"{__name__}.{name}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(__all__) | set(_SUBMODULES))
@@ -0,0 +1,9 @@
+"""Entry point for `python -m adm1` (see adm1.cli)."""
+
+import sys
+
+from adm1.cli import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+asyncio front end for ADM1_coAD.
+
+    pool = new_pool(max_workers=4)
+    result = await run_scenario(scenario, pool=pool, timeout=600)
+    async for step in stream_scenario(scenario, pool=pool):
+        print(step["t"], step["state"][STATE_INDEX["S_ac"]])
+
+Runs execute on a process pool; the event loop only waits on them.
+
+Contract:
+- new_pool(max_workers, max_pending) -> pool dict; shutdown_pool(pool).
+  Without `pool`, a default pool (one worker per core) is created on first
+  use.
+- await run_scenario(scenario, pool, timeout, reduce) -> the ADM1_coAD
+  result (or reduce(result)); raises asyncio.TimeoutError after timeout
+  seconds.
+- stream_scenario(...) is an async generator of {"t", "state"} per output
+  step (state: the 42-vector, S_H_ion at index 30) while the run
+  progresses; the last item also carries "result".
+- await run_scenarios(scenarios, ...) -> results in input order.
+
+Notes:
+- Backpressure: at most max_pending runs (default 2 * max_workers) are
+  submitted to the pool at once; further calls wait for a slot, so
+  submitting thousands of scenarios does not queue thousands of pickled
+  jobs.
+- Cancellation and timeouts reach the worker: the run's slot flag in shared
+  memory is set and the worker's per-step stop_condition ends the run at
+  the next output step; the slot is reused only after that.
+- A pool belongs to the event loop that first uses it. Scenario values,
+  stop_condition and reduce must be picklable (module-level functions).
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+# Worker-process state, set by _init_worker
+_step_queue = None
+_cancel_flags = None
+
+_default_pool: Optional[Dict[str, Any]] = None
+
+
+class _Cancelled:
+    """Returned by a worker whose run was cancelled (None is a valid reduce result)."""
+
+
+def _init_worker(step_queue, cancel_flags) -> None:
+    global _step_queue, _cancel_flags
+    _step_queue, _cancel_flags = step_queue, cancel_flags
+
+
+def _run_in_worker(scenario: Dict[str, Any], slot: int, run_id: int, stream: bool,
+                   reduce: Optional[Callable[[Dict[str, Any]], Any]]) -> Any:
+    """Run one scenario with the cancel / streaming hook; a _Cancelled instance if it was cancelled."""
+    from adm1.coAD import ADM1_coAD
+    user_stop = scenario.get("stop_condition")
+
+    def stop_condition(t, state):
+        if stream:
+            _step_queue.put((run_id, float(t), np.asarray(state, dtype=float)))
+        if _cancel_flags[slot]:
+            return True
+        return bool(user_stop(t, state)) if user_stop is not None else False
+
+    kwargs = dict(scenario, stop_condition=stop_condition)
+    kwargs.setdefault("verbose", False)
+    try:
+        result = ADM1_coAD(**kwargs)
+    finally:
+        if stream:
+            _step_queue.put((run_id, None, None))
+    if _cancel_flags[slot]:
+        return _Cancelled()
+    return result if reduce is None else reduce(result)
+
+
+def new_pool(max_workers: Optional[int] = None, max_pending: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Process pool with backpressure and a step channel for the async API.
+
+    Parameters:
+        max_workers (Optional[int]): Worker processes; one per core if None.
+        max_pending (Optional[int]): Runs submitted at once; 2 * max_workers if None.
+
+    Returns:
+        Dict[str, Any]: Pool state for run_scenario / stream_scenario / shutdown_pool.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    if max_pending < 1:
+        raise ValueError(f"max_pending must be >= 1, got {max_pending}")
+    step_queue = multiprocessing.Queue()
+    cancel_flags = multiprocessing.Array("b", max_pending, lock=False)
+    pool = {
+        "executor": ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                        initargs=(step_queue, cancel_flags)),
+        "max_workers": max_workers,
+        "max_pending": max_pending,
+        "step_queue": step_queue,
+        "cancel_flags": cancel_flags,
+        "free_slots": list(range(max_pending)),
+        "semaphore": None,
+        "streams": {},
+        "ids": itertools.count(),
+    }
+    reader = threading.Thread(target=_read_steps, args=(pool,), daemon=True)
+    reader.start()
+    pool["reader"] = reader
+    return pool
+
+
+def _read_steps(pool: Dict[str, Any]) -> None:
+    """Forward worker step messages to the asyncio queue of their stream."""
+    while True:
+        message = pool["step_queue"].get()
+        if message is None:
+            return
+        target = pool["streams"].get(message[0])
+        if target is not None:
+            loop, queue = target
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message[1:])
+            except RuntimeError:  # the stream's event loop is closed
+                pool["streams"].pop(message[0], None)
+
+
+def shutdown_pool(pool: Dict[str, Any]) -> None:
+    """Stop the workers (running scenarios are told to stop) and the step reader."""
+    global _default_pool
+    for slot in range(pool["max_pending"]):
+        pool["cancel_flags"][slot] = 1
+    pool["executor"].shutdown(wait=True)
+    pool["step_queue"].put(None)
+    pool["reader"].join()
+    if pool is _default_pool:
+        _default_pool = None
+
+
+def _pool(pool: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    global _default_pool
+    if pool is not None:
+        return pool
+    if _default_pool is None:
+        _default_pool = new_pool()
+    return _default_pool
+
+
+async def _submit(pool: Dict[str, Any], scenario: Dict[str, Any], stream: bool,
+                  reduce: Optional[Callable]) -> Dict[str, Any]:
+    """Wait for a free slot and hand the scenario to the pool."""
+    if pool["semaphore"] is None:
+        pool["semaphore"] = asyncio.Semaphore(pool["max_pending"])
+    semaphore = pool["semaphore"]
+    await semaphore.acquire()
+    loop = asyncio.get_running_loop()
+    slot = pool["free_slots"].pop()
+    pool["cancel_flags"][slot] = 0
+    run_id = next(pool["ids"])
+    queue = asyncio.Queue() if stream else None
+    if stream:
+        pool["streams"][run_id] = (loop, queue)
+
+    def release(_future) -> None:
+        # The slot is reused only once the worker has actually stopped. The
+        # stream entry stays: its last steps and end marker may still be in
+        # the step queue, so stream_scenario removes it after reading them.
+        def _release():
+            pool["free_slots"].append(slot)
+            semaphore.release()
+        try:
+            loop.call_soon_threadsafe(_release)
+        except RuntimeError:  # the event loop is already closed
+            pool["free_slots"].append(slot)
+            pool["streams"].pop(run_id, None)
+
+    try:
+        future = pool["executor"].submit(_run_in_worker, scenario, slot, run_id, stream, reduce)
+    except BaseException:
+        pool["free_slots"].append(slot)
+        pool["streams"].pop(run_id, None)
+        semaphore.release()
+        raise
+    future.add_done_callback(release)
+    return {"future": asyncio.wrap_future(future, loop=loop), "slot": slot, "queue": queue, "run_id": run_id}
+
+
+def _cancel(pool: Dict[str, Any], run: Dict[str, Any]) -> None:
+    pool["cancel_flags"][run["slot"]] = 1
+    run["future"].cancel()
+
+
+def _result(run: Dict[str, Any]) -> Any:
+    value = run["future"].result()
+    if isinstance(value, _Cancelled):
+        raise asyncio.CancelledError("Scenario run was cancelled")
+    return value
+
+
+async def run_scenario(scenario: Dict[str, Any], pool: Optional[Dict[str, Any]] = None,
+                       timeout: Optional[float] = None, reduce: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Any:
+    """
+    Run one scenario on the pool without blocking the event loop.
+
+    Parameters:
+        scenario (Dict[str, Any]): ADM1_coAD keyword arguments.
+        pool (Optional[Dict[str, Any]]): new_pool output; the default pool if None.
+        timeout (Optional[float]): Seconds until the run is stopped and asyncio.TimeoutError raised.
+        reduce (Optional[Callable]): Applied in the worker, as in adm1.runner.
+
+    Returns:
+        Any: The ADM1_coAD result dict, or reduce(result).
+    """
+    pool = _pool(pool)
+    run = await _submit(pool, scenario, False, reduce)
+    try:
+        await asyncio.wait_for(asyncio.shield(run["future"]), timeout)
+    except BaseException:
+        _cancel(pool, run)
+        raise
+    return _result(run)
+
+
+async def _next_step(run: Dict[str, Any], timeout: Optional[float]) -> tuple:
+    """
+    Next (t, state) of a streaming run; (None, None) once the worker is done.
+
+    Waits on the run's future as well, so a worker that dies without sending
+    its end marker (BrokenProcessPool) raises instead of hanging.
+    """
+    get = asyncio.ensure_future(run["queue"].get())
+    try:
+        while True:
+            waiting = {get} if run["future"].done() else {get, run["future"]}
+            done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if get in done:
+                return get.result()
+            if not done:
+                raise asyncio.TimeoutError()
+            if run["future"].exception() is not None:
+                raise run["future"].exception()
+            # Finished normally: the remaining steps and the end marker are on their way
+    finally:
+        get.cancel()
+
+
+async def stream_scenario(scenario: Dict[str, Any], pool: Optional[Dict[str, Any]] = None,
+                          timeout: Optional[float] = None,
+                          reduce: Optional[Callable[[Dict[str, Any]], Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run one scenario and yield its output steps as they are computed.
+
+    Yields:
+        Dict[str, Any]: {"t": time [d], "state": 42-vector} per output step;
+        the last item repeats the final step and adds "result".
+    """
+    pool = _pool(pool)
+    run = await _submit(pool, scenario, True, reduce)
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    last = None
+    try:
+        while True:
+            remaining = None if deadline is None else max(deadline - loop.time(), 0.0)
+            t, state = await _next_step(run, remaining)
+            if t is None:
+                break
+            last = {"t": t, "state": state}
+            yield last
+        remaining = None if deadline is None else max(deadline - loop.time(), 0.0)
+        await asyncio.wait_for(asyncio.shield(run["future"]), remaining)
+    except BaseException:
+        _cancel(pool, run)
+        raise
+    finally:
+        pool["streams"].pop(run["run_id"], None)
+    yield dict(last or {"t": 0.0, "state": None}, result=_result(run))
+
+
+async def run_scenarios(scenarios: Sequence[Dict[str, Any]], pool: Optional[Dict[str, Any]] = None,
+                        timeout: Optional[float] = None,
+                        reduce: Optional[Callable[[Dict[str, Any]], Any]] = None) -> List[Any]:
+    """Run many scenarios concurrently (bounded by the pool's max_pending); results in input order."""
+    pool = _pool(pool)
+    return list(await asyncio.gather(*(run_scenario(s, pool, timeout, reduce) for s in scenarios)))
@@ -0,0 +1,216 @@
+"""
+Runtime COD, nitrogen and carbon balances for ADM1_coAD.
+
+For each balance the monitor integrates over the run (vectorized over the
+solver's internal steps of every output step):
+- inventory: V_liq * c.y_liquid + V_gas * c.y_gas, with c the content vector;
+- inflow: V_liq * sum(c * D * y_in) (the mixed influent is constant within a step);
+- outflow: V_liq * sum(c * D * y) (liquid effluent);
+- gas: q_gas * c.y_gas (vented headspace);
+- reaction: c.(S @ rho), the net production by the stoichiometry itself
+  (e.g. COD of h2 transferred to the gas while S_h2 is algebraic, or the
+  reference-carbon corrections of disintegration);
+- algebraic: change of the inventory by the DAESolve overwrite after each
+  step (S_h2) and by re-valuation when a schedule changes the contents.
+The residual inventory - inventory0 - (inflow - outflow - gas + reaction +
+algebraic) is what the integration lost or created; it is divided by the
+larger of the initial inventory and the cumulative inflow.
+
+Contract:
+- ADM1_coAD(..., mass_balance=True or tol) returns result["mass_balance"]
+  = {"table": DataFrame (time, <balance>_<term> columns), "drift": {balance:
+  max relative residual}, "ok": all drifts <= tol, "tol": tol}.
+- content_vectors(params) -> (3, 42) contents of BALANCES per unit state.
+- new_monitor / monitor_segment / monitor_algebraic / monitor_record /
+  monitor_result: the hooks ADM1_coAD calls; usable from other drivers.
+
+Notes:
+- Units: COD [kg COD], N [kmol N], C [kmol C], as the state variables.
+- Terms use the cubic Hermite (corrected trapezoidal) rule over the solver's
+  internal points, with the rate derivatives from the RHS and one directional
+  difference. The residual therefore combines integration error and a small
+  quadrature error; a solver or kernel change that raises the drift is a
+  regression.
+- With solve_ivp's default tolerances (rtol 1e-3) the drift of a typical run
+  is 1e-4 to 2e-3, mostly from the start-up transient; DEFAULT_TOL leaves room
+  for that. Monitoring costs about 1% of the run time.
+- Ion states (S_*_ion, S_nh3, S_nh4_ion, S_co2) are sub-species of S_IC /
+  S_IN and carry no content.
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from adm1.constants import STATE_INDEX, N_STATES, N_INFLUENT
+from adm1.petersen import dilution_rates, process_rates, stoichiometry_matrix
+
+
+BALANCES = ("COD", "N", "C")
+TERMS = ("inventory", "inflow", "outflow", "gas", "reaction", "algebraic", "residual")
+DEFAULT_TOL = 1e-2
+_FLUXES = TERMS[1:-1]
+
+_I = STATE_INDEX
+_GAS = slice(39, 42)
+_BIOMASS = ("X_su", "X_aa", "X_fa", "X_c4", "X_pro", "X_ac", "X_h2")
+
+
+def content_vectors(params: Dict[str, Any]) -> np.ndarray:
+    """COD, N and C content per unit of each state, shape (3, 42)."""
+    p = params
+    W = np.zeros((len(BALANCES), N_STATES))
+    cod, n, c = W
+    for name in ("S_su", "S_aa", "S_fa", "S_va", "S_bu", "S_pro", "S_ac", "S_h2", "S_ch4", "S_I", "X_I",
+                 "S_gas_h2", "S_gas_ch4") + _BIOMASS:
+        cod[_I[name]] = 1.0
+    for k in ("1", "2"):
+        for name in ("X_xc", "X_ch", "X_pr", "X_li"):
+            cod[_I[name + k]] = 1.0
+        n[_I["X_xc" + k]] = p["N_xc"]
+        n[_I["X_pr" + k]] = p["N_aa"]
+        # Particulates are consumed at their reference carbon contents (see carbon_coefficients)
+        c[_I["X_xc" + k]] = p["C_xc_ref"]
+        c[_I["X_ch" + k]] = p["C_ch_ref"]
+        c[_I["X_pr" + k]] = p["C_pr_ref"]
+        c[_I["X_li" + k]] = p["C_li_ref"]
+    n[_I["S_aa"]] = p["N_aa"]
+    n[_I["S_IN"]] = 1.0
+    n[_I["S_I"]] = n[_I["X_I"]] = p["N_I"]
+    for name in _BIOMASS:
+        n[_I[name]] = p["N_bac"]
+        c[_I[name]] = p["C_bac"]
+    for name in ("su", "aa", "fa", "va", "bu", "pro", "ac", "ch4"):
+        c[_I["S_" + name]] = p["C_" + name]
+    c[_I["S_gas_ch4"]] = p["C_ch4"]
+    c[_I["S_IC"]] = c[_I["S_gas_co2"]] = 1.0
+    c[_I["S_I"]] = p["C_sI_ref"]
+    c[_I["X_I"]] = p["C_xI_ref"]
+    return W
+
+
+def _hermite(t: np.ndarray, values: np.ndarray, slopes: np.ndarray) -> np.ndarray:
+    """Integral over the last axis of values with time derivatives slopes, sampled at t (cubic Hermite)."""
+    if len(t) < 2:
+        return np.zeros(values.shape[:-1])
+    h = np.diff(t)
+    return np.sum(0.5 * h * (values[..., 1:] + values[..., :-1])
+                  + h * h / 12.0 * (slopes[..., :-1] - slopes[..., 1:]), axis=-1)
+
+
+def _volume_weights(params: Dict[str, Any]) -> np.ndarray:
+    V = np.full(N_STATES, float(params["V_liq"]))
+    V[_GAS] = params["V_gas"]
+    return V
+
+
+def new_monitor(params: Dict[str, Any], t0: float, y0, tol: float = DEFAULT_TOL) -> Dict[str, Any]:
+    """Monitor state for a run starting at t0 from state y0 (S_H_ion at index 30)."""
+    W = content_vectors(params)
+    V = _volume_weights(params)
+    inventory0 = (W * V) @ np.asarray(y0, dtype=float)
+    monitor = {
+        "tol": float(tol),
+        "inventory0": inventory0,
+        "totals": {term: np.zeros(len(BALANCES)) for term in _FLUXES},
+        "records": [],
+        "params_id": None,
+    }
+    _bind(monitor, params)
+    monitor_record(monitor, t0, y0)
+    return monitor
+
+
+def _bind(monitor: Dict[str, Any], params: Dict[str, Any], y=None) -> None:
+    """(Re)build what depends on the parameter set; flows are read per segment."""
+    if monitor["params_id"] == id(params):
+        return
+    W = content_vectors(params)
+    V = _volume_weights(params)
+    S = stoichiometry_matrix(params)
+    if y is not None:
+        # New contents (e.g. a scheduled mixing_ratio change) re-value the inventory
+        monitor["totals"]["algebraic"] += (W * V - monitor["WV"]) @ y
+    monitor.update(params_id=id(params), W=W, WV=W * V, S=S, reaction=(W * V) @ S.toarray())
+
+
+def _fluxes(monitor: Dict[str, Any], params: Dict[str, Any], Y: np.ndarray, WD: np.ndarray):
+    """Outflow, gas and reaction rates (3 terms, 3 balances, n) and the process rates / gas flow behind them."""
+    rho, q_gas = process_rates(Y, params)
+    rates = np.stack([WD @ Y[:N_INFLUENT], q_gas * (monitor["W"][:, _GAS] @ Y[_GAS]), monitor["reaction"] @ rho])
+    return rates, rho, q_gas
+
+
+def monitor_segment(monitor: Dict[str, Any], params: Dict[str, Any], t, Y, y_in) -> None:
+    """
+    Add the flux integrals of one integrated segment.
+
+    Parameters:
+        t (array): Solver output times (n,).
+        Y (array): States at t, shape (42, n).
+        y_in (array): Mixed influent used for the segment (30,).
+    """
+    t = np.asarray(t, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    _bind(monitor, params, Y[:, 0])
+    y_in = np.asarray(y_in, dtype=float)
+    totals = monitor["totals"]
+    D = dilution_rates(params)[:N_INFLUENT]
+    WD = monitor["W"][:, :N_INFLUENT] * D * params["V_liq"]
+    totals["inflow"] += (WD @ y_in) * (t[-1] - t[0])
+    rates, rho, q_gas = _fluxes(monitor, params, Y, WD)
+    # Time derivatives of the rates along the trajectory: dY from the Petersen RHS, then one
+    # directional difference of the rates (one more vectorized rate evaluation)
+    dY = monitor["S"] @ rho
+    dY[:N_INFLUENT] += D[:, None] * (y_in[:, None] - Y[:N_INFLUENT])
+    dY[_GAS] -= q_gas / params["V_gas"] * Y[_GAS]
+    scale = np.max(np.abs(Y), axis=0) / np.maximum(np.max(np.abs(dY), axis=0), 1e-300)
+    eps = 1e-7 * np.minimum(scale, 1.0)
+    slopes = (_fluxes(monitor, params, Y + eps * dY, WD)[0] - rates) / eps
+    outflow, gas, reaction = _hermite(t, rates, slopes)
+    totals["outflow"] += outflow
+    totals["gas"] += gas
+    totals["reaction"] += reaction
+
+
+def monitor_algebraic(monitor: Dict[str, Any], y_before, y_after) -> None:
+    """Account for the state change made by the algebraic (DAE) update."""
+    monitor["totals"]["algebraic"] += monitor["WV"] @ (np.asarray(y_after, dtype=float)
+                                                       - np.asarray(y_before, dtype=float))
+
+
+def monitor_record(monitor: Dict[str, Any], t: float, y) -> None:
+    """Store inventory, cumulative terms and residual at output time t."""
+    totals = monitor["totals"]
+    inventory = monitor["WV"] @ np.asarray(y, dtype=float)
+    residual = inventory - monitor["inventory0"] - (totals["inflow"] - totals["outflow"] - totals["gas"]
+                                                    + totals["reaction"] + totals["algebraic"])
+    row = {"time": float(t)}
+    for b, balance in enumerate(BALANCES):
+        row[f"{balance}_inventory"] = inventory[b]
+        for term in _FLUXES:
+            row[f"{balance}_{term}"] = totals[term][b]
+        row[f"{balance}_residual"] = residual[b]
+    monitor["records"].append(row)
+
+
+def monitor_result(monitor: Dict[str, Any]) -> Dict[str, Any]:
+    """Table of the recorded balances, maximum relative drift per balance and the ok flag."""
+    import pandas as pd
+    table = pd.DataFrame(monitor["records"])
+    drift = {}
+    for b, balance in enumerate(BALANCES):
+        scale = np.maximum(abs(monitor["inventory0"][b]), table[f"{balance}_inflow"].abs())
+        relative = table[f"{balance}_residual"].abs() / np.where(scale > 0, scale, 1.0)
+        drift[balance] = float(relative.max())
+    return {"table": table, "drift": drift, "ok": all(v <= monitor["tol"] for v in drift.values()),
+            "tol": monitor["tol"]}
+
+
+def check(result: Dict[str, Any], tol: Optional[float] = None) -> bool:
+    """True if a result's mass balances drift by at most tol (default: the run's tolerance)."""
+    balance = result.get("mass_balance")
+    if balance is None:
+        raise ValueError("Result has no mass balance; run ADM1_coAD with mass_balance=True")
+    tol = balance["tol"] if tol is None else tol
+    return all(v <= tol for v in balance["drift"].values())
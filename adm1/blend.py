@@ -0,0 +1,265 @@
+"""
+Feed-blend optimization for ADM1_coAD.
+
+Searches the decision variables (mixing_ratio, mixing_ratio2, OLR) of a base
+scenario for the blend that maximizes an objective from OBJECTIVES, subject
+to process-stability constraints on pH, free-ammonia inhibition (I_nh3) and
+total VFA.
+
+Contract:
+- blend_outputs(result) is the run_scenarios reduce function: objectives,
+  the constraint trajectories and the end state of one run.
+- unstable_state(t, state, ...) is the stop_condition that ends a run as soon
+  as a constraint is violated.
+- evaluate_blends(base_scenario, X, ...) -> DataFrame with one row per
+  candidate: decision variables, objectives, constraint extremes, feasible.
+- optimize_blend(base_scenario, ...) -> {"best", "best_outputs",
+  "evaluations", "scipy"}.
+
+Notes:
+- The search is scipy's differential evolution in vectorized mode: each
+  generation is one run_scenarios call, i.e. evaluated in parallel on the
+  chosen executor.
+- Candidates are snapped to `resolution` (plant-settable steps), so repeated
+  and nearby candidates hit the in-memory memo or the on-disk cache instead
+  of being simulated again.
+- Constraints are checked from t = grace_days on, so the start-up transient
+  from the initial state does not count against a blend. A violation stops
+  the run (stop_condition); the candidate is scored penalty * (2 - reached
+  fraction of the horizon), which keeps the search moving towards blends
+  that stay stable longer.
+- With a warm-start library, initial states are looked up once per
+  candidate from the library as given; converged feasible runs are added
+  back only after the search (update_library=True), so cache keys stay
+  stable during it.
+"""
+
+import functools
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import differential_evolution
+
+from adm1.constants import STATE_INDEX
+from adm1.params import PARAMETER_SETS, select_parameter_set
+from adm1.runner import run_scenarios
+from adm1.warmstart import add_end_state, end_state, is_converged, warm_started
+
+
+DECISION_VARIABLES = ("mixing_ratio", "mixing_ratio2", "OLR")
+DEFAULT_BOUNDS = {"mixing_ratio": (0.1, 0.9), "mixing_ratio2": (0.1, 1.0), "OLR": (1.0, 8.0)}
+DEFAULT_RESOLUTION = {"mixing_ratio": 0.01, "mixing_ratio2": 0.01, "OLR": 0.05}
+OBJECTIVES = ("biomethane_yield", "cumulative_methane_yield", "total_ch4")
+# Stability limits: pH_min [-], I_nh3_min [-] (1 = uninhibited), VFA_max [kg COD/m3]
+DEFAULT_CONSTRAINTS = {"pH_min": 6.5, "I_nh3_min": 0.5, "VFA_max": 3.0}
+
+_VFA_INDICES = tuple(STATE_INDEX[n] for n in ("S_va", "S_bu", "S_pro", "S_ac"))
+
+
+def blend_outputs(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce an ADM1_coAD result to objectives, constraint series and end state."""
+    states = result["simulate_results"]
+    # Row 0 of gasflow/inhibition is a placeholder for t=0
+    return {
+        "biomethane_yield": float(result["biomethane_yield"]),
+        "cumulative_methane_yield": float(result["cumulative_methane_yield"]),
+        "total_ch4": float(result["gasflow"]["total_ch4"].iloc[-1]),
+        "aborted": bool(result.get("aborted")),
+        "time": np.asarray(result["u"], dtype=float)[1:],
+        "pH": states["pH"].to_numpy(dtype=float)[1:],
+        "VFA": (states["S_va"] + states["S_bu"] + states["S_pro"] + states["S_ac"]).to_numpy(dtype=float)[1:],
+        "I_nh3": result["inhibition"]["I_nh3"].to_numpy(dtype=float)[1:],
+        "end_state": end_state(result),
+        "converged": is_converged(result),
+    }
+
+
+def unstable_state(t: float, state: Sequence[float], K_I_nh3: float, pH_min: Optional[float] = None,
+                   I_nh3_min: Optional[float] = None, VFA_max: Optional[float] = None,
+                   grace_days: float = 0.0) -> bool:
+    """stop_condition for ADM1_coAD: True once a stability constraint is violated after grace_days."""
+    S_H_ion = state[30]
+    if not all(math.isfinite(v) for v in state) or S_H_ion <= 0.0:
+        return True
+    if t < grace_days:
+        return False
+    if pH_min is not None and -math.log10(S_H_ion) < pH_min:
+        return True
+    if I_nh3_min is not None and 1.0 / (1.0 + state[STATE_INDEX["S_nh3"]] / K_I_nh3) < I_nh3_min:
+        return True
+    return VFA_max is not None and sum(state[i] for i in _VFA_INDICES) > VFA_max
+
+
+def _constraints(constraints: Optional[Dict[str, Optional[float]]]) -> Dict[str, Optional[float]]:
+    merged = dict(DEFAULT_CONSTRAINTS, **(constraints or {}))
+    unknown = [name for name in merged if name not in DEFAULT_CONSTRAINTS]
+    if unknown:
+        raise ValueError(f"Unknown constraints: {unknown}; expected {list(DEFAULT_CONSTRAINTS)}")
+    return merged
+
+
+def _table(values: Optional[Dict[str, Any]], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(defaults, **(values or {}))
+    unknown = [name for name in merged if name not in DECISION_VARIABLES]
+    if unknown:
+        raise ValueError(f"Not decision variables: {unknown}")
+    return merged
+
+
+def _stop_condition(base_scenario: Dict[str, Any], constraints: Dict[str, Optional[float]],
+                    grace_days: float) -> functools.partial:
+    parameter_set = PARAMETER_SETS[select_parameter_set(base_scenario["T_ad"])]
+    overrides = base_scenario.get("param_overrides") or {}
+    K_I_nh3 = float(overrides.get("K_I_nh3", parameter_set["K_I_nh3"]))
+    return functools.partial(unstable_state, K_I_nh3=K_I_nh3, grace_days=float(grace_days), **constraints)
+
+
+def _summarize(output: Dict[str, Any], days: float, constraints: Dict[str, Optional[float]],
+               grace_days: float) -> Dict[str, Any]:
+    after = output["time"] >= grace_days
+    pH, VFA, I_nh3 = output["pH"][after], output["VFA"][after], output["I_nh3"][after]
+    row = {name: output[name] for name in OBJECTIVES}
+    row.update({
+        "min_pH": float(pH.min()) if len(pH) else math.nan,
+        "min_I_nh3": float(I_nh3.min()) if len(I_nh3) else math.nan,
+        "max_VFA": float(VFA.max()) if len(VFA) else math.nan,
+        "t_end": float(output["time"][-1]) if len(output["time"]) else 0.0,
+    })
+    feasible = not output["aborted"] and row["t_end"] >= days - 1e-9
+    if constraints["pH_min"] is not None:
+        feasible = feasible and row["min_pH"] >= constraints["pH_min"]
+    if constraints["I_nh3_min"] is not None:
+        feasible = feasible and row["min_I_nh3"] >= constraints["I_nh3_min"]
+    if constraints["VFA_max"] is not None:
+        feasible = feasible and row["max_VFA"] <= constraints["VFA_max"]
+    row["feasible"] = bool(feasible)
+    return row
+
+
+def _evaluate(base_scenario: Dict[str, Any], X: np.ndarray, constraints: Dict[str, Optional[float]],
+              grace_days: float, library: Optional[Dict[str, Any]], k: int, run_kwargs: Dict[str, Any],
+              memo: Dict[Tuple[float, ...], Dict[str, Any]],
+              outputs: Optional[Dict[Tuple[float, ...], Dict[str, Any]]] = None) -> pd.DataFrame:
+    base = dict(base_scenario, stop_condition=_stop_condition(base_scenario, constraints, grace_days))
+    points = [tuple(float(v) for v in x) for x in np.atleast_2d(X)]
+    todo = list(dict.fromkeys(p for p in points if p not in memo))
+    scenarios = []
+    for point in todo:
+        scenario = dict(base, **dict(zip(DECISION_VARIABLES, point)))
+        scenarios.append(warm_started(scenario, library, k=k) if library is not None else scenario)
+    executor = run_kwargs.get("executor", "process") if len(scenarios) > 1 else "serial"
+    results = run_scenarios(scenarios, executor=executor, max_workers=run_kwargs.get("max_workers"),
+                            reduce=blend_outputs, cache_dir=run_kwargs.get("cache_dir"))
+    for point, output in zip(todo, results):
+        memo[point] = _summarize(output, float(base["days"]), constraints, grace_days)
+        if outputs is not None:
+            outputs[point] = output
+    return pd.DataFrame([dict(zip(DECISION_VARIABLES, p), **memo[p]) for p in points])
+
+
+def evaluate_blends(base_scenario: Dict[str, Any], X: np.ndarray,
+                    constraints: Optional[Dict[str, Optional[float]]] = None, grace_days: float = 5.0,
+                    library: Optional[Dict[str, Any]] = None, k: int = 1, executor: str = "process",
+                    max_workers: Optional[int] = None, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """
+    Run the base scenario at each candidate blend and check the constraints.
+
+    Parameters:
+        base_scenario (Dict[str, Any]): ADM1_coAD kwargs; decision variables are overwritten.
+        X (np.ndarray): (n, 3) candidates in DECISION_VARIABLES order.
+        constraints (Optional[Dict]): Overrides of DEFAULT_CONSTRAINTS; None disables one.
+        grace_days (float): Constraints apply from this time on.
+        library (Optional[Dict]): Warm-start library for initial states.
+        executor, max_workers, cache_dir: Passed to run_scenarios.
+
+    Returns:
+        pd.DataFrame: One row per candidate.
+    """
+    run_kwargs = dict(executor=executor, max_workers=max_workers, cache_dir=cache_dir)
+    return _evaluate(base_scenario, X, _constraints(constraints), grace_days, library, k, run_kwargs, {})
+
+
+def optimize_blend(base_scenario: Dict[str, Any], objective: str = "biomethane_yield",
+                   bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                   constraints: Optional[Dict[str, Optional[float]]] = None, grace_days: float = 5.0,
+                   resolution: Optional[Dict[str, float]] = None, popsize: int = 8, maxiter: int = 20,
+                   tol: float = 0.01, seed: Optional[int] = None, library: Optional[Dict[str, Any]] = None,
+                   k: int = 1, update_library: bool = False, penalty: float = 1e6,
+                   executor: str = "process", max_workers: Optional[int] = None,
+                   cache_dir: Optional[str] = None, verbose: bool = False) -> Dict[str, Any]:
+    """
+    Maximize `objective` over the feed blend under the stability constraints.
+
+    Parameters:
+        base_scenario (Dict[str, Any]): ADM1_coAD kwargs of the reference operation.
+        objective (str): One of OBJECTIVES.
+        bounds (Optional[Dict]): (low, high) per decision variable, DEFAULT_BOUNDS otherwise.
+        constraints (Optional[Dict]): Overrides of DEFAULT_CONSTRAINTS; None disables one.
+        grace_days (float): Constraints apply from this time on.
+        resolution (Optional[Dict]): Step per decision variable candidates are snapped to.
+        popsize, maxiter, tol, seed: Differential-evolution settings (popsize is
+            per decision variable, as in scipy).
+        library (Optional[Dict]): Warm-start library; with update_library=True the
+            converged feasible runs are added to it after the search.
+        penalty (float): Score scale of infeasible candidates.
+        executor, max_workers, cache_dir: Passed to run_scenarios.
+
+    Returns:
+        Dict[str, Any]: {"best": decision values, "best_outputs": row of the best
+        feasible candidate (None if none was feasible), "evaluations": all
+        evaluated candidates, "scipy": OptimizeResult}.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective!r}; expected one of {OBJECTIVES}")
+    bounds = _table(bounds, DEFAULT_BOUNDS)
+    resolution = _table(resolution, DEFAULT_RESOLUTION)
+    box = np.array([bounds[name] for name in DECISION_VARIABLES], dtype=float)
+    if np.any(box[:, 1] <= box[:, 0]):
+        raise ValueError("Each decision variable needs low < high")
+    step = np.array([resolution[name] for name in DECISION_VARIABLES], dtype=float)
+    days = float(base_scenario["days"])
+    memo: Dict[Tuple[float, ...], Dict[str, Any]] = {}
+    outputs: Dict[Tuple[float, ...], Dict[str, Any]] = {}
+    constraints = _constraints(constraints)
+    run_kwargs = dict(executor=executor, max_workers=max_workers, cache_dir=cache_dir)
+
+    def _snap(X: np.ndarray) -> np.ndarray:
+        snapped = np.round(X / step) * step
+        return np.round(np.clip(snapped, box[:, 0], box[:, 1]), 10)
+
+    def _score(X: np.ndarray) -> np.ndarray:
+        # Vectorized differential evolution passes candidates as columns
+        rows = _evaluate(base_scenario, _snap(np.asarray(X, dtype=float).T), constraints, grace_days,
+                         library, k, run_kwargs, memo, outputs if update_library else None)
+        reached = np.clip(rows["t_end"].to_numpy(dtype=float) / days, 0.0, 1.0)
+        score = np.where(rows["feasible"], -rows[objective].to_numpy(dtype=float), penalty * (2.0 - reached))
+        if verbose:
+            feasible = rows[rows["feasible"]]
+            best = feasible[objective].max() if len(feasible) else math.nan
+            print(f"blend: {len(rows)} candidates, {len(feasible)} feasible, best {objective} {best:.4g}")
+        return score
+
+    res = differential_evolution(_score, box, popsize=popsize, maxiter=maxiter, tol=tol, seed=seed,
+                                 vectorized=True, updating="deferred", polish=False, init="latinhypercube")
+
+    evaluations = pd.DataFrame([dict(zip(DECISION_VARIABLES, p), **row) for p, row in memo.items()])
+    feasible = evaluations[evaluations["feasible"]]
+    best_outputs = None
+    best = dict(zip(DECISION_VARIABLES, _snap(res.x[None, :])[0].tolist()))
+    if len(feasible):
+        best_outputs = feasible.loc[feasible[objective].idxmax()]
+        best = {name: float(best_outputs[name]) for name in DECISION_VARIABLES}
+
+    if library is not None and update_library:
+        stored: List[Tuple[float, ...]] = []
+        for point, output in outputs.items():
+            if memo[point]["feasible"] and output["converged"]:
+                scenario = dict(base_scenario, **dict(zip(DECISION_VARIABLES, point)))
+                add_end_state(library, scenario, output["end_state"], days)
+                stored.append(point)
+        if verbose:
+            print(f"blend: {len(stored)} converged runs added to the warm-start library")
+
+    return {"best": best, "best_outputs": best_outputs, "evaluations": evaluations, "scipy": res}
@@ -0,0 +1,399 @@
+"""
+Batch (BMP) engine: closed bottles, many substrates at once.
+
+Batch_process=True in ADM1_coAD emulates a bottle with q_in = 1e-10 and
+runs the continuous machinery (recycle mixing, feed compartments, flow
+terms). simulate_bmp instead advances all bottles together as one (43, N)
+batch through the Petersen stoichiometry with no dilution terms: rows 0..41
+are the ADM1 states, row 42 the methane transferred to the headspace so
+far. The charge balance is solved inside the RHS (vectorized DAESolve), so
+whole days are integrated per solver call with a block-sparse BDF
+Jacobian.
+
+Contract:
+- A bottle is a dict with "substrate" (feed composition, *_in names as in
+  get_influent), "fraction" (substrate share of the bottle liquid, 0..1),
+  optionally "name", "inoculum" (state dict as get_initial_state; default
+  get_initial_state(mixing_ratio)) and "VS_added" [kg VS / m3 liquid]
+  (default from get_VSS).
+- simulate_bmp(bottles, ...) -> {"time" (T,) [d], "names", "V_ch4" (T, N)
+  cumulative methane [Nm3 per m3 bottle liquid], "specific" (T, N)
+  [Nm3 CH4 / kg VS added], "VS_added" (N,), "days" (N,) day each bottle
+  reached its plateau (NaN if it did not), "pH" and "VFA" (N,) at the end}.
+  With blank=True an inoculum-only bottle is appended and "net" /
+  "net_specific" are blank-corrected (blank scaled by the inoculum share
+  1 - fraction).
+- fit_first_order(t, B) and fit_gompertz(t, B) fit B of shape (N, T)
+  (NaN = missing) for all bottles at once; algebraic_batch(Y, params) is
+  the vectorized DAE step.
+
+Notes:
+- Methane is counted when it leaves the liquid (transfer_ch4), at
+  273.15 K and 1.01325 bar, so the yield does not depend on the headspace
+  volume or k_p.
+- Plateau: a bottle stops once its daily methane increment stays below
+  plateau * cumulative methane (VDI 4630: 1 %) for plateau_days days in a
+  row; stopped bottles leave the batch and their curves stay flat. The
+  inoculum's own decay counts, as it does in a real bottle.
+- First-order: B(t) = B0 (1 - exp(-k t)); modified Gompertz:
+  B(t) = P exp(-exp(Rm e (lam - t) / P + 1)) with lam >= 0. Both are fitted
+  by a batched Levenberg-Marquardt iteration with analytic Jacobians.
+"""
+
+import math
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+from scipy.integrate import solve_ivp
+
+from adm1.constants import STATE_NAMES, STATE_INDEX, N_STATES, INFLUENT_NAMES, N_INFLUENT
+from adm1.influent import influent_array
+from adm1.initial_state import get_initial_state
+from adm1.params import PARAMETER_SETS, get_adm1_params, get_VSS, select_parameter_set
+from adm1.petersen import PROCESS_INDEX, build_petersen, process_rates
+
+
+DEFAULT_PLATEAU = 0.01
+DEFAULT_PLATEAU_DAYS = 3
+VFA_STATES = ("S_va", "S_bu", "S_pro", "S_ac")
+ACID_BASE_STATES = VFA_STATES + ("S_IC", "S_IN", "S_cation", "S_anion")
+
+_I = STATE_INDEX
+_V_CH4 = N_STATES
+
+
+def bmp_params(T_ad: float = 308.15, T_base: float = 298.15, mixing_ratio: float = 0.5,
+               param_overrides: Optional[Dict[str, Any]] = None, V_liq: float = 1000.0) -> Dict[str, Any]:
+    """Parameter dict of a closed bottle (all flows zero)."""
+    params = get_adm1_params(T_ad, T_base, PARAMETER_SETS[select_parameter_set(T_ad)], mixing_ratio)
+    if param_overrides:
+        params.update(param_overrides)
+    params.update({"q_in": 0.0, "q_in1": 0.0, "q_in2": 0.0, "q_ad": 0.0, "q_out": 0.0, "q_r": 0.0,
+                   "V_liq": V_liq, "V_gas": 0.1 * V_liq, "V_ad": 1.1 * V_liq, "mixing_ratio": mixing_ratio})
+    return params
+
+
+def _bottle_state(bottle: Dict[str, Any], inoculum: Dict[str, float]) -> np.ndarray:
+    """Bottle liquid: inoculum mixed with the substrate share of the volume."""
+    f = float(bottle.get("fraction", 0.0))
+    if not 0 <= f <= 1:
+        raise ValueError(f"Bottle fraction must be in [0, 1], got {f}")
+    inoc = bottle.get("inoculum", inoculum)
+    inoc = dict(inoc, S_H_ion=inoc.get("S_H_ion", 10 ** -float(inoc.get("pH", 7.0))))
+    y = np.array([float(inoc[name]) for name in STATE_NAMES])
+    substrate = bottle.get("substrate", {})
+    unknown = [k for k in substrate if k not in INFLUENT_NAMES and k not in ("S_co2_in", "S_nh3_in")]
+    if unknown:
+        raise ValueError(f"Unknown substrate components: {unknown}")
+    sub = influent_array(substrate)
+    y[:N_INFLUENT] = (1 - f) * y[:N_INFLUENT] + f * sub
+    return y
+
+
+def _ions(Y: np.ndarray, params: Dict[str, Any], H: np.ndarray, tol: float = 1e-12,
+          max_iter: int = 100) -> np.ndarray:
+    """Charge balance of a (42, N) batch solved for S_H_ion by Newton iterations started at H."""
+    p = params
+    S_va, S_bu, S_pro, S_ac = Y[_I["S_va"]], Y[_I["S_bu"]], Y[_I["S_pro"]], Y[_I["S_ac"]]
+    S_IC, S_IN, S_cation, S_anion = Y[_I["S_IC"]], Y[_I["S_IN"]], Y[_I["S_cation"]], Y[_I["S_anion"]]
+    K_a_va, K_a_bu, K_a_pro, K_a_ac = p["K_a_va"], p["K_a_bu"], p["K_a_pro"], p["K_a_ac"]
+    K_a_co2, K_a_IN, K_w = p["K_a_co2"], p["K_a_IN"], p["K_w"]
+    for _ in range(max_iter):
+        delta = (S_cation + S_IN * H / (K_a_IN + H) + H - K_a_co2 * S_IC / (K_a_co2 + H)
+                 - K_a_ac * S_ac / (64 * (K_a_ac + H)) - K_a_pro * S_pro / (112 * (K_a_pro + H))
+                 - K_a_bu * S_bu / (160 * (K_a_bu + H)) - K_a_va * S_va / (208 * (K_a_va + H)) - K_w / H - S_anion)
+        grad = (1 + K_a_IN * S_IN / (K_a_IN + H) ** 2 + K_a_co2 * S_IC / (K_a_co2 + H) ** 2
+                + K_a_ac * S_ac / (64 * (K_a_ac + H) ** 2) + K_a_pro * S_pro / (112 * (K_a_pro + H) ** 2)
+                + K_a_bu * S_bu / (160 * (K_a_bu + H) ** 2) + K_a_va * S_va / (208 * (K_a_va + H) ** 2)
+                + K_w / H ** 2)
+        H = np.maximum(H - delta / grad, tol)
+        if np.max(np.abs(delta)) <= tol:
+            break
+    return H
+
+
+def _set_ions(Y: np.ndarray, params: Dict[str, Any], H: np.ndarray) -> None:
+    """Write S_H_ion and the dissociated species for the given S_H_ion into Y."""
+    Y[_I["S_H_ion"]] = H
+    for name, acid, total in (("S_va_ion", "va", "S_va"), ("S_bu_ion", "bu", "S_bu"), ("S_pro_ion", "pro", "S_pro"),
+                              ("S_ac_ion", "ac", "S_ac"), ("S_hco3_ion", "co2", "S_IC"), ("S_nh3", "IN", "S_IN")):
+        K = params["K_a_" + acid]
+        Y[_I[name]] = K * Y[_I[total]] / (K + H)
+    Y[_I["S_nh4_ion"]] = Y[_I["S_IN"]] - Y[_I["S_nh3"]]
+    Y[_I["S_co2"]] = Y[_I["S_IC"]] - Y[_I["S_hco3_ion"]]
+
+
+def algebraic_batch(Y: np.ndarray, params: Dict[str, Any], tol: float = 1e-12, max_iter: int = 100) -> np.ndarray:
+    """
+    DAESolve for a (42, N) batch of closed bottles (no flow terms).
+
+    Solves the charge balance for S_H_ion and the S_h2 balance by Newton
+    iterations on all columns at once, then rebuilds the ion states,
+    S_nh4_ion and S_co2.
+    """
+    p = params
+    Y = np.array(Y, dtype=float)
+    H = _ions(Y, p, Y[_I["S_H_ion"]].copy(), tol, max_iter)
+    S_va, S_bu = Y[_I["S_va"]], Y[_I["S_bu"]]
+
+    # S_h2 balance: production by uptake minus uptake by X_h2 and gas transfer
+    def _monod(k_m, K_S, S_, X):
+        return k_m * (S_ / (K_S + S_ + 1e-12)) * X
+
+    production = ((1 - p["Y_su"]) * p["f_h2_su"] * _monod(p["k_m_su"], p["K_S_su"], Y[_I["S_su"]], Y[_I["X_su"]])
+                  + (1 - p["Y_aa"]) * p["f_h2_aa"] * _monod(p["k_m_aa"], p["K_S_aa"], Y[_I["S_aa"]], Y[_I["X_aa"]])
+                  + (1 - p["Y_fa"]) * 0.3 * _monod(p["k_m_fa"], p["K_S_fa"], Y[_I["S_fa"]], Y[_I["X_fa"]])
+                  + (1 - p["Y_c4"]) * 0.15 * _monod(p["k_m_c4"], p["K_S_c4"], S_va, Y[_I["X_c4"]])
+                  * (S_va / (S_bu + S_va + 1e-6))
+                  + (1 - p["Y_c4"]) * 0.2 * _monod(p["k_m_c4"], p["K_S_c4"], S_bu, Y[_I["X_c4"]])
+                  * (S_bu / (S_bu + S_va + 1e-6))
+                  + (1 - p["Y_pro"]) * 0.43 * _monod(p["k_m_pro"], p["K_S_pro"], Y[_I["S_pro"]], Y[_I["X_pro"]]))
+    p_gas_h2 = Y[_I["S_gas_h2"]] * p["R"] * p["T_ad"] / 16
+    X_h2, k_m_h2, K_S_h2, k_L_a = Y[_I["X_h2"]], p["k_m_h2"], p["K_S_h2"], p["k_L_a"]
+    S_h2 = Y[_I["S_h2"]].copy()
+    for _ in range(max_iter):
+        residual = (production - _monod(k_m_h2, K_S_h2, S_h2, X_h2)
+                    - k_L_a * (S_h2 - 16 * p["K_H_h2"] * p_gas_h2))
+        slope = -k_m_h2 * X_h2 * (K_S_h2 + 1e-12) / (K_S_h2 + S_h2 + 1e-12) ** 2 - k_L_a
+        S_h2 = np.maximum(S_h2 - residual / slope, tol)
+        if np.max(np.abs(residual)) <= tol:
+            break
+
+    Y[_I["S_h2"]] = S_h2
+    _set_ions(Y, p, H)
+    return Y
+
+
+def _batch_sparsity(model: Dict[str, Any], n: int) -> sparse.csr_matrix:
+    """Jacobian pattern of the raveled (43, n) batch: per-bottle pattern, methane row, no coupling."""
+    pattern = np.zeros((N_STATES + 1, N_STATES + 1))
+    pattern[:N_STATES, :N_STATES] = model["jac_sparsity"].toarray()
+    pattern[_V_CH4, :N_STATES] = pattern[_I["S_gas_ch4"], :N_STATES]
+    # The charge balance inside the RHS couples all acid-base totals to every rate
+    pattern[:, [_I[name] for name in ACID_BASE_STATES]] = 1.0
+    return sparse.kron(sparse.csr_matrix(pattern), sparse.identity(n), format="csr")
+
+
+def simulate_bmp(bottles: Sequence[Dict[str, Any]], max_days: float = 60.0, plateau: float = DEFAULT_PLATEAU,
+                 plateau_days: int = DEFAULT_PLATEAU_DAYS, blank: bool = False, T_ad: float = 308.15,
+                 T_base: float = 298.15, mixing_ratio: float = 0.5, param_overrides: Optional[Dict[str, Any]] = None,
+                 V_liq: float = 1000.0, solvermethod: str = "BDF", rtol: float = 1e-4,
+                 atol: float = 1e-8) -> Dict[str, Any]:
+    """
+    Simulate BMP bottles together until each reaches its methane plateau.
+
+    Parameters:
+        bottles (Sequence[Dict[str, Any]]): Bottle dicts (see module docstring).
+        max_days (float): Upper limit of the test duration [d].
+        plateau (float): Daily increment threshold relative to the cumulative methane.
+        plateau_days (int): Consecutive days below the threshold that end a bottle.
+        blank (bool): Add an inoculum-only bottle and blank-correct.
+        T_ad, T_base, mixing_ratio, param_overrides: Parameter set (see bmp_params).
+        V_liq (float): Simulated liquid volume [m3].
+        solvermethod, rtol, atol: solve_ivp settings.
+
+    Returns:
+        Dict[str, Any]: See the module docstring.
+    """
+    if not bottles:
+        raise ValueError("No bottles")
+    if plateau_days < 1:
+        raise ValueError(f"plateau_days must be >= 1, got {plateau_days}")
+    params = bmp_params(T_ad, T_base, mixing_ratio, param_overrides, V_liq)
+    model = build_petersen(params)
+    S, V_gas = model["S"], model["V_gas"]
+    # Methane transferred to the headspace, kg COD -> m3 at 273.15 K and 1.01325 bar
+    normal_m3 = params["R"] * 273.15 / (64 * 1.01325)
+    inoculum = get_initial_state(mixing_ratio)
+
+    bottles = list(bottles)
+    if blank:
+        bottles.append({"name": "blank", "fraction": 0.0, "substrate": {}})
+    names = [str(b.get("name", i)) for i, b in enumerate(bottles)]
+    Y0 = np.column_stack([_bottle_state(b, inoculum) for b in bottles])
+    vs_added = np.array([float(b["VS_added"]) if "VS_added" in b
+                         else 1000.0 * get_VSS(b.get("substrate", {}), float(b.get("fraction", 0.0)))
+                         for b in bottles])
+
+    N = len(bottles)
+    n_days = int(math.ceil(max_days))
+    V = np.full((n_days + 1, N), np.nan)
+    V[0] = 0.0
+    days = np.full(N, np.nan)
+    Y_end = np.empty((N_STATES, N))
+    Z = np.vstack([algebraic_batch(Y0, params), np.zeros((1, N))])
+    active = np.arange(N)
+    below = np.zeros(N, dtype=int)
+    day = 0
+    for day in range(1, n_days + 1):
+        n = len(active)
+        H = Z[_I["S_H_ion"]].copy()
+
+        def rhs(_t, z):
+            z = z.reshape(N_STATES + 1, n)
+            y = z[:N_STATES].copy()
+            # pH follows the acid-base totals within the day
+            H[:] = _ions(y, params, H.copy())
+            _set_ions(y, params, H)
+            rho, q_gas = process_rates(y, params)
+            dz = np.zeros_like(z)
+            dz[:N_STATES] = S @ rho
+            dz[39:42] -= q_gas / V_gas * y[39:42]
+            dz[_V_CH4] = rho[PROCESS_INDEX["transfer_ch4"]] * normal_m3
+            return dz.ravel()
+
+        options = {"jac_sparsity": _batch_sparsity(model, n)} if solvermethod in ("BDF", "Radau") else {}
+        sol = solve_ivp(rhs, (0.0, 1.0), Z.ravel(), method=solvermethod, rtol=rtol, atol=atol, **options)
+        if not sol.success:
+            raise RuntimeError(f"BMP integration failed on day {day}: {sol.message}")
+        Z = sol.y[:, -1].reshape(N_STATES + 1, n)
+        Z[:N_STATES] = algebraic_batch(Z[:N_STATES], params)
+        V[day, active] = Z[_V_CH4]
+
+        # Plateau test on the daily increment; finished bottles leave the batch
+        increment = V[day, active] - V[day - 1, active]
+        below[active] = np.where(increment < plateau * V[day, active], below[active] + 1, 0)
+        done = below[active] >= plateau_days
+        if np.any(done):
+            days[active[done]] = day
+            Y_end[:, active[done]] = Z[:N_STATES, done]
+            Z = Z[:, ~done]
+            active = active[~done]
+        if len(active) == 0:
+            break
+    Y_end[:, active] = Z[:N_STATES]
+
+    V = V[:day + 1]
+    # Curves stay flat after a bottle's plateau
+    for j in range(N):
+        last = int(np.max(np.nonzero(~np.isnan(V[:, j]))[0]))
+        V[last + 1:, j] = V[last, j]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        specific = np.where(vs_added > 0, V / vs_added, np.nan)
+    result = {
+        "time": np.arange(day + 1, dtype=float),
+        "names": names,
+        "V_ch4": V,
+        "specific": specific,
+        "VS_added": vs_added,
+        "days": days,
+        "pH": -np.log10(Y_end[_I["S_H_ion"]]),
+        "VFA": Y_end[[_I[n] for n in VFA_STATES]].sum(axis=0),
+    }
+    if blank:
+        fractions = np.array([float(b.get("fraction", 0.0)) for b in bottles])
+        net = V - V[:, -1:] * (1 - fractions)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result["net"] = net
+            result["net_specific"] = np.where(vs_added > 0, net / vs_added, np.nan)
+    return result
+
+
+def _levenberg_marquardt(model, t: np.ndarray, B: np.ndarray, p0: np.ndarray, lower: np.ndarray,
+                         max_iter: int = 200, tol: float = 1e-10) -> np.ndarray:
+    """Batched LM: minimize sum over valid t of (B - f(t, p))^2 for every row of B, with p >= lower."""
+    mask = ~np.isnan(B)
+    Bz = np.where(mask, B, 0.0)
+    p = p0.copy()
+    mu = np.full(len(p), 1e-3)
+
+    def cost(params):
+        f, _ = model(t, params)
+        return np.sum(np.where(mask, Bz - f, 0.0) ** 2, axis=1)
+
+    c = cost(p)
+    for _ in range(max_iter):
+        f, J = model(t, p)
+        r = np.where(mask, Bz - f, 0.0)
+        J = J * mask[:, :, None]
+        A = np.einsum("ntp,ntq->npq", J, J)
+        g = np.einsum("ntp,nt->np", J, r)
+        diag = np.einsum("npp->np", A)
+        damped = A + (mu[:, None] * (diag + 1e-12))[:, :, None] * np.eye(p.shape[1])
+        step = np.linalg.solve(damped, g[:, :, None])[:, :, 0]
+        trial = np.maximum(p + step, lower)
+        valid = np.all(np.isfinite(trial), axis=1)
+        c_trial = np.where(valid, cost(np.where(valid[:, None], trial, p)), np.inf)
+        better = c_trial < c
+        p = np.where(better[:, None], trial, p)
+        converged = better & (c - c_trial <= tol * np.maximum(c, 1e-300))
+        c = np.where(better, c_trial, c)
+        mu = np.where(better, mu * 0.3, mu * 10)
+        if np.all(converged | (mu > 1e12)):
+            break
+    return p
+
+
+def _r2(t: np.ndarray, B: np.ndarray, f: np.ndarray) -> np.ndarray:
+    mask = ~np.isnan(B)
+    mean = np.nanmean(B, axis=1, keepdims=True)
+    ss_res = np.sum(np.where(mask, B - f, 0.0) ** 2, axis=1)
+    ss_tot = np.sum(np.where(mask, B - mean, 0.0) ** 2, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - ss_res / ss_tot
+
+
+def _first_order(t, p):
+    B0, k = p[:, :1], p[:, 1:2]
+    e = np.exp(-k * t)
+    J = np.stack([1 - e, B0 * t * e], axis=2)
+    return B0 * (1 - e), J
+
+
+def _gompertz(t, p):
+    P, Rm, lam = p[:, :1], p[:, 1:2], p[:, 2:3]
+    # Steep trial curves (large Rm / lam during the LM search) push z far up;
+    # beyond 700 exp(z) overflows while G and G * E are already exactly 0
+    z = np.minimum(Rm * math.e * (lam - t) / P + 1, 700.0)
+    G = np.exp(-np.exp(z))
+    GE = np.exp(z - np.exp(z))  # G * E without the inf * 0
+    J = np.stack([G + GE * (z - 1), -GE * math.e * (lam - t), -GE * Rm * math.e], axis=2)
+    return P * G, J
+
+
+def _prepare(t, B):
+    t = np.asarray(t, dtype=float)
+    B = np.atleast_2d(np.asarray(B, dtype=float))
+    if B.shape[1] != t.shape[0]:
+        raise ValueError(f"B must have shape (N, {t.shape[0]}), got {B.shape}")
+    return t, B
+
+
+def fit_first_order(t: Sequence[float], B: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Fit B(t) = B0 (1 - exp(-k t)) to every row of B (N, T); NaN entries are ignored.
+
+    Returns:
+        Dict[str, np.ndarray]: "B0", "k" [1/d] and "r2", each of shape (N,).
+    """
+    t, B = _prepare(t, B)
+    B0 = np.nanmax(B, axis=1)
+    # Initial rate constant from the time to 63 % of the final value
+    reached = np.where(np.isnan(B), False, B >= 0.632 * B0[:, None])
+    t63 = np.where(reached.any(axis=1), t[np.argmax(reached, axis=1)], t[-1])
+    p = _levenberg_marquardt(_first_order, t, B, np.column_stack([B0, 1 / np.maximum(t63, 1e-3)]),
+                             np.array([1e-12, 1e-12]))
+    f, _ = _first_order(t, p)
+    return {"B0": p[:, 0], "k": p[:, 1], "r2": _r2(t, B, f)}
+
+
+def fit_gompertz(t: Sequence[float], B: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Fit the modified Gompertz curve to every row of B (N, T); NaN entries are ignored.
+
+    Returns:
+        Dict[str, np.ndarray]: "P" (plateau), "Rm" (maximum rate per day),
+        "lam" (lag phase [d]) and "r2", each of shape (N,).
+    """
+    t, B = _prepare(t, B)
+    P = np.nanmax(B, axis=1)
+    slopes = np.diff(np.where(np.isnan(B), np.nan, B), axis=1) / np.diff(t)
+    i = np.nanargmax(np.where(np.isnan(slopes), -np.inf, slopes), axis=1)
+    rows = np.arange(len(B))
+    Rm = np.maximum(slopes[rows, i], 1e-12)
+    # Lag: where the tangent at the steepest point crosses zero
+    lam = np.maximum(t[i] - np.nan_to_num(B[rows, i]) / Rm, 0.0)
+    p = _levenberg_marquardt(_gompertz, t, B, np.column_stack([P, Rm, lam]), np.array([1e-12, 1e-12, 0.0]))
+    f, _ = _gompertz(t, p)
+    return {"P": p[:, 0], "Rm": p[:, 1], "lam": p[:, 2], "r2": _r2(t, B, f)}
@@ -0,0 +1,281 @@
+"""
+Calibration of ADM1_coAD parameters against measured plant series.
+
+Measured data (CSV with a time column in days) are compared with the model
+observables in OBSERVABLES; a chosen subset of parameters is fitted by
+bounded least squares (scipy.optimize.least_squares, method "trf").
+
+Contract:
+- load_measurements(path, time_column="time", column_map=None) -> DataFrame
+  indexed by time with observable columns.
+- model_observables(result) -> DataFrame of OBSERVABLES over result['u'].
+- calibrate(base_scenario, measurements, names, ...) -> dict with the fitted
+  param_overrides, the scipy result and the evaluation history.
+
+Notes:
+- Parameters are optimised on the unit box, p = low + z * (high - low), so
+  parameters of very different magnitude are stepped alike.
+- The finite-difference Jacobian evaluates all perturbed parameter sets in
+  one run_scenarios call, i.e. in parallel on the chosen executor.
+- jac="forward" replaces the k + 1 finite-difference runs by one run with
+  forward sensitivities (ADM1_coAD(..., sensitivities=names)).
+- Every model run stops early (stop_condition) once the state leaves the
+  feasible region (non-finite values or pH outside feasible_pH); such runs
+  get a large constant residual instead of being simulated to the end.
+- With a warm-start library the initial state is looked up once and kept
+  fixed for all iterations, so the objective stays a deterministic function
+  of the parameters.
+"""
+
+import functools
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+
+from adm1.constants import STATE_INDEX
+from adm1.params import PARAMETER_SETS, select_parameter_set, get_adm1_params
+from adm1.runner import run_scenarios
+from adm1.warmstart import warm_started
+
+
+# Observable name -> how it is derived from an ADM1_coAD result
+OBSERVABLES = {
+    "q_ch4": "gasflow q_ch4 [m3/d]",
+    "ch4_fraction": "gasflow p_gas_ch4/p_gas [-]",
+    "co2_fraction": "gasflow p_gas_co2/p_gas [-]",
+    "pH": "simulate_results pH [-]",
+    "VFA": "S_va + S_bu + S_pro + S_ac [kg COD/m3]",
+}
+
+
+def load_measurements(path: str, time_column: str = "time",
+                      column_map: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Read measured series from a local CSV.
+
+    Parameters:
+        path (str): CSV file.
+        time_column (str): Column with the time since start of the run [d].
+        column_map (Optional[Dict[str, str]]): CSV column -> observable name,
+            for columns not already named as in OBSERVABLES.
+
+    Returns:
+        pd.DataFrame: Observable columns indexed by time (other columns dropped).
+    """
+    data = pd.read_csv(path)
+    if time_column not in data.columns:
+        raise ValueError(f"Time column {time_column!r} not found in {path}")
+    data = data.rename(columns=column_map or {}).set_index(time_column).sort_index()
+    data.index.name = "time"
+    observed = [c for c in data.columns if c in OBSERVABLES]
+    if not observed:
+        raise ValueError(f"No observable columns in {path}; expected some of {list(OBSERVABLES)}")
+    return data[observed].astype(float)
+
+
+def model_observables(result: Dict[str, Any]) -> pd.DataFrame:
+    """Observable series of an ADM1_coAD result (the t=0 placeholder row is dropped)."""
+    states = result["simulate_results"]
+    gas = result["gasflow"]
+    frame = pd.DataFrame({
+        "time": np.asarray(result["u"], dtype=float),
+        "q_ch4": gas["q_ch4"].to_numpy(dtype=float),
+        "ch4_fraction": gas["p_gas_ch4/p_gas"].to_numpy(dtype=float),
+        "co2_fraction": gas["p_gas_co2/p_gas"].to_numpy(dtype=float),
+        "pH": states["pH"].to_numpy(dtype=float),
+        "VFA": (states["S_va"] + states["S_bu"] + states["S_pro"] + states["S_ac"]).to_numpy(dtype=float),
+    })
+    return frame.iloc[1:].reset_index(drop=True)
+
+
+def infeasible_state(t: float, state: Sequence[float], pH_min: float = 4.0, pH_max: float = 10.0) -> bool:
+    """stop_condition for ADM1_coAD: non-finite or negative-proton state, or pH out of range."""
+    S_H_ion = state[30]
+    if not all(math.isfinite(v) for v in state) or S_H_ion <= 0.0:
+        return True
+    pH = -math.log10(S_H_ion)
+    return pH < pH_min or pH > pH_max
+
+
+def observable_gradients(result: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    d(observable)/dp rows aligned with model_observables, from a run with
+    ADM1_coAD(..., sensitivities=names). Each entry has shape (len(u) - 1, k).
+    """
+    sens = result["sensitivities"]
+    traj = sens["trajectory"][1:]
+    states = result["simulate_results"].iloc[1:]
+    gas = result["gasflow"].iloc[1:]
+    # Partial pressures are linear in the gas states, p_i = c_i * S_gas_i
+    dp = {}
+    for g in ("h2", "ch4", "co2"):
+        y = states[f"S_gas_{g}"].to_numpy(dtype=float)
+        p_i = gas[f"p_gas_{g}"].to_numpy(dtype=float)
+        c = np.divide(p_i, y, out=np.zeros_like(y), where=y != 0)
+        dp[g] = c[:, None] * traj[:, STATE_INDEX[f"S_gas_{g}"], :]
+    p_gas = gas["p_gas"].to_numpy(dtype=float)[:, None]
+    dp_gas = dp["h2"] + dp["ch4"] + dp["co2"]
+
+    def _fraction(g: str) -> np.ndarray:
+        return (dp[g] - gas[f"p_gas_{g}"].to_numpy(dtype=float)[:, None] / p_gas * dp_gas) / p_gas
+
+    return {
+        "q_ch4": sens["q_ch4"].to_numpy()[1:],
+        "ch4_fraction": _fraction("ch4"),
+        "co2_fraction": _fraction("co2"),
+        "pH": sens["pH"].to_numpy()[1:],
+        "VFA": sum(traj[:, STATE_INDEX[n], :] for n in ("S_va", "S_bu", "S_pro", "S_ac")),
+    }
+
+
+def _observables_or_aborted(result: Dict[str, Any]) -> Optional[Tuple[pd.DataFrame, Any]]:
+    if result.get("aborted"):
+        return None
+    grads = observable_gradients(result) if result.get("sensitivities") else None
+    return model_observables(result), grads
+
+
+def nominal_parameters(base_scenario: Dict[str, Any], names: Sequence[str]) -> np.ndarray:
+    """Values the base scenario uses for `names` (parameter set, derived values, overrides)."""
+    selected = select_parameter_set(base_scenario["T_ad"])
+    params = get_adm1_params(base_scenario["T_ad"], base_scenario["T_base"], PARAMETER_SETS[selected],
+                             base_scenario["mixing_ratio"])
+    params.update(base_scenario.get("param_overrides") or {})
+    unknown = [n for n in names if n not in params]
+    if unknown:
+        raise ValueError(f"Unknown parameters: {unknown}")
+    return np.array([float(params[n]) for n in names])
+
+
+def calibrate(
+    base_scenario: Dict[str, Any],
+    measurements: pd.DataFrame,
+    names: Sequence[str],
+    bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+    spread: float = 0.5,
+    weights: Optional[Dict[str, float]] = None,
+    executor: str = "process",
+    max_workers: Optional[int] = None,
+    library: Optional[Dict[str, Any]] = None,
+    feasible_pH: Tuple[float, float] = (4.0, 10.0),
+    penalty: float = 1e3,
+    fd_step: float = 1e-3,
+    jac: str = "fd",
+    max_nfev: int = 50,
+    verbose: int = 0,
+) -> Dict[str, Any]:
+    """
+    Fit `names` so the model reproduces `measurements`.
+
+    Parameters:
+        base_scenario (Dict[str, Any]): ADM1_coAD keyword arguments of the plant.
+        measurements (pd.DataFrame): From load_measurements (time index in days).
+        names (Sequence[str]): Parameters to fit (any key of the model params).
+        bounds (Optional[Dict]): (low, high) per parameter; nominal * (1 +- spread) otherwise.
+        spread (float): Relative half-width of the default bounds.
+        weights (Optional[Dict[str, float]]): Per-observable weights (default 1).
+            Residuals are also divided by the standard deviation of each
+            measured series, so observables in different units are comparable.
+        executor, max_workers: Passed to run_scenarios for the Jacobian runs.
+        library (Optional[Dict]): Warm-start library used for the initial state.
+        feasible_pH (Tuple[float, float]): Runs leaving this range are stopped.
+        penalty (float): Residual value assigned to every point of an infeasible run.
+        fd_step (float): Forward-difference step on the unit box.
+        jac (str): "fd" (parallel finite differences, k + 1 runs per Jacobian)
+            or "forward" (forward sensitivities, one augmented run per
+            iteration; see adm1.forward_sensitivity).
+        max_nfev (int): Maximum number of residual evaluations.
+        verbose (int): least_squares verbosity.
+
+    Returns:
+        Dict[str, Any]: {"param_overrides", "x", "cost", "optimize_result", "history"}.
+    """
+    if jac not in ("fd", "forward"):
+        raise ValueError(f"Unknown jac {jac!r}; expected 'fd' or 'forward'")
+    names = list(names)
+    nominal = nominal_parameters(base_scenario, names)
+    bounds = bounds or {}
+    box = np.array([bounds.get(n, (v * (1 - spread), v * (1 + spread))) for n, v in zip(names, nominal)])
+    lo, hi = box[:, 0], box[:, 1]
+    if np.any(hi <= lo):
+        raise ValueError("Each parameter needs low < high")
+
+    t_obs = measurements.index.to_numpy(dtype=float)
+    base = dict(base_scenario)
+    base["days"] = max(int(base["days"]), int(math.ceil(t_obs.max())) + 1)
+    base["stop_condition"] = functools.partial(infeasible_state, pH_min=feasible_pH[0], pH_max=feasible_pH[1])
+    if library is not None:
+        base = warm_started(base, library)
+    if jac == "forward":
+        base["sensitivities"] = names
+    base_overrides = dict(base.get("param_overrides") or {})
+
+    weights = weights or {}
+    columns = list(measurements.columns)
+    y_obs = measurements.to_numpy(dtype=float)
+    mask = np.isfinite(y_obs)
+    scale = np.array([weights.get(c, 1.0) / (np.nanstd(y_obs[:, j]) or 1.0) for j, c in enumerate(columns)])
+
+    def _scenario(z: np.ndarray) -> Dict[str, Any]:
+        values = lo + np.clip(z, 0.0, 1.0) * (hi - lo)
+        return dict(base, param_overrides=dict(base_overrides, **dict(zip(names, map(float, values)))))
+
+    def _residuals(output: Optional[Tuple[pd.DataFrame, Any]]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        n_res = int(mask.sum())
+        if output is None:
+            return np.full(n_res, penalty), np.zeros((n_res, len(names)))
+        observables, grads = output
+        t_model = observables["time"].to_numpy()
+        model = np.column_stack([np.interp(t_obs, t_model, observables[c].to_numpy()) for c in columns])
+        r = ((model - y_obs) * scale)[mask]
+        if grads is None:
+            return r, None
+        # dr/dz = scale * d(model)/dp * (high - low), interpolated like the model values
+        J = np.stack([np.column_stack([np.interp(t_obs, t_model, grads[c][:, j]) for j in range(len(names))])
+                      * scale[m] for m, c in enumerate(columns)], axis=1)
+        return r, (J * (hi - lo))[mask]
+
+    history: List[Dict[str, Any]] = []
+    evaluated: Dict[bytes, Tuple[np.ndarray, Optional[np.ndarray]]] = {}
+
+    def _evaluate(points: List[np.ndarray]) -> List[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        todo = [z for z in points if z.tobytes() not in evaluated]
+        outputs = run_scenarios([_scenario(z) for z in todo], executor=executor if len(todo) > 1 else "serial",
+                                max_workers=max_workers, reduce=_observables_or_aborted)
+        for z, output in zip(todo, outputs):
+            r, J = _residuals(output)
+            evaluated[z.tobytes()] = (r, J)
+            history.append({"x": lo + z * (hi - lo), "cost": 0.5 * float(r @ r), "aborted": output is None})
+        return [evaluated[z.tobytes()] for z in points]
+
+    def fun(z: np.ndarray) -> np.ndarray:
+        return _evaluate([np.asarray(z, dtype=float)])[0][0]
+
+    def jac_fd(z: np.ndarray) -> np.ndarray:
+        z = np.asarray(z, dtype=float)
+        steps = np.where(z + fd_step <= 1.0, fd_step, -fd_step)
+        points = [z]
+        for j in range(len(z)):
+            zj = z.copy()
+            zj[j] += steps[j]
+            points.append(zj)
+        (r0, _), *rs = _evaluate(points)
+        return np.column_stack([(r - r0) / h for (r, _), h in zip(rs, steps)])
+
+    def jac_forward(z: np.ndarray) -> np.ndarray:
+        return _evaluate([np.asarray(z, dtype=float)])[0][1]
+
+    z0 = np.clip((nominal - lo) / (hi - lo), 0.0, 1.0)
+    opt = least_squares(fun, z0, jac=jac_fd if jac == "fd" else jac_forward,
+                        bounds=(0.0, 1.0), method="trf", max_nfev=max_nfev, verbose=verbose)
+    x = lo + opt.x * (hi - lo)
+    return {
+        "param_overrides": dict(base_overrides, **dict(zip(names, map(float, x)))),
+        "x": x,
+        "cost": float(opt.cost),
+        "optimize_result": opt,
+        "history": history,
+    }
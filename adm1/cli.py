@@ -0,0 +1,296 @@
+"""
+Command-line runner for ADM1_coAD scenario files.
+
+    python -m adm1 run scenarios.yaml --out results --jobs 4
+    python -m adm1 validate scenarios.yaml
+    python -m adm1 serve --socket /tmp/adm1.sock   (see adm1.service)
+
+A scenario file (YAML or JSON) is either one dict of ADM1_coAD keyword
+arguments, or a dict with:
+- "defaults": arguments shared by all runs;
+- "scenarios": a list of runs, each overriding the defaults, with an
+  optional "name";
+- "grid": {argument: [values, ...]}, the cartesian product of which is
+  applied to every scenario (or to the defaults alone).
+A dotted key such as "param_overrides.k_L_a" sets one entry of a dict
+argument, in the defaults, in a scenario or as a grid axis.
+
+Contract:
+- load_scenario_file(path) -> the parsed document.
+- expand_scenarios(doc) -> [(name, grid values, scenario)], validated,
+  unique names.
+- validate_scenario(scenario) raises ValueError for unknown or missing
+  arguments (checked against the ADM1_coAD signature) and for arguments
+  that cannot come from a file (callables); complete_scenario(scenario)
+  fills in SCENARIO_DEFAULTS first and returns the validated scenario.
+- run_file(path, out_dir, jobs, fmt, use_cache) runs everything and returns
+  the summary table; main(argv) is the entry point.
+
+Output layout (out_dir):
+- runs/<name>/: the columnar trajectory store of each run (see adm1.export);
+- summary.csv: one row per run, the grid values and the key results;
+- cache/: adm1.runner result cache. A rerun with the same file and out_dir
+  loads finished runs from it and only simulates the missing ones. The
+  cache holds the summaries only, so a run whose store in runs/<name> is
+  missing or unfinished is simulated again.
+
+Notes:
+- --jobs 1 runs serially, --jobs N on a process pool of N workers, --jobs 0
+  on one worker per core.
+- YAML needs PyYAML (imported only for .yaml/.yml files); JSON always works.
+"""
+
+import argparse
+import inspect
+import itertools
+import json
+import os
+import re
+import sys
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+from adm1.coAD import ADM1_coAD
+from adm1.export import read_metadata
+from adm1.runner import _cache_path, run_scenarios, scenario_key
+
+
+# Arguments that are documented as optional in ADM1_coAD but have no default in its signature
+SCENARIO_DEFAULTS = {
+    "influent": None,
+    "initials": None,
+    "VSS": None,
+    "V_liq": None,
+    "param_overrides": None,
+    "disable_inhibition": False,
+    "Batch_process": False,
+}
+# Arguments that take Python callables and cannot be given in a file
+CALLABLE_ARGUMENTS = ("stop_condition", "controller")
+# Arguments the runner sets itself
+RUNNER_ARGUMENTS = ("verbose", "export_path", "export_format")
+
+SUMMARY_KEYS = ("VS_out", "VS_reduction", "biomethane_yield", "cumulative_methane_yield", "q_gas", "q_ch4",
+                "q_in", "HRT")
+FILE_KEYS = ("defaults", "scenarios", "grid")
+
+_SIGNATURE = inspect.signature(ADM1_coAD).parameters
+
+
+def load_scenario_file(path: str) -> Dict[str, Any]:
+    """Parse a YAML (.yaml/.yml) or JSON scenario file."""
+    with open(path, "r", encoding="utf-8") as fh:
+        text = fh.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:  # pragma: no cover - optional dependency
+            raise ValueError("YAML scenario files require PyYAML; install it or use JSON") from None
+        doc = yaml.safe_load(text)
+    else:
+        doc = json.loads(text)
+    if not isinstance(doc, dict):
+        raise ValueError(f"{path}: expected a mapping at the top level, got {type(doc).__name__}")
+    return doc
+
+
+def _set(scenario: Dict[str, Any], key: str, value: Any) -> None:
+    """Set key, or one entry of a dict argument for a dotted key."""
+    if "." not in key:
+        scenario[key] = value
+        return
+    name, entry = key.split(".", 1)
+    scenario[name] = dict(scenario.get(name) or {}, **{entry: value})
+
+
+def _merged(*layers: Dict[str, Any]) -> Dict[str, Any]:
+    scenario: Dict[str, Any] = {}
+    for layer in layers:
+        for key, value in layer.items():
+            _set(scenario, key, value)
+    return scenario
+
+
+def validate_scenario(scenario: Dict[str, Any]) -> None:
+    """Check a scenario against the ADM1_coAD signature."""
+    unknown = sorted(k for k in scenario if k not in _SIGNATURE)
+    if unknown:
+        raise ValueError(f"Unknown ADM1_coAD arguments {unknown}")
+    fixed = sorted(k for k in scenario if k in CALLABLE_ARGUMENTS + RUNNER_ARGUMENTS)
+    if fixed:
+        raise ValueError(f"Arguments {fixed} cannot be set in a scenario file")
+    missing = [name for name, p in _SIGNATURE.items()
+               if p.default is inspect.Parameter.empty and name not in scenario]
+    if missing:
+        raise ValueError(f"Missing ADM1_coAD arguments {missing}")
+
+
+def complete_scenario(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """A single scenario (dotted keys allowed) with SCENARIO_DEFAULTS filled in, validated."""
+    full = _merged(SCENARIO_DEFAULTS, scenario)
+    validate_scenario(full)
+    return full
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.=+-]+", "_", text).strip("_") or "run"
+
+
+def expand_scenarios(doc: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """
+    Expand a scenario document into individual runs.
+
+    Returns:
+        List[Tuple[str, Dict, Dict]]: (name, grid values, full ADM1_coAD
+        arguments) per run, in file order with the grid varying fastest.
+    """
+    if not any(k in doc for k in FILE_KEYS):
+        doc = {"defaults": doc}
+    extra = sorted(k for k in doc if k not in FILE_KEYS)
+    if extra:
+        raise ValueError(f"Unknown top-level keys {extra}; expected {FILE_KEYS} or a single scenario")
+    defaults = dict(doc.get("defaults") or {})
+    entries = doc.get("scenarios") or [{}]
+    grid = doc.get("grid") or {}
+    for axis, values in grid.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Grid axis {axis!r} needs a non-empty list of values")
+
+    runs = []
+    for i, entry in enumerate(entries):
+        entry = dict(entry)
+        base = str(entry.pop("name", f"scenario{i}" if len(entries) > 1 else "run"))
+        for combo in itertools.product(*grid.values()):
+            values = dict(zip(grid, combo))
+            try:
+                scenario = complete_scenario(_merged(defaults, entry, values))
+            except ValueError as exc:
+                raise ValueError(f"Scenario {base!r}: {exc}") from None
+            name = "_".join([base] + [f"{k}={v}" for k, v in values.items()])
+            runs.append((_slug(name), values, scenario))
+
+    names = [name for name, _, _ in runs]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate scenario names {duplicates}")
+    return runs
+
+
+def summarize(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Key scalar results of one run (the reduce function of the runner)."""
+    summary = {key: float(result[key]) for key in SUMMARY_KEYS}
+    summary["pH"] = float(result["simulate_results"]["pH"].iloc[-1])
+    summary["days_simulated"] = float(result["u"][-1])
+    summary["aborted"] = bool(result["aborted"])
+    if result.get("mass_balance") is not None:
+        summary.update({f"drift_{k}": v for k, v in result["mass_balance"]["drift"].items()})
+        summary["mass_balance_ok"] = result["mass_balance"]["ok"]
+    return summary
+
+
+def run_file(path: str, out_dir: str, jobs: int = 1, fmt: str = "npz", use_cache: bool = True,
+             progress: bool = True) -> "pd.DataFrame":
+    """
+    Run every scenario of a file and write the per-run stores and summary.csv.
+
+    Parameters:
+        path (str): Scenario file.
+        out_dir (str): Output directory (created if missing).
+        jobs (int): Worker processes; 1 runs serially, 0 uses one per core.
+        fmt (str): Trajectory store format, "npz" or "parquet".
+        use_cache (bool): Reuse results of earlier runs in out_dir/cache.
+        progress (bool): Print one line per finished run.
+
+    Returns:
+        pd.DataFrame: The summary table, one row per run.
+    """
+    import pandas as pd
+    if jobs < 0:
+        raise ValueError(f"jobs must be >= 0, got {jobs}")
+    runs = expand_scenarios(load_scenario_file(path))
+    os.makedirs(out_dir, exist_ok=True)
+    scenarios = [dict(scenario, export_path=os.path.join(out_dir, "runs", name), export_format=fmt)
+                 for name, _, scenario in runs]
+    workers = os.cpu_count() if jobs == 0 else jobs
+    cache_dir = os.path.join(out_dir, "cache") if use_cache else None
+    if cache_dir is not None:
+        # A cached summary without its trajectory store is not a finished run
+        for scenario in scenarios:
+            if not _store_complete(scenario["export_path"]):
+                try:
+                    os.remove(_cache_path(cache_dir, scenario_key(scenario, summarize)))
+                except FileNotFoundError:
+                    pass
+    done = [0]
+
+    def _report(index: int, summary: Dict[str, Any]) -> None:
+        done[0] += 1
+        if progress:
+            print(f"[{done[0]}/{len(runs)}] {runs[index][0]}: VS_reduction {summary['VS_reduction']:.2f} %")
+
+    summaries = run_scenarios(scenarios, executor="serial" if workers == 1 else "process", max_workers=workers,
+                              on_result=_report, reduce=summarize,
+                              cache_dir=cache_dir)
+    table = pd.DataFrame([dict(name=name, **{k: _cell(v) for k, v in values.items()}, **summary)
+                          for (name, values, _), summary in zip(runs, summaries)])
+    table.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+    return table
+
+
+def _store_complete(path: str) -> bool:
+    """True if path holds an export store whose writer was closed."""
+    try:
+        return bool(read_metadata(path).get("complete"))
+    except (OSError, ValueError):
+        return False
+
+
+def _cell(value: Any) -> Any:
+    """Grid values as summary cells (lists and dicts as JSON text)."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m adm1", description="Run ADM1_coAD scenario files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run all scenarios of a file")
+    run.add_argument("file", help="YAML or JSON scenario file")
+    run.add_argument("--out", default="results", help="output directory (default: results)")
+    run.add_argument("--jobs", "-j", type=int, default=1, help="worker processes; 0 = one per core (default: 1)")
+    run.add_argument("--format", choices=("npz", "parquet"), default="npz", help="trajectory store format")
+    run.add_argument("--no-cache", action="store_true", help="rerun everything instead of resuming")
+    validate = commands.add_parser("validate", help="check a file and list its runs")
+    validate.add_argument("file", help="YAML or JSON scenario file")
+    serve = commands.add_parser("serve", help="run the local simulation service (see adm1.service)")
+    serve.add_argument("--socket", help="Unix socket path (default: TCP on --host/--port)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    serve.add_argument("--cache", default=None, help="result cache directory")
+    serve.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        from adm1.service import serve as run_service
+        run_service(args.workers, args.cache, args.host, args.port, args.socket, args.verbose)
+        return 0
+
+    try:
+        if args.command == "validate":
+            runs = expand_scenarios(load_scenario_file(args.file))
+            for name, _, _ in runs:
+                print(name)
+            print(f"{len(runs)} runs")
+            return 0
+        table = run_file(args.file, args.out, jobs=args.jobs, fmt=args.format, use_cache=not args.no_cache)
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    import pandas as pd  # already loaded by run_file
+    with pd.option_context("display.width", 160, "display.max_columns", 20):
+        print(table.drop(columns=[c for c in table if c.startswith("drift_")]).to_string(index=False))
+    return 0
@@ -1,19 +1,124 @@
 import numpy as np
-import pandas as pd
-#from adm1.ode import ADM1_ODE
-# Import custom plotting functions
 from adm1.influent import reactor_setup
 from adm1.influent import mix_influent_with_recycle
 from adm1.influent import get_influent
 from adm1.initial_state import get_initial_state
-from adm1.params import PARAMETER_SETS, set_global_params_from_dict
+from adm1.params import PARAMETER_SETS, select_parameter_set
 from adm1.params import get_adm1_params
-#from adm1.params import *
 from adm1.dae import DAESolve  # pure DAE solver
 from adm1.solver import simulate
-from adm1.params import get_VSS 
+from adm1.params import get_VSS, get_VSS_array
 from adm1.influent import rescale_influent
+from adm1.influent import feed_flows
+from adm1.schedule import prepare_schedule, operating_point, apply_change
 from .inhibition import compute_inhibition_factors
+from adm1.petersen import build_petersen, dilution_rates
+from adm1.ode import compile_ode_params
+from adm1.params import params_hash
+from adm1.balance import DEFAULT_TOL, new_monitor, monitor_segment, monitor_algebraic, monitor_record, monitor_result
+from adm1.export import open_writer, append_row, update_metadata, close_writer
+from adm1.forward_sensitivity import (prepare_sensitivities, integrate_step, algebraic_step,
+                                      output_sensitivities)
+
+
+def setup_scenario(
+    q_ad_init, density, VS_per_TS_PS, VS_per_TS_SS, TS_fraction, mixing_ratio, mixing_ratio2, OLR,
+    T_ad, T_base, recycle_ratio, influent, initials, VSS, V_liq, param_overrides,
+    disable_inhibition, Batch_process,
+):
+    """
+    Everything ADM1_coAD derives before its time loop, for reuse by other drivers.
+
+    Returns:
+        dict: influent (base), initial_state, reactor (reactor_setup output),
+        new_influent (rescaled to q_in), parameter_set and params (temperature
+        set + overrides + reactor flows/volumes).
+    """
+    if influent is None:
+        influent = get_influent(mixing_ratio, mixing_ratio2)
+    initial_state = get_initial_state(mixing_ratio) if initials is None else initials
+
+    reactor = reactor_setup(
+        influent,           # Influent scenario function
+        initial_state,      # Initial state scenario function
+        q_ad_init,          # Initial influent flow rate [m^3/d]
+        density,            # Influent density [tonne/m^3]
+        VS_per_TS_PS,       # Volatile solids per  total solids [kg VS/kg TS]
+        VS_per_TS_SS,
+        TS_fraction,        # Fraction of water in influent
+        mixing_ratio,       # Fraction for feed 1 # feed1 / total (can be overridden per scenario)
+        mixing_ratio2,
+        OLR,                # Organic Loading Rate [kg VS/m3/d]
+        recycle_ratio,      # Recycle ratio [m^3/d]
+        Batch_process,      # If True, simulate a batch process (no influent flow)
+        VSS,                # Optional: pass custom VSS value
+        V_liq=V_liq,        # Optional: pass custom reactor liquid volume [m^3]
+    )
+
+    # Rescale influent concentrations to actual flow (preserve mass load)
+    new_influent = rescale_influent(mixing_ratio, influent, reactor['q_in'], q_ad_init)
+
+    # Choose parameter set based on operating temperature
+    selected_set = select_parameter_set(T_ad)
+
+    params2 = PARAMETER_SETS[selected_set]
+    params = get_adm1_params(T_ad, T_base, params2, mixing_ratio)
+
+    # Apply any caller-provided overrides after base/temperature-derived params are built
+    if isinstance(param_overrides, dict) and param_overrides:
+        params.update(param_overrides)
+
+    params.update({
+        'q_in': reactor['q_in'],
+        'q_in1': reactor['q_in1'],
+        'q_in2': reactor['q_in2'],
+        'q_ad': reactor['q_ad'],
+        'q_out': reactor['q_out'],
+        'q_r': reactor['q_r'],
+        'VS_in': reactor['VS_in'],
+        'HRT': reactor['HRT'],
+        'V_liq': reactor['V_liq'],
+        'V_gas': reactor['V_gas'],
+        'V_ad': reactor['V_ad'],
+        'OLR': reactor['OLR'],
+        'density': reactor['density'],
+        'mixing_ratio': reactor['mixing_ratio'],
+        # Toggle for inhibition in ODE path
+        'disable_inhibition': disable_inhibition,
+    })
+
+    return {
+        'influent': influent,
+        'initial_state': initial_state,
+        'reactor': reactor,
+        'new_influent': new_influent,
+        'parameter_set': selected_set,
+        'params': params,
+    }
+
+
+def apply_control(action, new_influent, params, recycle_ratio):
+    """
+    Apply a controller action to the fresh feed of a running scenario.
+
+    action keys are fresh-feed components (*_in names, absolute values, e.g.
+    'S_cation_in' for alkalinity dosing) and/or 'q_in' (fresh feed flow
+    [m^3/d]). Returns (new_influent, flows): an updated copy of the influent
+    dict and the new flows (already merged into params), or {} if q_in is
+    unchanged. VS_in, HRT and the volumes keep their set-up values.
+    """
+    unknown = [k for k in action if k != 'q_in' and k not in new_influent]
+    if unknown:
+        raise ValueError(f"Unknown control inputs: {unknown}")
+    new_influent = dict(new_influent)
+    new_influent.update({k: float(v) for k, v in action.items() if k != 'q_in'})
+    flows = {}
+    if 'q_in' in action:
+        if action['q_in'] < 0:
+            raise ValueError(f"Feed flow must be >= 0, got {action['q_in']}")
+        flows = feed_flows(float(action['q_in']), params['mixing_ratio'], recycle_ratio)
+        params.update(flows)
+    return new_influent, flows
 
 
 def ADM1_coAD(
@@ -38,21 +143,31 @@ def ADM1_coAD(
     param_overrides,        # Optional: dict of parameter overrides (e.g., k_L_a, k_p, K_H_*)
     disable_inhibition: bool,  # If True, force all inhibition factors to 1
     Batch_process: bool, # If True, simulate a batch process (no influent flow)
+    kernel: str = "ode",     # "ode" (hand-coded ADM1_ODE) or "petersen" (sparse stoichiometric matrix RHS)
+    verbose: bool = True,    # If False, suppress the reactor summary and per-step progress prints
+    export_path=None,        # Optional: directory to stream the trajectories to (see adm1.export)
+    export_format: str = "npz",  # "npz" or "parquet"
+    stop_condition=None,     # Optional: callable(t, state) -> bool; True ends the run early (result['aborted'])
+    sensitivities=None,      # Optional: list of param names; integrates forward sensitivities (result['sensitivities'])
+    controller=None,         # Optional: callable(t, state) -> action dict or None, see apply_control (result['control'])
+    control_interval=None,   # Days between controller calls; None calls it before every step
+    schedule=None,           # Optional: list of timestamped changes (see adm1.schedule); exact breakpoints
+    mass_balance=None,       # Optional: True or a drift tolerance; COD/N/C balances (see adm1.balance, result['mass_balance'])
 ):
 
 
-    if influent is None:
-        influent = get_influent(mixing_ratio, mixing_ratio2)
-    else:
-        influent = influent
-    
+    # pandas is only needed once a run builds its result tables
+    import pandas as pd
+
+    default_influent = influent is None
+    setup = setup_scenario(q_ad_init, density, VS_per_TS_PS, VS_per_TS_SS, TS_fraction, mixing_ratio,
+                           mixing_ratio2, OLR, T_ad, T_base, recycle_ratio, influent, initials, VSS,
+                           V_liq, param_overrides, disable_inhibition, Batch_process)
+    influent = setup['influent']
 
     ########################################
     # Initial state
-    if initials is None:
-        initial_state = get_initial_state(mixing_ratio)
-    else:
-        initial_state = initials
+    initial_state = setup['initial_state']
 
     S_su=initial_state['S_su']
     S_aa=initial_state['S_aa']
@@ -142,24 +257,7 @@ def ADM1_coAD(
                 S_gas_co2]
 
     
-    # --- Set up reactor for this scenario ---
-    reactor = reactor_setup(
-    influent,               # Influent scenario function
-    initial_state,          # Initial state scenario function
-    q_ad_init,                # Initial influent flow rate [m^3/d]
-    density,                    # Influent density [tonne/m^3]
-    VS_per_TS_PS,                # Volatile solids per  total solids [kg VS/kg TS]
-    VS_per_TS_SS,    
-    TS_fraction,         # Fraction of water in influent
-    mixing_ratio,   # Fraction for feed 1 # feed1 / total (can be overridden per scenario)
-    mixing_ratio2,
-    OLR,                        # Organic Loading Rate [kg VS/m3/d]
-    recycle_ratio,                # Recycle ratio [m^3/d]
-    Batch_process,                # If True, simulate a batch process (no influent flow)
-    VSS,                            # Optional: pass custom VSS value
-    V_liq=V_liq,                            # Optional: pass custom reactor liquid volume [m^3]
-    )
-    # --- Set up reactor for this scenario ---
+    reactor = setup['reactor']
 
     q_in = reactor['q_in']
     q_in1 = reactor['q_in1']
@@ -178,19 +276,20 @@ def ADM1_coAD(
 
 
 
-    print("VS_in:", VS_in)
-    print("HRT:", HRT)
-    print("V_liq:", V_liq)
-    print("V_gas:", V_gas)
-    print("V_ad:", V_ad)
-    print("TS:", TS)
-    print("VSS:", VSS)
-    print("TS_fraction_initial:", TS_fraction_initial)
+    if verbose:
+        print("VS_in:", VS_in)
+        print("HRT:", HRT)
+        print("V_liq:", V_liq)
+        print("V_gas:", V_gas)
+        print("V_ad:", V_ad)
+        print("TS:", TS)
+        print("VSS:", VSS)
+        print("TS_fraction_initial:", TS_fraction_initial)
 
     # --- End  Reactor Setup ---
 
     # Rescale influent concentrations to actual flow (preserve mass load)
-    new_influent = rescale_influent(mixing_ratio,influent, q_in, q_ad_init)
+    new_influent = setup['new_influent']
 
 
     S_su_in = new_influent['S_su_in']
@@ -268,335 +367,495 @@ def ADM1_coAD(
 
 
 
-    # Choose parameter set based on operating temperature (K) -> (°C)
-    # Rule: 20–40°C => MESOPHILIC_SOLIDS, 45–70°C => THERMOPHILIC_SOLIDS, gap (40–45°C) defaults to mesophilic
-    T_C_sel = float(T_ad) - 273.15
-    if 20.0 <= T_C_sel <= 40.0:
-        selected_set = "mesophilic_solids"
-    elif 45.0 <= T_C_sel <= 70.0:
-        selected_set = "thermophilic_solids"
-    else:
-        # Default to mesophilic in the transition gap or outside specified bounds
-        selected_set = "mesophilic_solids"
+    # Parameter set chosen by operating temperature, overrides and reactor flows (see setup_scenario)
+    selected_set = setup['parameter_set']
+    params = setup['params']
 
-    params2 = PARAMETER_SETS[selected_set]
-    set_global_params_from_dict(params2)
-    params = get_adm1_params(T_ad, T_base, params2, mixing_ratio)
+    # Gas-phase constants used by the post-step algebra (read once, never via module globals)
+    R = params['R']
+    k_L_a, k_p = params['k_L_a'], params['k_p']
+    K_H_h2, K_H_ch4, K_H_co2 = params['K_H_h2'], params['K_H_ch4'], params['K_H_co2']
+    p_atm, p_gas_h2o = params['p_atm'], params['p_gas_h2o']
 
-    # Apply any caller-provided overrides after base/temperature-derived params are built
-    if isinstance(param_overrides, dict) and param_overrides:
-        params.update(param_overrides)
-
-    params.update({
-        'q_in': reactor['q_in'],
-        'q_in1': reactor['q_in1'],
-        'q_in2': reactor['q_in2'],
-        'q_ad': reactor['q_ad'],
-        'q_out': reactor['q_out'],
-        'q_r': reactor['q_r'],
-        'VS_in': reactor['VS_in'],
-        'HRT': reactor['HRT'],
-        'V_liq': reactor['V_liq'],
-        'V_gas': reactor['V_gas'],
-        'V_ad': reactor['V_ad'],
-        'OLR': reactor['OLR'],
-        'density': reactor['density'],
-        'mixing_ratio': reactor['mixing_ratio'],
-        # Toggle for inhibition in ODE path
-        'disable_inhibition': disable_inhibition,
-    })
-
-    for k, v in params.items():
-        globals()[k] = v
-
-    # Local aliases for parameters use 
-
-    # Initiate the cache data frame for storing simulation results
-    simulate_results = pd.DataFrame([state_zero])
-    columns = ["S_su", "S_aa", "S_fa", "S_va", "S_bu", "S_pro", "S_ac", "S_h2", "S_ch4", "S_IC", "S_IN", "S_I", "X_xc1", "X_ch1", "X_pr1", "X_li1", "X_xc2", "X_ch2", "X_pr2", "X_li2", "X_su", "X_aa", "X_fa", "X_c4", "X_pro", "X_ac", "X_h2", "X_I", "S_cation", "S_anion", "pH", "S_va_ion", "S_bu_ion", "S_pro_ion", "S_ac_ion", "S_hco3_ion", "S_co2", "S_nh3", "S_nh4_ion", "S_gas_h2", "S_gas_ch4", "S_gas_co2"]
-    simulate_results.columns = columns
-
-    # Initiate cache data frame for storing gasflow values
-    initflow = {'p_gas_h2': [0],'p_gas_ch4': [0],'p_gas_co2': [0],'p_gas': [0],'q_gas': [0], 'q_ch4': [0], 'total_ch4': [0],'p_gas_ch4/p_gas': [0],'p_gas_co2/p_gas': [0], 'ch4_yield':[0], 'co2_yield':[0], 'cumulative_methane_yield':[0], 'h2_yield':[0]}
-    gasflow = pd.DataFrame(initflow)
-    total_ch4 = 0
-
-    # Initiate cache data frame for storing inhibition values
-    init_inhib_val = 1 if disable_inhibition else 0
-    initflow = {
-        'I_5': [init_inhib_val],
-        'I_6': [init_inhib_val],
-        'I_7': [init_inhib_val],
-        'I_8': [init_inhib_val],
-        'I_10': [init_inhib_val],
-        'I_12': [init_inhib_val],
-        'I_pH_aa': [init_inhib_val],
-        'I_pH_ac': [init_inhib_val],
-        'I_pH_h2': [init_inhib_val],
-        'I_IN_lim': [init_inhib_val],
-        'I_h2_fa': [init_inhib_val],
-        'I_h2_c4': [init_inhib_val],
-        'I_h2_pro': [init_inhib_val],
-        'I_nh3': [init_inhib_val],
-    }
-    inhibition = pd.DataFrame(initflow)
+    # Petersen-matrix kernel / hand-coded kernel coefficients are assembled once per scenario
+    coeffs = None
+    if kernel == "petersen":
+        model = build_petersen(params)
+    elif kernel == "ode":
+        model = None
+        coeffs = compile_ode_params(params)
+    else:
+        raise ValueError(f"Unknown kernel {kernel!r}; expected 'ode' or 'petersen'")
+
+    # Forward sensitivities dy/dp for the requested parameters (Petersen RHS, see adm1.forward_sensitivity)
+    sens = None
+    if sensitivities and (controller is not None or schedule):
+        raise ValueError("Forward sensitivities are not supported together with a controller or schedule")
+    if sensitivities and mass_balance:
+        raise ValueError("The mass balance needs the solver's internal steps; not available with sensitivities")
+
+    # Piecewise operating schedule: changes applied at exact breakpoints (see adm1.schedule)
+    events = prepare_schedule(schedule) if schedule else []
+    breakpoints = sorted({e['time'] for e in events})
+    next_event = 0
+    param_cache = {}
+    operating = None
+    if events:
+        operating = operating_point(setup, T_ad, T_base, T_op, mixing_ratio2, recycle_ratio, param_overrides,
+                                    q_ad_init, default_influent)
+    if sensitivities:
+        sens = prepare_sensitivities(params, sensitivities)
+        S_y = np.zeros((len(state_zero), len(sens['names'])))
+        sens_records = {'q_ch4': [np.zeros(len(sens['names']))], 'pH': [], 'VS_out': []}
+        sens_trajectory = [S_y.copy()]
+
+    # Optional streaming export of the trajectories (state, gasflow, inhibition, mixed influent)
+    writer = None
+    if export_path is not None:
+        writer = open_writer(export_path, fmt=export_format, metadata={
+            'parameter_set': selected_set,
+            'params_hash': params_hash(param_overrides),
+            'param_overrides': param_overrides or {},
+            'kernel': kernel,
+            'mixing_ratio': mixing_ratio, 'mixing_ratio2': mixing_ratio2, 'OLR': OLR,
+            'T_ad': T_ad, 'T_base': T_base, 'T_op': T_op, 'recycle_ratio': recycle_ratio,
+            'days': days, 'timesteps': timesteps, 'disable_inhibition': disable_inhibition,
+            'Batch_process': Batch_process,
+            'reactor': {k: reactor[k] for k in ('q_in', 'q_in1', 'q_in2', 'q_ad', 'q_out', 'q_r', 'VS_in',
+                                                'HRT', 'V_liq', 'V_gas', 'V_ad', 'TS', 'VSS')},
+        })
+
+    # Everything after opening the writer runs under try/finally, so the store is finalised
+    # (and stays readable) even when the integration or a user hook raises
+    try:
+        # Local aliases for parameters use 
+
+        # Initiate the cache data frame for storing simulation results
+        simulate_results = pd.DataFrame([state_zero])
+        columns = ["S_su", "S_aa", "S_fa", "S_va", "S_bu", "S_pro", "S_ac", "S_h2", "S_ch4", "S_IC", "S_IN", "S_I", "X_xc1", "X_ch1", "X_pr1", "X_li1", "X_xc2", "X_ch2", "X_pr2", "X_li2", "X_su", "X_aa", "X_fa", "X_c4", "X_pro", "X_ac", "X_h2", "X_I", "S_cation", "S_anion", "pH", "S_va_ion", "S_bu_ion", "S_pro_ion", "S_ac_ion", "S_hco3_ion", "S_co2", "S_nh3", "S_nh4_ion", "S_gas_h2", "S_gas_ch4", "S_gas_co2"]
+        simulate_results.columns = columns
+        q_out_records = [q_out]
+
+        # Runtime COD / N / C balance over the solver's internal steps (see adm1.balance)
+        monitor = None
+        if mass_balance:
+            monitor = new_monitor(params, 0.0, state_zero, DEFAULT_TOL if mass_balance is True else float(mass_balance))
+
+        # Initiate cache data frame for storing gasflow values
+        initflow = {'p_gas_h2': [0],'p_gas_ch4': [0],'p_gas_co2': [0],'p_gas': [0],'q_gas': [0], 'q_ch4': [0], 'total_ch4': [0],'p_gas_ch4/p_gas': [0],'p_gas_co2/p_gas': [0], 'ch4_yield':[0], 'co2_yield':[0], 'cumulative_methane_yield':[0], 'h2_yield':[0]}
+        gasflow = pd.DataFrame(initflow)
+        total_ch4 = 0
+
+        # Initiate cache data frame for storing inhibition values
+        init_inhib_val = 1 if disable_inhibition else 0
+        initflow = {
+            'I_5': [init_inhib_val],
+            'I_6': [init_inhib_val],
+            'I_7': [init_inhib_val],
+            'I_8': [init_inhib_val],
+            'I_10': [init_inhib_val],
+            'I_12': [init_inhib_val],
+            'I_pH_aa': [init_inhib_val],
+            'I_pH_ac': [init_inhib_val],
+            'I_pH_h2': [init_inhib_val],
+            'I_IN_lim': [init_inhib_val],
+            'I_h2_fa': [init_inhib_val],
+            'I_h2_c4': [init_inhib_val],
+            'I_h2_pro': [init_inhib_val],
+            'I_nh3': [init_inhib_val],
+        }
+        inhibition = pd.DataFrame(initflow)
 
-    # Initiate cache data frame for storing ions values
-    initflow = {'S_cation': [0],'S_anion': [0],'S_H_ion': [0],'S_va_ion': [0],'S_bu_ion': [0],'S_pro_ion': [0],'S_ac_ion': [0],'S_hco3_ion': [0],'S_nh4_ion': [0]}
-    ions = pd.DataFrame(initflow)
+        # Initiate cache data frame for storing ions values
+        initflow = {'S_cation': [0],'S_anion': [0],'S_H_ion': [0],'S_va_ion': [0],'S_bu_ion': [0],'S_pro_ion': [0],'S_ac_ion': [0],'S_hco3_ion': [0],'S_nh4_ion': [0]}
+        ions = pd.DataFrame(initflow)
 
-    ##############################
-    ##time definition
+        ##############################
+        ##time definition
 
-    timeSteps_sets = {
-    "Day(s)": days,
-    "15 Minute(s)": days*24*4,
-    "Hour(s)": days*24,
-}
+        timeSteps_sets = {
+        "Day(s)": days,
+        "15 Minute(s)": days*24*4,
+        "Hour(s)": days*24,
+    }
     
    
 
-    selected_timeSteps = timeSteps_sets[timesteps] #every 1 hour 
-
-
-    t = np.linspace(0, days, selected_timeSteps) #sequence of timesteps as fractions of days
-
-
-
-    solvermethod = 'DOP853'
-    # solvermethod = 'BDF'
-
-    # --- Recycle stream integration ---
-    # Each step, compute fresh+recycle mixed influent using flow-weighted average
-    # Also record the mixed influent so users can inspect its evolution over time
-    mixed_influent_records = []
-
-    for u in t[1:]:
-        n += 1
-
-        # Effluent state MUST use base (no *_in) names. Influent uses *_in names.
-        effluent_state = {
-            'S_su': S_su, 'S_aa': S_aa, 'S_fa': S_fa, 'S_va': S_va, 'S_bu': S_bu, 'S_pro': S_pro,
-            'S_ac': S_ac, 'S_h2': S_h2, 'S_ch4': S_ch4, 'S_IC': S_IC, 'S_IN': S_IN, 'S_I': S_I,
-            'X_xc1': X_xc1, 'X_ch1': X_ch1, 'X_pr1': X_pr1, 'X_li1': X_li1, 'X_xc2': X_xc2,
-            'X_ch2': X_ch2, 'X_pr2': X_pr2, 'X_li2': X_li2, 'X_su': X_su, 'X_aa': X_aa,
-            'X_fa': X_fa, 'X_c4': X_c4, 'X_pro': X_pro, 'X_ac': X_ac, 'X_h2': X_h2,
-            'X_I': X_I, 'S_cation': S_cation, 'S_anion': S_anion
-        }
+        selected_timeSteps = timeSteps_sets[timesteps] #every 1 hour 
+
+
+        t = np.linspace(0, days, selected_timeSteps) #sequence of timesteps as fractions of days
+
+        if writer is not None:
+            # Exported state rows carry pH, not S_H_ion, in the 'pH' column (as in the final result)
+            row = dict(zip(columns, state_zero))
+            row['pH'] = -np.log10(row['pH'])
+            append_row(writer, 'state', dict(time=t[0], **row))
+            # The t0 placeholder rows, so every table lines up with the in-memory result
+            # (I_9 / I_11 are only set from the first step on, NaN at t0 there too).
+            # mixed_influent has no t0 row in memory either; its rows carry their own time.
+            append_row(writer, 'gasflow', dict(time=t[0], **gasflow.iloc[0]))
+            append_row(writer, 'inhibition', dict(time=t[0], **inhibition.iloc[0], I_9=np.nan, I_11=np.nan))
+
+
+
+        solvermethod = 'DOP853'
+        # solvermethod = 'BDF'
+
+        # --- Recycle stream integration ---
+        # Each step, compute fresh+recycle mixed influent using flow-weighted average
+        # Also record the mixed influent so users can inspect its evolution over time
+        mixed_influent_records = []
+        aborted = False
+        control_records = []
+        next_control = 0.0
+
+
+        for u in t[1:]:
+            n += 1
+
+            # In-loop controller: may change the fresh feed composition and flow for the coming steps
+            if controller is not None and t0 >= next_control - 1e-9:
+                action = controller(t0, state_zero)
+                if action:
+                    new_influent, flows = apply_control(action, new_influent, params, recycle_ratio)
+                    if operating is not None:
+                        operating['new_influent'] = new_influent
+                    if flows:
+                        q_in, q_in1, q_in2, q_out, q_r, q_ad = (flows[k] for k in ('q_in', 'q_in1', 'q_in2',
+                                                                                      'q_out', 'q_r', 'q_ad'))
+                        if model is not None:
+                            model['D'] = dilution_rates(params)
+                        else:
+                            coeffs = compile_ode_params(params)
+                    control_records.append(dict(time=t0, **action))
+                next_control = t0 + (control_interval or 0.0)
+
+            # Schedule breakpoints inside this output step split it into segments
+            cuts = [b for b in breakpoints if t0 + 1e-9 < b < u - 1e-9]
+            seg_t0 = t0
+            for seg_t1 in cuts + [u]:
+                if next_event < len(events) and events[next_event]['time'] <= seg_t0 + 1e-9:
+                    changed = set()
+                    while next_event < len(events) and events[next_event]['time'] <= seg_t0 + 1e-9:
+                        changed |= apply_change(operating, events[next_event], param_cache)
+                        next_event += 1
+                    params, new_influent, T_op = operating['params'], operating['new_influent'], operating['T_op']
+                    q_in, q_in1, q_in2, q_out, q_r, q_ad = (params[k] for k in ('q_in', 'q_in1', 'q_in2',
+                                                                                'q_out', 'q_r', 'q_ad'))
+                    if 'params' in changed:
+                        R = params['R']
+                        k_L_a, k_p = params['k_L_a'], params['k_p']
+                        K_H_h2, K_H_ch4, K_H_co2 = params['K_H_h2'], params['K_H_ch4'], params['K_H_co2']
+                        p_atm, p_gas_h2o = params['p_atm'], params['p_gas_h2o']
+                    if kernel == 'petersen':
+                        if 'params' in changed:
+                            model = build_petersen(params)
+                        elif 'flows' in changed:
+                            model['D'] = dilution_rates(params)
+                    elif changed & {'params', 'flows'}:
+                        coeffs = compile_ode_params(params)
+
+                # Effluent state MUST use base (no *_in) names. Influent uses *_in names.
+                effluent_state = {
+                    'S_su': S_su, 'S_aa': S_aa, 'S_fa': S_fa, 'S_va': S_va, 'S_bu': S_bu, 'S_pro': S_pro,
+                    'S_ac': S_ac, 'S_h2': S_h2, 'S_ch4': S_ch4, 'S_IC': S_IC, 'S_IN': S_IN, 'S_I': S_I,
+                    'X_xc1': X_xc1, 'X_ch1': X_ch1, 'X_pr1': X_pr1, 'X_li1': X_li1, 'X_xc2': X_xc2,
+                    'X_ch2': X_ch2, 'X_pr2': X_pr2, 'X_li2': X_li2, 'X_su': X_su, 'X_aa': X_aa,
+                    'X_fa': X_fa, 'X_c4': X_c4, 'X_pro': X_pro, 'X_ac': X_ac, 'X_h2': X_h2,
+                    'X_I': X_I, 'S_cation': S_cation, 'S_anion': S_anion
+                }
+
+                # Flow-weighted mixing using helper ( (q_in * fresh + q_r * effluent)/q_ad )
+                mixed_influent = mix_influent_with_recycle(new_influent, effluent_state, q_in, q_r, q_ad)
+
+                # Record history (add time for traceability)
+                rec = {'time': u}
+                rec.update(mixed_influent)
+
+
+                # Update state_input for this time step
+                state_input = [mixed_influent['S_su_in'], mixed_influent['S_aa_in'], mixed_influent['S_fa_in'], mixed_influent['S_va_in'], mixed_influent['S_bu_in'], mixed_influent['S_pro_in'], 
+                               mixed_influent['S_ac_in'], mixed_influent['S_h2_in'], mixed_influent['S_ch4_in'], mixed_influent['S_IC_in'], mixed_influent['S_IN_in'], mixed_influent['S_I_in'],
+                               mixed_influent['X_xc1_in'], mixed_influent['X_ch1_in'], mixed_influent['X_pr1_in'], mixed_influent['X_li1_in'], mixed_influent['X_xc2_in'], 
+                               mixed_influent['X_ch2_in'], mixed_influent['X_pr2_in'], mixed_influent['X_li2_in'], mixed_influent['X_su_in'], mixed_influent['X_aa_in'], 
+                               mixed_influent['X_fa_in'], mixed_influent['X_c4_in'], mixed_influent['X_pro_in'], mixed_influent['X_ac_in'], mixed_influent['X_h2_in'], 
+                               mixed_influent['X_I_in'], mixed_influent['S_cation_in'], mixed_influent['S_anion_in']]
+
+                # Span for next time step
+                tstep = [seg_t0, seg_t1]
+
+                # ...existing simulation code...
+                # After simulation step, update effluent_state with new effluent values (from output)
+                # effluent_state = ... (update with output from simulation)
+
+                # Build current state vector (y0)
+                current_state = [S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I,
+                                X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2,
+                                X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion,
+                                S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion,
+                                S_gas_h2, S_gas_ch4, S_gas_co2]
+
+                # ODE integration
+                if monitor is not None:
+                    sim_t, sim = simulate(tstep, current_state, state_input, solvermethod, params, model=model,
+                                          coeffs=coeffs, return_times=True)
+                    monitor_segment(monitor, params, sim_t, sim, state_input)
+                elif sens is None:
+                    sim = simulate(tstep, current_state, state_input, solvermethod,params, model=model, coeffs=coeffs)
+                else:
+                    # Mixed influent sensitivity through the recycle stream
+                    S_in = (q_r / q_ad) * S_y[:len(state_input)] if q_ad > 0 else np.zeros((len(state_input), S_y.shape[1]))
+                    y_step, S_y = integrate_step(sens, tstep, current_state, S_y, state_input, S_in, solvermethod)
+                    sim = y_step[:, None]
+
+                # Unpack solution arrays
+                (sim_S_su, sim_S_aa, sim_S_fa, sim_S_va, sim_S_bu, sim_S_pro, sim_S_ac, sim_S_h2, sim_S_ch4, sim_S_IC, sim_S_IN, sim_S_I,
+                sim_X_xc1, sim_X_ch1, sim_X_pr1, sim_X_li1, sim_X_xc2, sim_X_ch2, sim_X_pr2, sim_X_li2,
+                sim_X_su, sim_X_aa, sim_X_fa, sim_X_c4, sim_X_pro, sim_X_ac, sim_X_h2, sim_X_I, sim_S_cation, sim_S_anion,
+                sim_S_H_ion, sim_S_va_ion, sim_S_bu_ion, sim_S_pro_ion, sim_S_ac_ion, sim_S_hco3_ion, sim_S_co2, sim_S_nh3, sim_S_nh4_ion,
+                sim_S_gas_h2, sim_S_gas_ch4, sim_S_gas_co2) = sim
+
+                # Take last values
+                S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I, \
+                X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2, \
+                X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion, \
+                S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion, \
+                S_gas_h2, S_gas_ch4, S_gas_co2 = \
+                    sim_S_su[-1], sim_S_aa[-1], sim_S_fa[-1], sim_S_va[-1], sim_S_bu[-1], sim_S_pro[-1], sim_S_ac[-1], sim_S_h2[-1], sim_S_ch4[-1], sim_S_IC[-1], sim_S_IN[-1], sim_S_I[-1], \
+                    sim_X_xc1[-1], sim_X_ch1[-1], sim_X_pr1[-1], sim_X_li1[-1], sim_X_xc2[-1], sim_X_ch2[-1], sim_X_pr2[-1], sim_X_li2[-1], \
+                    sim_X_su[-1], sim_X_aa[-1], sim_X_fa[-1], sim_X_c4[-1], sim_X_pro[-1], sim_X_ac[-1], sim_X_h2[-1], sim_X_I[-1], sim_S_cation[-1], sim_S_anion[-1], \
+                    sim_S_H_ion[-1], sim_S_va_ion[-1], sim_S_bu_ion[-1], sim_S_pro_ion[-1], sim_S_ac_ion[-1], sim_S_hco3_ion[-1], sim_S_co2[-1], sim_S_nh3[-1], sim_S_nh4_ion[-1], \
+                    sim_S_gas_h2[-1], sim_S_gas_ch4[-1], sim_S_gas_co2[-1]
+
+                # Algebraic update (pure DAE) - pass state, receive corrected state & pH
+                state_for_dae = [S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I,
+                                X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2,
+                                X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion,
+                                S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion,
+                                S_gas_h2, S_gas_ch4, S_gas_co2]
+        
+        
+                new_state, pH_value = DAESolve(state_for_dae,state_input,params)
+                if sens is not None:
+                    S_y = algebraic_step(sens, state_for_dae, S_y, state_input, S_in)
+                if monitor is not None:
+                    monitor_algebraic(monitor, state_for_dae, new_state)
+
+
+                # Overwrite updated components from new_state (others unchanged)
+                S_h2 = new_state[7]
+                S_H_ion = new_state[30]
+                S_va_ion = new_state[31]
+                S_bu_ion = new_state[32]
+                S_pro_ion = new_state[33]
+                S_ac_ion = new_state[34]
+                S_hco3_ion = new_state[35]
+                S_co2 = new_state[36]
+                S_nh3 = new_state[37]
+                S_nh4_ion = new_state[38]
+                # Rebuilt as after the step, so a following segment starts from a consistent state
+                S_nh4_ion = (S_IN - S_nh3)
+                S_co2 = (S_IC - S_hco3_ion)
+                seg_t0 = seg_t1
+            mixed_influent_records.append(rec)
+            # pH_value available if needed for direct storage/inhibition calcs
+
+            prevS_H_ion = S_H_ion
+
+             # Base inhibition factors via shared utility
+
+
+            inhib = compute_inhibition_factors(
+                S_H_ion=S_H_ion,
+                S_IN=S_IN,
+                S_h2=S_h2,
+                S_nh3=S_nh3,
+                params=params,
+                disable_inhibition=disable_inhibition,
+            )
+
+            I_pH_aa = inhib['I_pH_aa']
+            I_pH_ac = inhib['I_pH_ac']
+            I_pH_h2 = inhib['I_pH_h2']
+            I_IN_lim = inhib['I_IN_lim']
+            I_h2_fa = inhib['I_h2_fa']
+            I_h2_c4 = inhib['I_h2_c4']
+            I_h2_pro = inhib['I_h2_pro']
+            I_nh3 = inhib['I_nh3']
+
+            I_5 = inhib['I_5']
+            I_6 = inhib['I_6']
+            I_7 = inhib['I_7']
+            I_8 = inhib['I_8']
+            I_9 = inhib['I_9']
+            I_10 = inhib['I_10']
+            I_11 = inhib['I_11']
+            I_12 = inhib['I_12']
+
+            # Store all computed inhibition factors for consistency and maintainability
+            inhibittemp = {'I_5': I_5,'I_6': I_6,'I_7': I_7,'I_8': I_8,'I_9': I_9,'I_10': I_10,'I_11': I_11,'I_12': I_12, 'I_pH_aa': I_pH_aa,'I_pH_ac': I_pH_ac,'I_pH_h2': I_pH_h2, 'I_IN_lim': I_IN_lim,'I_h2_fa': I_h2_fa,'I_h2_c4': I_h2_c4,'I_h2_pro': I_h2_pro,'I_nh3': I_nh3}
+            inhibition = pd.concat([inhibition, pd.DataFrame([inhibittemp])], ignore_index=True)
+
+            ################
+
+            S_nh4_ion =  (S_IN - S_nh3)
+            S_co2 =  (S_IC - S_hco3_ion)
+            #pH = - np.log10(S_H_ion)
+
+            # Algebraic equations 
+
+            p_gas_h2 =  (S_gas_h2 * R * T_op / 16)
+            p_gas_ch4 =  (S_gas_ch4 * R * T_op / 64)
+            p_gas_co2 =  (S_gas_co2 * R * T_op)
+        
+            Rho_T_8 =  (k_L_a * (S_h2 - 16 * K_H_h2 * p_gas_h2))
+            Rho_T_9 =  (k_L_a * (S_ch4 - 64 * K_H_ch4 * p_gas_ch4))
+            Rho_T_10 =  (k_L_a * (S_co2 - K_H_co2 * p_gas_co2))
+        
+            p_gas=  (p_gas_h2 + p_gas_ch4 + p_gas_co2 + p_gas_h2o)
+            q_gas =  (k_p * (p_gas- p_atm))
+        
+            #q_gas= (R*T_op/(p_atm-p_gas_h2o))*V_liq*(Rho_T_8/16+Rho_T_9/64+Rho_T_10)
+        
+            if q_gas < 0:    
+                q_gas = 0
+        
+            q_ch4 = q_gas * (p_gas_ch4/p_gas) # methane flow
+            q_co2 = q_gas * (p_gas_co2/p_gas) # co2 flow
+            q_h2 = q_gas * (p_gas_h2/p_gas) # h2 flow
 
-        # Flow-weighted mixing using helper ( (q_in * fresh + q_r * effluent)/q_ad )
-        mixed_influent = mix_influent_with_recycle(new_influent, effluent_state, q_in, q_r, q_ad)
+            if q_ch4 < 0:
+                q_ch4 = q_gas * (p_gas_co2/p_gas) # co2 flow
+            q_h2 = q_gas * (p_gas_h2/p_gas) # h2 flow
 
-        # Record history (add time for traceability)
-        rec = {'time': u}
-        rec.update(mixed_influent)
-        mixed_influent_records.append(rec)
+            if q_ch4 < 0:
+                q_ch4 = 0
 
+            total_ch4 = total_ch4 + q_ch4 
 
-        # Update state_input for this time step
-        state_input = [mixed_influent['S_su_in'], mixed_influent['S_aa_in'], mixed_influent['S_fa_in'], mixed_influent['S_va_in'], mixed_influent['S_bu_in'], mixed_influent['S_pro_in'], 
-                       mixed_influent['S_ac_in'], mixed_influent['S_h2_in'], mixed_influent['S_ch4_in'], mixed_influent['S_IC_in'], mixed_influent['S_IN_in'], mixed_influent['S_I_in'],
-                       mixed_influent['X_xc1_in'], mixed_influent['X_ch1_in'], mixed_influent['X_pr1_in'], mixed_influent['X_li1_in'], mixed_influent['X_xc2_in'], 
-                       mixed_influent['X_ch2_in'], mixed_influent['X_pr2_in'], mixed_influent['X_li2_in'], mixed_influent['X_su_in'], mixed_influent['X_aa_in'], 
-                       mixed_influent['X_fa_in'], mixed_influent['X_c4_in'], mixed_influent['X_pro_in'], mixed_influent['X_ac_in'], mixed_influent['X_h2_in'], 
-                       mixed_influent['X_I_in'], mixed_influent['S_cation_in'], mixed_influent['S_anion_in']]
+            flowtemp = {'p_gas_h2': p_gas_h2,'p_gas_ch4': p_gas_ch4,'p_gas_co2': p_gas_co2,'p_gas': p_gas,'q_gas': q_gas, 'q_ch4': q_ch4, 'total_ch4': total_ch4, 'p_gas_ch4/p_gas': p_gas_ch4/p_gas,'p_gas_co2/p_gas': p_gas_co2/p_gas, 'ch4_yield':q_ch4/VS_in,  'co2_yield':q_co2/VS_in, 'cumulative_methane_yield': total_ch4 / VS_in, 'h2_yield':q_h2/VS_in}
+            gasflow = pd.concat([gasflow, pd.DataFrame([flowtemp])], ignore_index=True)
 
-        # Span for next time step
-        tstep = [t0, u]
+            total_ch4 = total_ch4 + q_ch4     
+        
+            ############
+        
+            ionstemp = {'S_cation': S_cation,'S_anion': S_anion,'S_H_ion': S_H_ion,'S_va_ion': S_va_ion,'S_bu_ion': S_bu_ion,'S_pro_ion': S_pro_ion,'S_ac_ion': S_ac_ion,'S_hco3_ion': S_hco3_ion,'S_nh4_ion': S_nh4_ion}
+            ions = pd.concat([ions, pd.DataFrame([ionstemp])], ignore_index=True)
 
-        # ...existing simulation code...
-        # After simulation step, update effluent_state with new effluent values (from output)
-        # effluent_state = ... (update with output from simulation)
+            ##############
 
-        # Build current state vector (y0)
-        current_state = [S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I,
-                        X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2,
-                        X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion,
-                        S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion,
+            # Rebuild and append state (store pH later)
+            state_zero = [S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I, \
+                        X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2, \
+                        X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion, \
+                        S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion, \
                         S_gas_h2, S_gas_ch4, S_gas_co2]
 
-        # ODE integration
-        sim = simulate(tstep, current_state, state_input, solvermethod,params)
-
-        # Unpack solution arrays
-        (sim_S_su, sim_S_aa, sim_S_fa, sim_S_va, sim_S_bu, sim_S_pro, sim_S_ac, sim_S_h2, sim_S_ch4, sim_S_IC, sim_S_IN, sim_S_I,
-        sim_X_xc1, sim_X_ch1, sim_X_pr1, sim_X_li1, sim_X_xc2, sim_X_ch2, sim_X_pr2, sim_X_li2,
-        sim_X_su, sim_X_aa, sim_X_fa, sim_X_c4, sim_X_pro, sim_X_ac, sim_X_h2, sim_X_I, sim_S_cation, sim_S_anion,
-        sim_S_H_ion, sim_S_va_ion, sim_S_bu_ion, sim_S_pro_ion, sim_S_ac_ion, sim_S_hco3_ion, sim_S_co2, sim_S_nh3, sim_S_nh4_ion,
-        sim_S_gas_h2, sim_S_gas_ch4, sim_S_gas_co2) = sim
-
-        # Take last values
-        S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I, \
-        X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2, \
-        X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion, \
-        S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion, \
-        S_gas_h2, S_gas_ch4, S_gas_co2 = \
-            sim_S_su[-1], sim_S_aa[-1], sim_S_fa[-1], sim_S_va[-1], sim_S_bu[-1], sim_S_pro[-1], sim_S_ac[-1], sim_S_h2[-1], sim_S_ch4[-1], sim_S_IC[-1], sim_S_IN[-1], sim_S_I[-1], \
-            sim_X_xc1[-1], sim_X_ch1[-1], sim_X_pr1[-1], sim_X_li1[-1], sim_X_xc2[-1], sim_X_ch2[-1], sim_X_pr2[-1], sim_X_li2[-1], \
-            sim_X_su[-1], sim_X_aa[-1], sim_X_fa[-1], sim_X_c4[-1], sim_X_pro[-1], sim_X_ac[-1], sim_X_h2[-1], sim_X_I[-1], sim_S_cation[-1], sim_S_anion[-1], \
-            sim_S_H_ion[-1], sim_S_va_ion[-1], sim_S_bu_ion[-1], sim_S_pro_ion[-1], sim_S_ac_ion[-1], sim_S_hco3_ion[-1], sim_S_co2[-1], sim_S_nh3[-1], sim_S_nh4_ion[-1], \
-            sim_S_gas_h2[-1], sim_S_gas_ch4[-1], sim_S_gas_co2[-1]
-
-        # Algebraic update (pure DAE) - pass state, receive corrected state & pH
-        state_for_dae = [S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I,
-                        X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2,
-                        X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion,
-                        S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion,
-                        S_gas_h2, S_gas_ch4, S_gas_co2]
-        
-        
-        new_state, pH_value = DAESolve(state_for_dae,state_input,params)
-
-
-        # Overwrite updated components from new_state (others unchanged)
-        S_h2 = new_state[7]
-        S_H_ion = new_state[30]
-        S_va_ion = new_state[31]
-        S_bu_ion = new_state[32]
-        S_pro_ion = new_state[33]
-        S_ac_ion = new_state[34]
-        S_hco3_ion = new_state[35]
-        S_co2 = new_state[36]
-        S_nh3 = new_state[37]
-        S_nh4_ion = new_state[38]
-        # pH_value available if needed for direct storage/inhibition calcs
-
-        prevS_H_ion = S_H_ion
-
-         # Base inhibition factors via shared utility
-
-
-        inhib = compute_inhibition_factors(
-            S_H_ion=S_H_ion,
-            S_IN=S_IN,
-            S_h2=S_h2,
-            S_nh3=S_nh3,
-            params=params,
-            disable_inhibition=disable_inhibition,
-        )
-
-        I_pH_aa = inhib['I_pH_aa']
-        I_pH_ac = inhib['I_pH_ac']
-        I_pH_h2 = inhib['I_pH_h2']
-        I_IN_lim = inhib['I_IN_lim']
-        I_h2_fa = inhib['I_h2_fa']
-        I_h2_c4 = inhib['I_h2_c4']
-        I_h2_pro = inhib['I_h2_pro']
-        I_nh3 = inhib['I_nh3']
-
-        I_5 = inhib['I_5']
-        I_6 = inhib['I_6']
-        I_7 = inhib['I_7']
-        I_8 = inhib['I_8']
-        I_9 = inhib['I_9']
-        I_10 = inhib['I_10']
-        I_11 = inhib['I_11']
-        I_12 = inhib['I_12']
-
-        # Store all computed inhibition factors for consistency and maintainability
-        inhibittemp = {'I_5': I_5,'I_6': I_6,'I_7': I_7,'I_8': I_8,'I_9': I_9,'I_10': I_10,'I_11': I_11,'I_12': I_12, 'I_pH_aa': I_pH_aa,'I_pH_ac': I_pH_ac,'I_pH_h2': I_pH_h2, 'I_IN_lim': I_IN_lim,'I_h2_fa': I_h2_fa,'I_h2_c4': I_h2_c4,'I_h2_pro': I_h2_pro,'I_nh3': I_nh3}
-        inhibition = pd.concat([inhibition, pd.DataFrame([inhibittemp])], ignore_index=True)
-
-        ################
-
-        S_nh4_ion =  (S_IN - S_nh3)
-        S_co2 =  (S_IC - S_hco3_ion)
-        #pH = - np.log10(S_H_ion)
-
-        # Algebraic equations 
+            if sens is not None:
+                out_sens = output_sensitivities(sens, state_zero, S_y, q_out, T_op)
+                for key in sens_records:
+                    sens_records[key].append(out_sens[key])
+                sens_trajectory.append(S_y.copy())
+
+            dfstate_zero = pd.DataFrame([state_zero], columns=columns)
+            simulate_results = pd.concat([simulate_results, dfstate_zero], ignore_index=True)
+            q_out_records.append(q_out)
+            if monitor is not None:
+                monitor_record(monitor, u, state_zero)
+            if writer is not None:
+                row = dict(zip(columns, state_zero))
+                row['pH'] = -np.log10(S_H_ion)
+                append_row(writer, 'state', dict(time=u, **row))
+                append_row(writer, 'gasflow', dict(time=u, **flowtemp))
+                append_row(writer, 'inhibition', dict(time=u, **inhibittemp))
+                append_row(writer, 'mixed_influent', rec)
+            if verbose:
+                print(u)
+            t0 = u 
+
+            if stop_condition is not None and stop_condition(u, state_zero):
+                # Infeasible / unwanted trajectory: keep what was simulated so far
+                aborted = True
+                t = t[:len(simulate_results)]
+                break
+
+        # End of time loop
+        ##############################
 
         p_gas_h2 =  (S_gas_h2 * R * T_op / 16)
         p_gas_ch4 =  (S_gas_ch4 * R * T_op / 64)
         p_gas_co2 =  (S_gas_co2 * R * T_op)
-        
         Rho_T_8 =  (k_L_a * (S_h2 - 16 * K_H_h2 * p_gas_h2))
         Rho_T_9 =  (k_L_a * (S_ch4 - 64 * K_H_ch4 * p_gas_ch4))
         Rho_T_10 =  (k_L_a * (S_co2 - K_H_co2 * p_gas_co2))
-        
+                
         p_gas=  (p_gas_h2 + p_gas_ch4 + p_gas_co2 + p_gas_h2o)
         q_gas =  (k_p * (p_gas- p_atm))
-        
+
         #q_gas= (R*T_op/(p_atm-p_gas_h2o))*V_liq*(Rho_T_8/16+Rho_T_9/64+Rho_T_10)
-        
+
         if q_gas < 0:    
             q_gas = 0
-        
-        q_ch4 = q_gas * (p_gas_ch4/p_gas) # methane flow
-        q_co2 = q_gas * (p_gas_co2/p_gas) # co2 flow
-        q_h2 = q_gas * (p_gas_h2/p_gas) # h2 flow
-
-        if q_ch4 < 0:
-            q_ch4 = q_gas * (p_gas_co2/p_gas) # co2 flow
-        q_h2 = q_gas * (p_gas_h2/p_gas) # h2 flow
 
+        q_ch4 = q_gas * (p_gas_ch4/p_gas) # methane flow
         if q_ch4 < 0:
             q_ch4 = 0
 
-        total_ch4 = total_ch4 + q_ch4 
-
-        flowtemp = {'p_gas_h2': p_gas_h2,'p_gas_ch4': p_gas_ch4,'p_gas_co2': p_gas_co2,'p_gas': p_gas,'q_gas': q_gas, 'q_ch4': q_ch4, 'total_ch4': total_ch4, 'p_gas_ch4/p_gas': p_gas_ch4/p_gas,'p_gas_co2/p_gas': p_gas_co2/p_gas, 'ch4_yield':q_ch4/VS_in,  'co2_yield':q_co2/VS_in, 'cumulative_methane_yield': total_ch4 / VS_in, 'h2_yield':q_h2/VS_in}
-        gasflow = pd.concat([gasflow, pd.DataFrame([flowtemp])], ignore_index=True)
-
-        total_ch4 = total_ch4 + q_ch4     
-        
-        ############
-        
-        ionstemp = {'S_cation': S_cation,'S_anion': S_anion,'S_H_ion': S_H_ion,'S_va_ion': S_va_ion,'S_bu_ion': S_bu_ion,'S_pro_ion': S_pro_ion,'S_ac_ion': S_ac_ion,'S_hco3_ion': S_hco3_ion,'S_nh4_ion': S_nh4_ion}
-        ions = pd.concat([ions, pd.DataFrame([ionstemp])], ignore_index=True)
-
-        ##############
-
-        # Rebuild and append state (store pH later)
-        state_zero = [S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I, \
-                    X_xc1, X_ch1, X_pr1, X_li1, X_xc2, X_ch2, X_pr2, X_li2, \
-                    X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, S_cation, S_anion, \
-                    S_H_ion, S_va_ion, S_bu_ion, S_pro_ion, S_ac_ion, S_hco3_ion, S_co2, S_nh3, S_nh4_ion, \
-                    S_gas_h2, S_gas_ch4, S_gas_co2]
-
-        dfstate_zero = pd.DataFrame([state_zero], columns=columns)
-        simulate_results = pd.concat([simulate_results, dfstate_zero], ignore_index=True)
-        print(u)
-        t0 = u 
-
-    # End of time loop
-    ##############################
-
-    p_gas_h2 =  (S_gas_h2 * R * T_op / 16)
-    p_gas_ch4 =  (S_gas_ch4 * R * T_op / 64)
-    p_gas_co2 =  (S_gas_co2 * R * T_op)
-    Rho_T_8 =  (k_L_a * (S_h2 - 16 * K_H_h2 * p_gas_h2))
-    Rho_T_9 =  (k_L_a * (S_ch4 - 64 * K_H_ch4 * p_gas_ch4))
-    Rho_T_10 =  (k_L_a * (S_co2 - K_H_co2 * p_gas_co2))
-                
-    p_gas=  (p_gas_h2 + p_gas_ch4 + p_gas_co2 + p_gas_h2o)
-    q_gas =  (k_p * (p_gas- p_atm))
-
-    #q_gas= (R*T_op/(p_atm-p_gas_h2o))*V_liq*(Rho_T_8/16+Rho_T_9/64+Rho_T_10)
-
-    if q_gas < 0:    
-        q_gas = 0
-
-    q_ch4 = q_gas * (p_gas_ch4/p_gas) # methane flow
-    if q_ch4 < 0:
-        q_ch4 = 0
-
-    phlogarray = -1 * np.log10(simulate_results['pH'])
-    simulate_results['pH'] = phlogarray
+        phlogarray = -1 * np.log10(simulate_results['pH'])
+        simulate_results['pH'] = phlogarray
             
 
-    VS_out=get_VSS(simulate_results.iloc[-1],q_out)
-
-    VS_reduction=(VS_in-VS_out)*100/VS_in
+        VS_out=get_VSS(simulate_results.iloc[-1],q_out)
+
+        VS_reduction=(VS_in-VS_out)*100/VS_in
+
+        # Effluent VS at every output step (one dot product over the trajectory)
+        VS_out_history = get_VSS_array(simulate_results.to_numpy(), np.array(q_out_records), columns)
+        VSS_history = pd.DataFrame({'VS_out': VS_out_history, 'VS_reduction': (VS_in - VS_out_history) * 100 / VS_in})
+
+        sensitivity_results = None
+        if sens is not None:
+            # Rows align with result['u']; the t=0 row is zero for q_ch4 (no gas recorded yet) and pH / VS_out
+            # (the initial state does not depend on the parameters)
+            zero = np.zeros(len(sens['names']))
+            sensitivity_results = {
+                'names': sens['names'],
+                'q_ch4': pd.DataFrame(sens_records['q_ch4'], columns=sens['names']),
+                'pH': pd.DataFrame([zero] + sens_records['pH'], columns=sens['names']),
+                'VS_out': pd.DataFrame([zero] + sens_records['VS_out'], columns=sens['names']),
+                'state': pd.DataFrame(S_y, index=columns, columns=sens['names']),
+                # dy/dp at every output step, shape (len(u), 42, k); the 'pH' row is d(S_H_ion)/dp
+                'trajectory': np.array(sens_trajectory),
+            }
+
+        if writer is not None:
+            update_metadata(writer, VS_out=VS_out, VS_reduction=VS_reduction,
+                            biomethane_yield=q_ch4 / VS_in, cumulative_methane_yield=total_ch4 / VS_in,
+                            aborted=aborted)
+    except BaseException as exc:
+        if writer is not None:
+            update_metadata(writer, aborted=True, error=f'{type(exc).__name__}: {exc}')
+        raise
+    finally:
+        if writer is not None:
+            close_writer(writer)
 
     return {
         "new_influent": new_influent,
         "VS_reduction": VS_reduction,
         "VS_out": VS_out,
+        "VS_out_history": VSS_history,
         "simulate_results": simulate_results,
         "gasflow": gasflow,
         "inhibition": inhibition,
         "mixed_influent_history": pd.DataFrame(mixed_influent_records),
+        "control": pd.DataFrame(control_records) if controller is not None else None,
         "u": t,
+        "aborted": aborted,
+        "sensitivities": sensitivity_results,
+        "mass_balance": monitor_result(monitor) if monitor is not None else None,
         "S_su": S_su,
         "S_aa": S_aa,
         "S_fa": S_fa,
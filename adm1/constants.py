@@ -0,0 +1,19 @@
+# ADM1 state-vector layout shared by the ODE kernel, the DAE solver and the
+# orchestration layer. The order matches the tuples returned by ADM1_ODE and
+# the `state_zero` lists built in coAD.py.
+
+STATE_NAMES = (
+    "S_su", "S_aa", "S_fa", "S_va", "S_bu", "S_pro", "S_ac", "S_h2", "S_ch4", "S_IC", "S_IN", "S_I",
+    "X_xc1", "X_ch1", "X_pr1", "X_li1", "X_xc2", "X_ch2", "X_pr2", "X_li2",
+    "X_su", "X_aa", "X_fa", "X_c4", "X_pro", "X_ac", "X_h2", "X_I", "S_cation", "S_anion",
+    "S_H_ion", "S_va_ion", "S_bu_ion", "S_pro_ion", "S_ac_ion", "S_hco3_ion", "S_co2", "S_nh3", "S_nh4_ion",
+    "S_gas_h2", "S_gas_ch4", "S_gas_co2",
+)
+
+# Influent (feed) vector layout: the first 30 states with an `_in` suffix
+INFLUENT_NAMES = tuple(name + "_in" for name in STATE_NAMES[:30])
+
+STATE_INDEX = {name: i for i, name in enumerate(STATE_NAMES)}
+
+N_STATES = len(STATE_NAMES)      # 42
+N_INFLUENT = len(INFLUENT_NAMES)  # 30
@@ -1,5 +1,4 @@
 import numpy as np
-from adm1.params import *
 
 
 # Pure DAE solver. It DOES NOT read or mutate module-level state.
@@ -9,8 +8,18 @@ from adm1.params import *
 # Function for DAE equations adopted from the Rosen et al (2006) BSM2 report bmadm1_report
 
 def DAESolve(state, state_input, params):
-    for k, v in params.items():
-        globals()[k] = v
+    # Parameters are read into locals so concurrent calls never share state
+    p = params
+    K_a_va, K_a_bu, K_a_pro, K_a_ac = p['K_a_va'], p['K_a_bu'], p['K_a_pro'], p['K_a_ac']
+    K_a_co2, K_a_IN, K_w = p['K_a_co2'], p['K_a_IN'], p['K_w']
+    k_m_su, K_S_su, Y_su, f_h2_su = p['k_m_su'], p['K_S_su'], p['Y_su'], p['f_h2_su']
+    k_m_aa, K_S_aa, Y_aa, f_h2_aa = p['k_m_aa'], p['K_S_aa'], p['Y_aa'], p['f_h2_aa']
+    k_m_fa, K_S_fa, Y_fa = p['k_m_fa'], p['K_S_fa'], p['Y_fa']
+    k_m_c4, K_S_c4, Y_c4 = p['k_m_c4'], p['K_S_c4'], p['Y_c4']
+    k_m_pro, K_S_pro, Y_pro = p['k_m_pro'], p['K_S_pro'], p['Y_pro']
+    k_m_h2, K_S_h2 = p['k_m_h2'], p['K_S_h2']
+    R, T_ad, k_L_a, K_H_h2 = p['R'], p['T_ad'], p['k_L_a'], p['K_H_h2']
+    q_ad, V_liq = p['q_ad'], p['V_liq']
 
     S_su_in = state_input[0]
     S_aa_in = state_input[1]
@@ -0,0 +1,325 @@
+"""
+Monte Carlo uncertainty propagation for ADM1_coAD with batched ensembles.
+
+Kinetic parameters (and optionally the feed strength) are drawn by Latin
+hypercube sampling; each batch of members is advanced as one vectorized
+reactor ensemble and folded into streaming statistics, so memory does not
+grow with the number of members.
+
+Contract:
+- simulate_batch(scenario, names, values, influent_factors=None) advances
+  len(values) reactors together and returns their q_ch4/pH trajectories and
+  end-of-run methane yield and VS reduction.
+- sample_batch(problem, batch, batch_size, seed, influent_spread) -> (values,
+  influent_factors) for one batch; the stream of batch b is seeded from
+  SeedSequence(seed).spawn(...)[b], so results do not depend on the number
+  of workers or on the order in which batches finish.
+- run_ensemble(base_scenario, n_members, ...) -> quantile bands (P10/P50/P90
+  by default) and means over time, plus quantiles of the scalar outputs.
+- p2_new / p2_update / p2_value: P-square streaming quantile estimator
+  (Jain & Chlamtac, 1985), vectorized over the time axis.
+
+Notes:
+- All members of a batch share one stoichiometric matrix, so only rate
+  parameters (those that leave build_petersen's S and D unchanged, e.g.
+  k_m_*, K_S_*, k_dis*, k_hyd_*, K_I_*) can be sampled; others raise
+  ValueError.
+- influent_factors scale the particulate feed (X_xc1..X_li2), i.e. the
+  uncertain strength of the co-substrates at fixed flows.
+- One solve_ivp call integrates the whole batch (the step size follows the
+  most demanding member); DAESolve is applied member by member.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.integrate import solve_ivp
+from scipy.stats import qmc
+
+from adm1.coAD import setup_scenario
+from adm1.constants import STATE_NAMES, N_INFLUENT
+from adm1.dae import DAESolve
+from adm1.influent import influent_array, influent_matrix
+from adm1.params import get_VSS_array
+from adm1.petersen import build_petersen, ADM1_ODE_petersen
+from adm1.sensitivity import make_problem
+
+
+SETUP_KEYS = ("q_ad_init", "density", "VS_per_TS_PS", "VS_per_TS_SS", "TS_fraction", "mixing_ratio",
+              "mixing_ratio2", "OLR", "T_ad", "T_base", "recycle_ratio", "influent", "initials", "VSS",
+              "V_liq", "param_overrides", "disable_inhibition", "Batch_process")
+TIMESTEPS_PER_DAY = {"Day(s)": 1, "Hour(s)": 24, "15 Minute(s)": 96}
+# Particulate feed states scaled by influent_factors
+FEED_SLICE = slice(12, 20)
+
+
+def _check_rate_parameters(params: Dict[str, Any], names: Sequence[str]) -> None:
+    model = build_petersen(params)
+    for name in names:
+        trial = build_petersen(dict(params, **{name: float(params[name]) * 1.1 + 1e-12}))
+        if (trial["S"] != model["S"]).nnz or not np.array_equal(trial["D"], model["D"]):
+            raise ValueError(f"{name} changes the stoichiometry or dilution; only rate parameters can be batched")
+
+
+def simulate_batch(scenario: Dict[str, Any], names: Sequence[str], values: np.ndarray,
+                   influent_factors: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Advance len(values) reactors of `scenario` as one ensemble.
+
+    Parameters:
+        scenario (Dict[str, Any]): ADM1_coAD keyword arguments.
+        names (Sequence[str]): Sampled parameter names.
+        values (np.ndarray): (B, k) parameter values, one row per member.
+        influent_factors (Optional[np.ndarray]): (B,) feed-strength multipliers.
+
+    Returns:
+        Dict[str, Any]: time (T,), q_ch4 and pH (T, B) after each output step,
+        methane_yield and VS_reduction (B,) at the end of the run.
+    """
+    names = list(names)
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    B = len(values)
+    setup = setup_scenario(**{k: scenario.get(k) for k in SETUP_KEYS})
+    params, reactor = setup["params"], setup["reactor"]
+    _check_rate_parameters(params, names)
+
+    member_values = {n: values[:, j] for j, n in enumerate(names)}
+    model = dict(build_petersen(params), params=dict(params, **member_values))
+    member_params = [dict(params, **{n: float(values[i, j]) for j, n in enumerate(names)}) for i in range(B)]
+
+    if scenario.get("influent") is None:
+        # Default feed: built for all members at once in the (30, B) layout
+        fresh = influent_matrix(np.full(B, scenario["mixing_ratio"]), scenario["mixing_ratio2"],
+                                q_in=reactor["q_in"], q_ad_init=scenario["q_ad_init"]).T.copy()
+    else:
+        fresh = np.tile(influent_array(setup["new_influent"])[:, None], (1, B))
+    if influent_factors is not None:
+        fresh[FEED_SLICE] *= np.asarray(influent_factors, dtype=float)[None, :]
+    q_in, q_r, q_ad = reactor["q_in"], reactor["q_r"], reactor["q_ad"]
+
+    initial = setup["initial_state"]
+    Y = np.tile(np.array([initial[n] for n in STATE_NAMES], dtype=float)[:, None], (1, B))
+
+    days = scenario["days"]
+    t = np.linspace(0, days, days * TIMESTEPS_PER_DAY[scenario["timesteps"]])
+    RT = params["R"] * scenario["T_op"]
+    k_p = model["params"]["k_p"]
+
+    def rhs(_t, z, y_in):
+        return ADM1_ODE_petersen(_t, z.reshape(-1, B), y_in, model).ravel()
+
+    q_ch4 = np.empty((len(t) - 1, B))
+    pH = np.empty((len(t) - 1, B))
+    for step, (t0, u) in enumerate(zip(t[:-1], t[1:])):
+        y_in = (q_in * fresh + q_r * Y[:N_INFLUENT]) / q_ad if q_ad > 0 else fresh
+        sol = solve_ivp(rhs, [t0, u], Y.ravel(), method="DOP853", args=(y_in,))
+        Y = sol.y[:, -1].reshape(-1, B)
+        for i in range(B):
+            new_state, _ = DAESolve(list(Y[:, i]), list(y_in[:, i]), member_params[i])
+            Y[:, i] = new_state
+
+        p_gas_h2, p_gas_ch4, p_gas_co2 = Y[39] * RT / 16, Y[40] * RT / 64, Y[41] * RT
+        p_gas = p_gas_h2 + p_gas_ch4 + p_gas_co2 + params["p_gas_h2o"]
+        q_gas = np.maximum(k_p * (p_gas - params["p_atm"]), 0.0)
+        q_ch4[step] = np.maximum(q_gas * p_gas_ch4 / p_gas, 0.0)
+        pH[step] = -np.log10(Y[30])
+
+    VS_in = reactor["VS_in"]
+    VS_out = get_VSS_array(Y.T, reactor["q_out"])
+    return {
+        "time": t[1:],
+        "q_ch4": q_ch4,
+        "pH": pH,
+        "methane_yield": q_ch4[-1] / VS_in,
+        "VS_reduction": (VS_in - VS_out) * 100 / VS_in,
+    }
+
+
+def sample_batch(problem: Dict[str, Any], batch: int, batch_size: int, seed: int,
+                 influent_spread: float = 0.0) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Latin hypercube draw for batch number `batch` from its own seeded stream.
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: (batch_size, k) parameter
+        values and (batch_size,) influent factors (None if influent_spread == 0).
+    """
+    # Same stream as SeedSequence(seed).spawn(batch + 1)[batch]
+    stream = np.random.SeedSequence(seed, spawn_key=(batch,))
+    k = len(problem["names"])
+    d = k + (1 if influent_spread > 0 else 0)
+    U = qmc.LatinHypercube(d=d, seed=np.random.default_rng(stream)).random(batch_size)
+    lo, hi = problem["bounds"][:, 0], problem["bounds"][:, 1]
+    values = lo + U[:, :k] * (hi - lo)
+    factors = None
+    if influent_spread > 0:
+        factors = 1.0 + influent_spread * (2.0 * U[:, k] - 1.0)
+    return values, factors
+
+
+def _run_batch(job: Tuple[Dict[str, Any], Dict[str, Any], int, int, int, float]) -> Dict[str, Any]:
+    scenario, problem, batch, batch_size, seed, influent_spread = job
+    values, factors = sample_batch(problem, batch, batch_size, seed, influent_spread)
+    return simulate_batch(scenario, problem["names"], values, factors)
+
+
+# --- Streaming statistics -------------------------------------------------------
+
+def p2_new(p: float, size: int) -> Dict[str, Any]:
+    """P-square estimator of quantile p for `size` parallel series."""
+    return {"p": p, "size": size, "buffer": [], "q": None, "n": None,
+            "np": np.array([0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]),
+            "dn": np.array([0.0, p / 2, p, (1 + p) / 2, 1.0])}
+
+
+def p2_update(est: Dict[str, Any], x: np.ndarray) -> None:
+    """Add one observation per series (x of shape (size,))."""
+    x = np.asarray(x, dtype=float)
+    if est["q"] is None:
+        est["buffer"].append(x)
+        if len(est["buffer"]) == 5:
+            est["q"] = np.sort(np.array(est["buffer"]), axis=0)
+            est["n"] = np.tile(np.arange(5.0)[:, None], (1, est["size"]))
+            est["buffer"] = []
+        return
+
+    q, n = est["q"], est["n"]
+    q[0] = np.minimum(q[0], x)
+    q[4] = np.maximum(q[4], x)
+    k = (x[None, :] >= q[1:4]).sum(axis=0)
+    n += np.arange(5)[:, None] > k[None, :]
+    est["np"] = est["np"] + est["dn"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in (1, 2, 3):
+            d = est["np"][i] - n[i]
+            move = ((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1))
+            if not move.any():
+                continue
+            s = np.sign(d)
+            parabolic = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+            q_next = np.where(s > 0, q[i + 1], q[i - 1])
+            n_next = np.where(s > 0, n[i + 1], n[i - 1])
+            linear = q[i] + s * (q_next - q[i]) / (n_next - n[i])
+            ok = (q[i - 1] < parabolic) & (parabolic < q[i + 1])
+            q[i] = np.where(move, np.where(ok, parabolic, linear), q[i])
+            n[i] = np.where(move, n[i] + s, n[i])
+
+
+def p2_value(est: Dict[str, Any]) -> np.ndarray:
+    """Current quantile estimate per series (exact while fewer than 5 observations)."""
+    if est["q"] is None:
+        if not est["buffer"]:
+            return np.full(est["size"], np.nan)
+        return np.quantile(np.array(est["buffer"]), est["p"], axis=0)
+    return est["q"][2].copy()
+
+
+def _stats_new(quantiles: Sequence[float], size: int) -> Dict[str, Any]:
+    return {"count": 0, "mean": np.zeros(size), "M2": np.zeros(size),
+            "quantiles": {p: p2_new(p, size) for p in quantiles}}
+
+
+def _stats_update(stats: Dict[str, Any], x: np.ndarray) -> None:
+    # Welford running mean / variance and one P-square update per quantile
+    stats["count"] += 1
+    delta = x - stats["mean"]
+    stats["mean"] += delta / stats["count"]
+    stats["M2"] += delta * (x - stats["mean"])
+    for est in stats["quantiles"].values():
+        p2_update(est, x)
+
+
+def _quantile_label(p: float) -> str:
+    return f"P{100 * p:g}"
+
+
+def run_ensemble(
+    base_scenario: Dict[str, Any],
+    n_members: int = 200,
+    batch_size: int = 50,
+    names: Optional[Sequence[str]] = None,
+    spread: float = 0.2,
+    bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+    influent_spread: float = 0.0,
+    quantiles: Sequence[float] = (0.1, 0.5, 0.9),
+    seed: int = 0,
+    executor: str = "process",
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Propagate parameter (and feed-strength) uncertainty to q_ch4, pH, methane yield and VS reduction.
+
+    Parameters:
+        base_scenario (Dict[str, Any]): ADM1_coAD keyword arguments.
+        n_members (int): Ensemble size (rounded up to whole batches).
+        batch_size (int): Members advanced together per simulate_batch call.
+        names, spread, bounds: Sampled parameters and ranges (see sensitivity.make_problem).
+        influent_spread (float): Feed strength drawn uniformly in 1 +- influent_spread.
+        quantiles (Sequence[float]): Quantiles to track.
+        seed (int): Root seed; batch b always uses the b-th spawned stream.
+        executor (str): "process" (batches on a ProcessPoolExecutor) or "serial".
+        max_workers (Optional[int]): Pool size.
+
+    Returns:
+        Dict[str, Any]: {"time", "n_members", "bands": {"q_ch4", "pH"} -> DataFrame
+        of quantiles and mean per time, "summary": DataFrame of quantiles and
+        mean of methane_yield and VS_reduction}.
+    """
+    if executor not in ("serial", "process"):
+        raise ValueError(f"Unknown executor {executor!r}; expected 'serial' or 'process'")
+    problem = make_problem(base_scenario, names=names, spread=spread, bounds=bounds)
+    n_batches = -(-n_members // batch_size)
+    jobs = ((base_scenario, problem, b, batch_size, seed, influent_spread) for b in range(n_batches))
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    time = None
+
+    def _fold(batch_result: Dict[str, Any]) -> None:
+        nonlocal time
+        if time is None:
+            time = batch_result["time"]
+            stats["q_ch4"] = _stats_new(quantiles, len(time))
+            stats["pH"] = _stats_new(quantiles, len(time))
+            stats["summary"] = _stats_new(quantiles, 2)
+        for i in range(batch_result["q_ch4"].shape[1]):
+            _stats_update(stats["q_ch4"], batch_result["q_ch4"][:, i])
+            _stats_update(stats["pH"], batch_result["pH"][:, i])
+            _stats_update(stats["summary"], np.array([batch_result["methane_yield"][i],
+                                                      batch_result["VS_reduction"][i]]))
+
+    if executor == "serial":
+        for job in jobs:
+            _fold(_run_batch(job))
+    else:
+        # Bounded window of in-flight batches, folded in batch order for reproducibility
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            window = 2 * (max_workers or os.cpu_count() or 1)
+            pending: deque = deque()
+            for job in jobs:
+                pending.append(pool.submit(_run_batch, job))
+                if len(pending) >= window:
+                    _fold(pending.popleft().result())
+            while pending:
+                _fold(pending.popleft().result())
+
+    def _frame(s: Dict[str, Any], index) -> pd.DataFrame:
+        data = {_quantile_label(p): p2_value(est) for p, est in s["quantiles"].items()}
+        data["mean"] = s["mean"].copy()
+        data["std"] = np.sqrt(s["M2"] / max(s["count"] - 1, 1))
+        return pd.DataFrame(data, index=index)
+
+    return {
+        "time": time,
+        "n_members": stats["summary"]["count"],
+        "bands": {
+            "q_ch4": _frame(stats["q_ch4"], pd.Index(time, name="time")),
+            "pH": _frame(stats["pH"], pd.Index(time, name="time")),
+        },
+        "summary": _frame(stats["summary"], ["methane_yield", "VS_reduction"]),
+    }
@@ -0,0 +1,283 @@
+"""
+Columnar, chunked export of ADM1_coAD trajectories.
+
+A store holds four tables - state, gasflow, inhibition and mixed_influent -
+each with a leading `time` column [d], plus a metadata.json describing the
+run (params hash, parameter set, reactor setup) and the chunk layout.
+
+Contract:
+- open_writer(path, fmt, chunk_rows, metadata) -> writer dict
+  append_row(writer, table, row) buffers a row and flushes every chunk_rows
+  close_writer(writer) flushes the remainder and finalises metadata.json
+- export_result(result, path, ...) writes a finished ADM1_coAD result.
+- read_metadata(path) / read_table(path, table, columns=None, t_start=None,
+  t_end=None) read back; only the requested columns and the chunks that
+  overlap [t_start, t_end] are decompressed.
+
+Formats:
+- "npz" (always available): a directory with one compressed .npz per table
+  chunk, one array member per column. Chunk time ranges are kept in
+  metadata.json so time slices skip whole chunks.
+- "parquet" (requires pyarrow): one .parquet file per table, one row group
+  per chunk; column projection and row-group pruning are done by pyarrow.
+
+Notes:
+- metadata.json is rewritten atomically after each flush, so the chunks of
+  an interrupted run remain readable.
+- ADM1_coAD(..., export_path=...) streams every output step through a writer.
+  The writer is closed even when the run raises (e.g. in a stop_condition or
+  controller hook); the metadata then carries aborted=True and the error.
+- pandas and pyarrow are imported when a table is read or a Parquet store
+  is used, not with the module.
+"""
+
+import json
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+TABLES = ("state", "gasflow", "inhibition", "mixed_influent")
+FORMATS = ("npz", "parquet")
+STORE_VERSION = 1
+METADATA_FILE = "metadata.json"
+
+
+def _arrow():
+    """pyarrow and pyarrow.parquet (optional dependency), imported on first Parquet use."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:  # pragma: no cover - optional dependency
+        return None, None
+    return pa, pq
+
+
+def _check_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {FORMATS}")
+    if fmt == "parquet" and _arrow()[1] is None:
+        raise ValueError("Parquet export requires pyarrow; install it or use fmt='npz'")
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def _write_metadata(writer: Dict[str, Any]) -> None:
+    doc = {
+        "version": STORE_VERSION,
+        "format": writer["format"],
+        "complete": writer["closed"],
+        "metadata": _jsonable(writer["metadata"]),
+        "tables": writer["tables"],
+    }
+    path = os.path.join(writer["path"], METADATA_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(doc, fh, indent=1)
+    os.replace(tmp_path, path)
+
+
+def open_writer(path: str, fmt: str = "npz", chunk_rows: int = 1000,
+                metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Create a store directory and return a writer.
+
+    Parameters:
+        path (str): Store directory (created if missing).
+        fmt (str): "npz" or "parquet".
+        chunk_rows (int): Rows buffered per table before a chunk is written.
+        metadata (Optional[Dict[str, Any]]): Run description stored in metadata.json.
+
+    Returns:
+        Dict[str, Any]: Writer state for append_row/close_writer.
+    """
+    _check_format(fmt)
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be >= 1")
+    os.makedirs(path, exist_ok=True)
+    writer = {
+        "path": path,
+        "format": fmt,
+        "chunk_rows": int(chunk_rows),
+        "metadata": dict(metadata or {}),
+        "tables": {},
+        "buffers": {},
+        "parquet": {},
+        "closed": False,
+    }
+    _write_metadata(writer)
+    return writer
+
+
+def update_metadata(writer: Dict[str, Any], **items: Any) -> None:
+    """Add entries to the run metadata (written on the next flush/close)."""
+    writer["metadata"].update(items)
+
+
+def _flush(writer: Dict[str, Any], table: str) -> None:
+    rows = writer["buffers"].get(table)
+    if not rows:
+        return
+    info = writer["tables"][table]
+    columns = info["columns"]
+    data = {c: np.array([row.get(c, np.nan) for row in rows], dtype=float) for c in columns}
+    t = data["time"]
+    chunk = {"rows": len(rows), "t_min": float(t.min()), "t_max": float(t.max())}
+
+    if writer["format"] == "npz":
+        name = f"{table}-{len(info['chunks']):05d}.npz"
+        np.savez_compressed(os.path.join(writer["path"], name), **data)
+        chunk["file"] = name
+    else:
+        pa, pq = _arrow()
+        arrow_table = pa.table(data)
+        if table not in writer["parquet"]:
+            name = f"{table}.parquet"
+            writer["parquet"][table] = pq.ParquetWriter(
+                os.path.join(writer["path"], name), arrow_table.schema, compression="zstd"
+            )
+            info["file"] = name
+        writer["parquet"][table].write_table(arrow_table, row_group_size=len(rows))
+
+    info["chunks"].append(chunk)
+    writer["buffers"][table] = []
+    _write_metadata(writer)
+
+
+def append_row(writer: Dict[str, Any], table: str, row: Dict[str, float]) -> None:
+    """
+    Buffer one row of `table`; must contain "time".
+
+    The column set of a table is fixed by its first row; later rows are
+    aligned to it (missing keys become NaN, extra keys are dropped).
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table!r}; expected one of {TABLES}")
+    if "time" not in row:
+        raise ValueError("Exported rows need a 'time' entry")
+    if table not in writer["tables"]:
+        columns = ["time"] + [c for c in row if c != "time"]
+        writer["tables"][table] = {"columns": columns, "chunks": []}
+        writer["buffers"][table] = []
+    buffer = writer["buffers"][table]
+    buffer.append(row)
+    if len(buffer) >= writer["chunk_rows"]:
+        _flush(writer, table)
+
+
+def close_writer(writer: Dict[str, Any]) -> None:
+    """Flush all buffers, close open files and mark the store complete."""
+    if writer["closed"]:
+        return
+    for table in list(writer["tables"]):
+        _flush(writer, table)
+    for parquet_writer in writer["parquet"].values():
+        parquet_writer.close()
+    writer["parquet"] = {}
+    writer["closed"] = True
+    _write_metadata(writer)
+
+
+def export_result(result: Dict[str, Any], path: str, fmt: str = "npz", chunk_rows: int = 1000,
+                  metadata: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Write the trajectory tables of a finished ADM1_coAD result.
+
+    Parameters:
+        result (Dict[str, Any]): Return value of ADM1_coAD.
+        path (str): Store directory.
+        fmt (str): "npz" or "parquet".
+        chunk_rows (int): Rows per chunk.
+        metadata (Optional[Dict[str, Any]]): Extra run description.
+
+    Returns:
+        str: The store path.
+    """
+    meta = {k: result[k] for k in ("q_in", "q_in1", "q_in2", "q_ad", "q_out", "HRT", "V_liq",
+                                   "V_gas", "V_ad", "VS_in", "VS_reduction") if k in result}
+    meta.update(metadata or {})
+    writer = open_writer(path, fmt=fmt, chunk_rows=chunk_rows, metadata=meta)
+    t = np.asarray(result["u"], dtype=float)
+    frames = {
+        "state": result["simulate_results"],
+        "gasflow": result["gasflow"],
+        "inhibition": result["inhibition"],
+    }
+    for table, frame in frames.items():
+        frame = frame.reset_index(drop=True)
+        for i, row in enumerate(frame.to_dict("records")):
+            append_row(writer, table, dict(time=t[i], **row))
+    for row in result["mixed_influent_history"].to_dict("records"):
+        append_row(writer, "mixed_influent", row)
+    close_writer(writer)
+    return path
+
+
+def read_metadata(path: str) -> Dict[str, Any]:
+    """Contents of metadata.json of a store."""
+    with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def read_table(path: str, table: str, columns: Optional[Sequence[str]] = None,
+               t_start: Optional[float] = None, t_end: Optional[float] = None) -> "pd.DataFrame":
+    """
+    Read (part of) one table from a store.
+
+    Parameters:
+        path (str): Store directory.
+        table (str): One of TABLES.
+        columns (Optional[Sequence[str]]): Columns to load ("time" is always included).
+        t_start, t_end (Optional[float]): Inclusive time window [d].
+
+    Returns:
+        pd.DataFrame: The selected rows and columns.
+    """
+    meta = read_metadata(path)
+    info = meta["tables"].get(table)
+    if info is None:
+        raise ValueError(f"Table {table!r} not found in {path}")
+    if columns is None:
+        wanted: List[str] = list(info["columns"])
+    else:
+        unknown = [c for c in columns if c not in info["columns"]]
+        if unknown:
+            raise ValueError(f"Unknown columns for table {table!r}: {unknown}")
+        wanted = ["time"] + [c for c in columns if c != "time"]
+    lo = -np.inf if t_start is None else float(t_start)
+    hi = np.inf if t_end is None else float(t_end)
+
+    if meta["format"] == "parquet":
+        pq = _arrow()[1]
+        if pq is None:
+            raise ValueError("Reading a Parquet store requires pyarrow")
+        filters = [("time", ">=", lo), ("time", "<=", hi)]
+        frame = pq.read_table(os.path.join(path, info["file"]), columns=wanted,
+                              filters=filters).to_pandas()
+        return frame.reset_index(drop=True)
+
+    import pandas as pd
+    parts = []
+    for chunk in info["chunks"]:
+        if chunk["t_max"] < lo or chunk["t_min"] > hi:
+            continue
+        with np.load(os.path.join(path, chunk["file"])) as npz:
+            part = pd.DataFrame({c: npz[c] for c in wanted})
+        parts.append(part[(part["time"] >= lo) & (part["time"] <= hi)])
+    if not parts:
+        return pd.DataFrame(columns=wanted, dtype=float)
+    return pd.concat(parts, ignore_index=True)
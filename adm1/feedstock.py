@@ -0,0 +1,279 @@
+"""
+Feedstock library: named substrate characterizations and influents built from recipes.
+
+A feedstock is a dict:
+- "name" (unique), "feed": ADM1 compartment, 1 (X_*1: sludges) or 2 (X_*2:
+  co-substrates);
+- "COD": particulate COD incl. inerts [kg COD/m3] and its fractions "f_ch",
+  "f_pr", "f_li" (and "f_I", default 1 - the others);
+- optional properties "VS_per_TS", "TS_fraction", "density" [tonne/m3],
+  "C_N" (None when unknown), "source";
+- optional "components": absolute *_in concentrations that replace the
+  soluble defaults of get_influent (e.g. {"S_IN_in": 0.05}).
+
+A recipe is a dict {feedstock name: volume proportion}; proportions are
+normalized, so {"primary_sludge": 2, "food_waste": 1} is a 2:1 blend.
+
+Contract:
+- load_library(path) / save_library(library, path) read and write a JSON
+  file (atomic write); a missing file gives default_library().
+- add_feedstock(library, feedstock, replace=False) validates and stores an
+  entry; get_feedstock(library, name) looks it up.
+- find_feedstocks(library, feed=None, **ranges) -> names whose properties
+  lie in the given (low, high) ranges, e.g. C_N=(15, 30).
+- build_influent(library, recipe) -> feed dict in the get_influent format;
+  recipe_properties(library, recipe) -> mixing_ratio (feed-1 share) and the
+  blended VS/TS, TS fraction, density and C/N.
+- recipe_matrix(library, recipes) -> (N, 30) feeds in INFLUENT_NAMES order
+  for a sweep over N recipes (one matrix product).
+
+Notes:
+- The library keeps a column index (name -> row, property columns, per-
+  feedstock component vectors) that is built once when it is loaded or
+  changed, so lookups and sweeps never re-read or re-parse entries.
+- The defaults are derived from the feed characterization in adm1.influent
+  ("primary_sludge", "secondary_sludge", "co_substrate") and the scenario
+  notebooks ("primary_sludge_nb"). get_influent itself is unchanged: its
+  mixing_ratio2 weighting of the sludge totals is specific to that function.
+- The blended C/N weights each feedstock's carbon by its VS mass, so
+  feedstocks without VS_per_TS / TS_fraction / density / C_N make the
+  blend's C/N None.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from adm1.constants import INFLUENT_NAMES, N_INFLUENT
+from adm1.influent import (EXTRA_FEED, FEED1_COD, FEED2_COD, FEED2_FRACTIONS, FEED2_X_I, SLUDGE_FRACTIONS,
+                           SOLUBLE_FEED)
+
+
+LIBRARY_VERSION = 1
+FRACTIONS = ("f_ch", "f_pr", "f_li", "f_I")
+PROPERTIES = ("COD",) + FRACTIONS + ("VS_per_TS", "TS_fraction", "density", "C_N")
+EXTRA_NAMES = tuple(EXTRA_FEED)
+
+# Soluble and ionic feed components of get_influent, shared by all feedstocks
+SOLUBLE_DEFAULTS = SOLUBLE_FEED
+
+_FEED2_TOTAL = FEED2_COD + FEED2_X_I
+
+DEFAULT_FEEDSTOCKS = (
+    {"name": "primary_sludge", "feed": 1, "COD": FEED1_COD,
+     **dict(zip(("f_ch", "f_pr", "f_li"), SLUDGE_FRACTIONS["PS"])),
+     "VS_per_TS": 0.986, "TS_fraction": 0.1, "density": 1.0, "C_N": None, "source": "get_influent"},
+    {"name": "secondary_sludge", "feed": 1, "COD": FEED1_COD,
+     **dict(zip(("f_ch", "f_pr", "f_li"), SLUDGE_FRACTIONS["SS"])),
+     "VS_per_TS": 0.851, "TS_fraction": 0.1, "density": 1.0, "C_N": None, "source": "get_influent"},
+    {"name": "primary_sludge_nb", "feed": 1, "COD": 331.188518, "f_ch": 0.2072, "f_pr": 10 ** -8, "f_li": 0.0829,
+     "VS_per_TS": 0.986, "TS_fraction": 0.1, "density": 1.0, "C_N": None, "source": "scenario_comparison.ipynb"},
+    # Degradable FEED2_COD plus inert FEED2_X_I, as fractions of their sum
+    {"name": "co_substrate", "feed": 2, "COD": _FEED2_TOTAL,
+     **{f: x * FEED2_COD / _FEED2_TOTAL for f, x in zip(("f_ch", "f_pr", "f_li"), FEED2_FRACTIONS)},
+     "VS_per_TS": None, "TS_fraction": None, "density": 1.0, "C_N": None, "source": "get_influent"},
+)
+
+_COL = {name: j for j, name in enumerate(INFLUENT_NAMES)}
+
+
+def _check_feedstock(feedstock: Dict[str, Any]) -> Dict[str, Any]:
+    entry = dict(feedstock)
+    if not entry.get("name"):
+        raise ValueError("Feedstock without a name")
+    if entry.get("feed") not in (1, 2):
+        raise ValueError(f"{entry['name']}: 'feed' must be 1 or 2, got {entry.get('feed')!r}")
+    for key in ("COD", "f_ch", "f_pr", "f_li"):
+        if key not in entry or entry[key] is None or float(entry[key]) < 0:
+            raise ValueError(f"{entry['name']}: '{key}' must be given and >= 0")
+    if entry.get("f_I") is None:
+        entry["f_I"] = 1 - (float(entry["f_ch"]) + float(entry["f_pr"]) + float(entry["f_li"]))
+    total = sum(float(entry[f]) for f in FRACTIONS)
+    if float(entry["f_I"]) < -1e-9 or abs(total - 1) > 1e-6:
+        raise ValueError(f"{entry['name']}: COD fractions must be >= 0 and sum to 1, got {total}")
+    unknown = [k for k in entry.get("components", {}) if k not in INFLUENT_NAMES and k not in EXTRA_NAMES]
+    if unknown:
+        raise ValueError(f"{entry['name']}: unknown components {unknown}")
+    for key in ("VS_per_TS", "TS_fraction", "density", "C_N"):
+        entry.setdefault(key, None)
+    return entry
+
+
+def _component_vector(entry: Dict[str, Any]) -> np.ndarray:
+    """Feed of one feedstock on its own, in INFLUENT_NAMES order."""
+    feed = dict(SOLUBLE_DEFAULTS, **{k: v for k, v in entry.get("components", {}).items() if k in _COL})
+    y = np.zeros(N_INFLUENT)
+    for name, value in feed.items():
+        y[_COL[name]] = float(value)
+    k, COD = entry["feed"], float(entry["COD"])
+    y[_COL[f"X_ch{k}_in"]] = float(entry["f_ch"]) * COD
+    y[_COL[f"X_pr{k}_in"]] = float(entry["f_pr"]) * COD
+    y[_COL[f"X_li{k}_in"]] = float(entry["f_li"]) * COD
+    y[_COL["X_I_in"]] = float(entry["f_I"]) * COD
+    return y
+
+
+def _reindex(library: Dict[str, Any]) -> Dict[str, Any]:
+    entries = library["entries"]
+    library["index"] = {
+        "names": {entry["name"]: i for i, entry in enumerate(entries)},
+        "feed": np.array([entry["feed"] for entry in entries], dtype=int),
+        "columns": {key: np.array([np.nan if entry.get(key) is None else float(entry[key]) for entry in entries])
+                    for key in PROPERTIES},
+        "components": np.array([_component_vector(entry) for entry in entries]).reshape(-1, N_INFLUENT),
+    }
+    return library
+
+
+def new_library(feedstocks: Sequence[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """In-memory library holding the given feedstocks."""
+    library = {"version": LIBRARY_VERSION, "entries": []}
+    for feedstock in feedstocks:
+        entry = _check_feedstock(feedstock)
+        if any(e["name"] == entry["name"] for e in library["entries"]):
+            raise ValueError(f"Duplicate feedstock {entry['name']!r}")
+        library["entries"].append(entry)
+    return _reindex(library)
+
+
+def default_library() -> Dict[str, Any]:
+    """Library with the feedstocks built into get_influent and the notebooks."""
+    return new_library(DEFAULT_FEEDSTOCKS)
+
+
+def load_library(path: str) -> Dict[str, Any]:
+    """Load a library from JSON; a missing file gives default_library()."""
+    if not os.path.exists(path):
+        return default_library()
+    with open(path, "r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    if data.get("version") != LIBRARY_VERSION:
+        raise ValueError(f"Unsupported feedstock library version in {path}: {data.get('version')}")
+    return new_library(data["entries"])
+
+
+def save_library(library: Dict[str, Any], path: str) -> None:
+    """Write the library atomically (temporary file + rename); the index is rebuilt on load."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump({"version": library["version"], "entries": library["entries"]}, fh, indent=1)
+    os.replace(tmp_path, path)
+
+
+def add_feedstock(library: Dict[str, Any], feedstock: Dict[str, Any], replace: bool = False) -> None:
+    """Validate and store a feedstock; an existing name needs replace=True."""
+    entry = _check_feedstock(feedstock)
+    i = library["index"]["names"].get(entry["name"])
+    if i is None:
+        library["entries"].append(entry)
+    elif replace:
+        library["entries"][i] = entry
+    else:
+        raise ValueError(f"Feedstock {entry['name']!r} already exists (use replace=True)")
+    _reindex(library)
+
+
+def get_feedstock(library: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """Feedstock entry by name (KeyError if unknown)."""
+    i = library["index"]["names"].get(name)
+    if i is None:
+        raise KeyError(f"Unknown feedstock {name!r}")
+    return library["entries"][i]
+
+
+def find_feedstocks(library: Dict[str, Any], feed: Optional[int] = None,
+                    **ranges: Tuple[Optional[float], Optional[float]]) -> List[str]:
+    """
+    Names of the feedstocks whose properties lie in closed ranges.
+
+    Example: find_feedstocks(lib, feed=2, C_N=(15, 30), VS_per_TS=(0.8, None)).
+    None bounds are open; entries without the property never match its range.
+    """
+    index = library["index"]
+    mask = np.ones(len(library["entries"]), dtype=bool)
+    if feed is not None:
+        mask &= index["feed"] == feed
+    for key, (low, high) in ranges.items():
+        if key not in index["columns"]:
+            raise ValueError(f"Unknown property {key!r}; expected one of {PROPERTIES}")
+        column = index["columns"][key]
+        with np.errstate(invalid="ignore"):
+            mask &= ~np.isnan(column)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+    return [library["entries"][i]["name"] for i in np.flatnonzero(mask)]
+
+
+def _weights(library: Dict[str, Any], recipes: Sequence[Dict[str, float]]) -> np.ndarray:
+    """(N, n_feedstocks) normalized volume proportions."""
+    names = library["index"]["names"]
+    W = np.zeros((len(recipes), len(library["entries"])))
+    for r, recipe in enumerate(recipes):
+        for name, proportion in recipe.items():
+            if name not in names:
+                raise KeyError(f"Unknown feedstock {name!r}")
+            if proportion < 0:
+                raise ValueError(f"Negative proportion for {name!r}")
+            W[r, names[name]] += float(proportion)
+    totals = W.sum(axis=1, keepdims=True)
+    if np.any(totals <= 0):
+        raise ValueError("Every recipe needs a positive total proportion")
+    return W / totals
+
+
+def recipe_matrix(library: Dict[str, Any], recipes: Sequence[Dict[str, float]]) -> np.ndarray:
+    """Fresh feeds of N recipes as (N, 30) in INFLUENT_NAMES order (volume-weighted blend)."""
+    return _weights(library, recipes) @ library["index"]["components"]
+
+
+def build_influent(library: Dict[str, Any], recipe: Dict[str, float]) -> Dict[str, float]:
+    """Feed dict in the get_influent format (usable as ADM1_coAD's `influent`)."""
+    feed = dict(zip(INFLUENT_NAMES, recipe_matrix(library, [recipe])[0].tolist()))
+    W = _weights(library, [recipe])[0]
+    for name in EXTRA_NAMES:
+        values = [float(e.get("components", {}).get(name, 10 ** -5 if name == "S_co2_in" else 0.0))
+                  for e in library["entries"]]
+        feed[name] = float(W @ np.array(values))
+    return feed
+
+
+def recipe_properties(library: Dict[str, Any], recipe: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """
+    Blend properties of a recipe.
+
+    Returns:
+        Dict[str, Optional[float]]: mixing_ratio (volume share of feed-1
+        feedstocks), COD, and volume/mass-weighted VS_per_TS, TS_fraction,
+        density and C_N (None when an ingredient lacks the data).
+    """
+    index = library["index"]
+    W = _weights(library, [recipe])[0]
+    used = W > 0
+    cols = index["columns"]
+
+    def blend(values, weights):
+        if np.any(np.isnan(values[used])) or weights[used].sum() <= 0:
+            return None
+        return float(np.sum(weights[used] * values[used]) / weights[used].sum())
+
+    density = blend(cols["density"], W)
+    TS_mass = W * cols["density"] * cols["TS_fraction"]
+    VS_mass = TS_mass * cols["VS_per_TS"]
+    C_N = None
+    if not np.any(np.isnan(VS_mass[used])) and not np.any(np.isnan(cols["C_N"][used])):
+        # Carbon follows VS; nitrogen = carbon / (C/N)
+        C_N = float(VS_mass[used].sum() / np.sum(VS_mass[used] / cols["C_N"][used]))
+    return {
+        "mixing_ratio": float(W[index["feed"] == 1].sum()),
+        "COD": float(W @ cols["COD"]),
+        "density": density,
+        "TS_fraction": None if density is None else blend(cols["TS_fraction"], W * cols["density"]),
+        "VS_per_TS": None if np.any(np.isnan(TS_mass[used])) else blend(cols["VS_per_TS"], TS_mass),
+        "C_N": C_N,
+    }
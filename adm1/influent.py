@@ -1,6 +1,7 @@
 
 import numpy as np
 from typing import Optional
+from adm1.constants import INFLUENT_NAMES, N_INFLUENT
 from adm1.params import get_VSS 
 
 
@@ -118,6 +119,15 @@ def reactor_setup(
 
 
 
+# --- Flows from the fresh feed flow ---
+def feed_flows(q_in, mixing_ratio, recycle_ratio):
+    """Flows that follow from the fresh feed flow q_in [m^3/d], as in reactor_setup."""
+    q_in1 = mixing_ratio * q_in
+    q_out = q_in / (1 - recycle_ratio)
+    return {'q_in': q_in, 'q_in1': q_in1, 'q_in2': q_in - q_in1, 'q_out': q_out,
+            'q_r': recycle_ratio * q_out, 'q_ad': q_out}
+
+
 # --- Recycle mixing helper ---
 def mix_influent_with_recycle(
     influent: dict,
@@ -157,136 +167,47 @@ def mix_influent_with_recycle(
 
 
 
-# --- Influent scenario function ---
-def get_influent(mixing_ratio,
-                 mixing_ratio2):
-    
-    total_COD=338.33
-
-
-    """Base influent concentrations at reference flow q_ref (if provided).
-
-    If q_ref supplied, concentrations are defined at that flow; later you can call
-    rescale_influent(...) when actual q_in differs.
-    """
-    S_su_in = 0.001
-    S_aa_in = 0.001
-    S_fa_in = 0.001
-    S_va_in = 0.001
-    S_bu_in = 0.001
-    S_pro_in = 0.001
-    S_ac_in = 0.001
-    S_h2_in = 10 ** -8
-    S_ch4_in = 10 ** -5
-    S_co2_in = 10 ** -5
-    S_IC_in = 0.04
-    S_IN_in = 0
-    S_I_in = 0.02
-
-    #Primary sludge
-
-    X_xc1_total_PS = total_COD/(2*mixing_ratio2+1/mixing_ratio2-2)
-    X_ch1_fraction_PS = 0.2041
-    X_pr1_fraction_PS = 0.0045
-    X_li1_fraction_PS = 0.0828
-    X_I1_in_PS= 1-(X_ch1_fraction_PS + X_pr1_fraction_PS + X_li1_fraction_PS)
-
-
-    X_xc1_in_PS = mixing_ratio * 0
-    X_ch1_in_PS = mixing_ratio * X_ch1_fraction_PS * X_xc1_total_PS
-    X_pr1_in_PS = mixing_ratio * X_pr1_fraction_PS * X_xc1_total_PS
-    X_li1_in_PS = mixing_ratio * X_li1_fraction_PS * X_xc1_total_PS
-    X_I1_in_PS  = mixing_ratio * X_I1_in_PS * X_xc1_total_PS
-
-
-    #secondary sludge
-
-    X_xc1_total_SS = X_xc1_total_PS*(1/mixing_ratio2-1)
-    X_ch1_fraction_SS = 0.0647
-    X_pr1_fraction_SS = 0.2822
-    X_li1_fraction_SS = 0.0697
-    X_I1_in_SS= 1-(X_ch1_fraction_SS + X_pr1_fraction_SS + X_li1_fraction_SS)
-
-
-    X_xc1_in_SS = mixing_ratio * 0
-    X_ch1_in_SS = mixing_ratio * X_ch1_fraction_SS * X_xc1_total_SS
-    X_pr1_in_SS = mixing_ratio * X_pr1_fraction_SS * X_xc1_total_SS
-    X_li1_in_SS = mixing_ratio * X_li1_fraction_SS * X_xc1_total_SS
-    X_I1_in_SS  = mixing_ratio * X_I1_in_SS * X_xc1_total_SS
-
-
-
-    # Mixture of primary and secondary sludge
+# --- Feed characterization ---
+# The single source of the default feed: get_influent / get_influent_array
+# build it, and adm1.feedstock's default library is derived from it.
 
-    X_xc1_in = mixing_ratio * (mixing_ratio2*X_xc1_in_PS+(1-mixing_ratio2)*X_xc1_in_SS)
-    X_ch1_in = mixing_ratio * (mixing_ratio2*X_ch1_in_PS+(1-mixing_ratio2)*X_ch1_in_SS)
-    X_pr1_in = mixing_ratio * (mixing_ratio2*X_pr1_in_PS+(1-mixing_ratio2)*X_pr1_in_SS)
-    X_li1_in = mixing_ratio * (mixing_ratio2*X_li1_in_PS+(1-mixing_ratio2)*X_li1_in_SS)
-    X_I1_in= mixing_ratio *(mixing_ratio2*X_I1_in_PS+(1-mixing_ratio2)*X_I1_in_SS)
+# Soluble and ionic components of the fresh feed [kg COD/m3 or kmol/m3]
+SOLUBLE_FEED = {
+    'S_su_in': 0.001, 'S_aa_in': 0.001, 'S_fa_in': 0.001, 'S_va_in': 0.001, 'S_bu_in': 0.001,
+    'S_pro_in': 0.001, 'S_ac_in': 0.001, 'S_h2_in': 10 ** -8, 'S_ch4_in': 10 ** -5, 'S_IC_in': 0.04,
+    'S_IN_in': 0.0, 'S_I_in': 0.02, 'S_cation_in': 0.04, 'S_anion_in': 0.02,
+}
+# Feed entries of get_influent outside the state vector layout
+EXTRA_FEED = {'S_co2_in': 10 ** -5, 'S_nh3_in': 0.0}
 
+# Feed 1: primary (PS) and secondary (SS) sludge. FEED1_COD is split between
+# them by mixing_ratio2 (see get_influent_array); fractions are (ch, pr, li),
+# the rest is inert.
+FEED1_COD = 338.33
+SLUDGE_FRACTIONS = {'PS': (0.2041, 0.0045, 0.0828), 'SS': (0.0647, 0.2822, 0.0697)}
 
+# Feed 2: co-substrate, degradable COD split (ch, pr, li) plus inert X_I
+FEED2_COD = 259.992
+FEED2_FRACTIONS = (0.79, 0.184, 0.026)
+FEED2_X_I = 19.023
 
+# get_influent key order: INFLUENT_NAMES with the extra entries in place
+_FEED_KEYS = (INFLUENT_NAMES[:INFLUENT_NAMES.index('S_ch4_in') + 1] + ('S_co2_in',)
+              + INFLUENT_NAMES[INFLUENT_NAMES.index('S_ch4_in') + 1:] + ('S_nh3_in',))
 
-    variation_factor4 = 1
-    X_xc2_total = variation_factor4 * 259.992
-    X_ch2_fraction = 0.79
-    X_pr2_fraction = 0.184
-    X_li2_fraction = 0.026
 
-    X_xc2_in = (1 - mixing_ratio) * 0
-    X_ch2_in = (1 - mixing_ratio) * X_ch2_fraction * X_xc2_total
-    X_pr2_in = (1 - mixing_ratio) * X_pr2_fraction * X_xc2_total
-    X_li2_in = (1 - mixing_ratio) * X_li2_fraction * X_xc2_total
-    X_I2_in = (1 - mixing_ratio) *19.023
-
-    X_su_in = 0.0
-    X_aa_in = 0.0
-    X_fa_in = 0.0
-    X_c4_in = 0.0
-    X_pro_in = 0.0
-    X_ac_in = 0.0
-    X_h2_in = 0.0
-
-    X_I_in = X_I2_in +X_I1_in
-    S_cation_in = 0.04
-    S_anion_in = 0.02
-    S_nh3_in = 0.0
+# --- Influent scenario function ---
+def get_influent(mixing_ratio, mixing_ratio2):
+    """Base feed dict for one (mixing_ratio, mixing_ratio2) at the reference flow q_ad_init.
 
-    return {
-        'S_su_in': S_su_in,
-        'S_aa_in': S_aa_in,
-        'S_fa_in': S_fa_in,
-        'S_va_in': S_va_in,
-        'S_bu_in': S_bu_in,
-        'S_pro_in': S_pro_in,
-        'S_ac_in': S_ac_in,
-        'S_h2_in': S_h2_in,
-        'S_ch4_in': S_ch4_in,
-        'S_co2_in': S_co2_in,
-        'S_IC_in': S_IC_in,
-        'S_IN_in': S_IN_in,
-        'S_I_in': S_I_in,
-        'X_xc1_in': X_xc1_in,
-        'X_ch1_in': X_ch1_in,
-        'X_pr1_in': X_pr1_in,
-        'X_li1_in': X_li1_in,
-        'X_xc2_in': X_xc2_in,
-        'X_ch2_in': X_ch2_in,
-        'X_pr2_in': X_pr2_in,
-        'X_li2_in': X_li2_in,
-        'X_su_in': X_su_in,
-        'X_aa_in': X_aa_in,
-        'X_fa_in': X_fa_in,
-        'X_c4_in': X_c4_in,
-        'X_pro_in': X_pro_in,
-        'X_ac_in': X_ac_in,
-        'X_h2_in': X_h2_in,
-        'X_I_in': X_I_in,
-        'S_cation_in': S_cation_in,
-        'S_anion_in': S_anion_in,
-        'S_nh3_in': S_nh3_in
-        
-    }
+    Concentrations are defined at q_ad_init; rescale_influent(...) converts
+    them when the actual q_in differs. Same values as get_influent_array.
+    """
+    rows = get_influent_array(mixing_ratio, mixing_ratio2)
+    if len(rows) != 1:
+        raise ValueError("get_influent takes scalar mixing ratios; use get_influent_array for arrays")
+    feed = dict(zip(INFLUENT_NAMES, rows[0].tolist()), **EXTRA_FEED)
+    return {name: feed[name] for name in _FEED_KEYS}
 
 
 def rescale_influent(mixing_ratio,influent, q_in, q_ad_init):
@@ -374,4 +295,105 @@ def rescale_influent(mixing_ratio,influent, q_in, q_ad_init):
     }
 
 
+# --- Array forms of get_influent / rescale_influent ---
+# Rows are scenarios, columns follow INFLUENT_NAMES (the first 30 states of
+# the state vector), so influent_matrix(...).T can be used directly as the
+# (30, N) y_in of the batched Petersen RHS. get_influent is built from
+# get_influent_array; rescale_influent_array mirrors rescale_influent term
+# by term, so a row equals the dict values exactly.
+
+_FEED1 = [INFLUENT_NAMES.index(n) for n in ("X_xc1_in", "X_ch1_in", "X_pr1_in", "X_li1_in")]
+_FEED2 = [INFLUENT_NAMES.index(n) for n in ("X_xc2_in", "X_ch2_in", "X_pr2_in", "X_li2_in")]
 
+
+def _columns(*values):
+    """Broadcast scalars / 1-D arrays to a common length N."""
+    arrays = np.broadcast_arrays(*[np.atleast_1d(np.asarray(v, dtype=float)) for v in values])
+    if arrays[0].ndim != 1:
+        raise ValueError("Expected scalars or 1-D arrays")
+    return arrays
+
+
+def influent_array(influent) -> np.ndarray:
+    """
+    Feed dict(s) as an array in INFLUENT_NAMES order.
+
+    A dict gives shape (30,), a sequence of dicts (N, 30); missing components are 0.
+    """
+    if isinstance(influent, dict):
+        return np.array([float(influent.get(name, 0.0)) for name in INFLUENT_NAMES])
+    return np.array([[float(row.get(name, 0.0)) for name in INFLUENT_NAMES] for row in influent]).reshape(-1, N_INFLUENT)
+
+
+def get_influent_array(mixing_ratio, mixing_ratio2) -> np.ndarray:
+    """
+    get_influent for arrays of (mixing_ratio, mixing_ratio2); returns (N, 30).
+    """
+    mixing_ratio, mixing_ratio2 = _columns(mixing_ratio, mixing_ratio2)
+    if np.any((mixing_ratio2 <= 0) | (mixing_ratio2 > 1)):
+        raise ValueError("mixing_ratio2 must be in (0, 1]")
+    out = np.zeros((len(mixing_ratio), N_INFLUENT))
+    col = {name: j for j, name in enumerate(INFLUENT_NAMES)}
+    for name, value in SOLUBLE_FEED.items():
+        out[:, col[name]] = value
+
+    # Primary (PS) and secondary (SS) sludge in feed 1
+    X_xc1_total_PS = FEED1_COD / (2 * mixing_ratio2 + 1 / mixing_ratio2 - 2)
+    X_xc1_total_SS = X_xc1_total_PS * (1 / mixing_ratio2 - 1)
+    fractions_PS, fractions_SS = SLUDGE_FRACTIONS['PS'], SLUDGE_FRACTIONS['SS']
+    for name, f_PS, f_SS in zip(("X_ch1_in", "X_pr1_in", "X_li1_in"), fractions_PS, fractions_SS):
+        X_PS = mixing_ratio * f_PS * X_xc1_total_PS
+        X_SS = mixing_ratio * f_SS * X_xc1_total_SS
+        out[:, col[name]] = mixing_ratio * (mixing_ratio2 * X_PS + (1 - mixing_ratio2) * X_SS)
+    X_I1_in_PS = mixing_ratio * (1 - sum(fractions_PS)) * X_xc1_total_PS
+    X_I1_in_SS = mixing_ratio * (1 - sum(fractions_SS)) * X_xc1_total_SS
+    X_I1_in = mixing_ratio * (mixing_ratio2 * X_I1_in_PS + (1 - mixing_ratio2) * X_I1_in_SS)
+
+    # Co-substrate in feed 2
+    for name, fraction in zip(("X_ch2_in", "X_pr2_in", "X_li2_in"), FEED2_FRACTIONS):
+        out[:, col[name]] = (1 - mixing_ratio) * fraction * FEED2_COD
+    out[:, col["X_I_in"]] = (1 - mixing_ratio) * FEED2_X_I + X_I1_in
+    return out
+
+
+def rescale_influent_array(mixing_ratio, influent, q_in, q_ad_init) -> np.ndarray:
+    """
+    rescale_influent for arrays: influent (N, 30) or (30,), flows scalars or (N,); returns (N, 30).
+    """
+    influent = np.atleast_2d(np.asarray(influent, dtype=float))
+    mixing_ratio, q_in, q_ad_init, _ = _columns(mixing_ratio, q_in, q_ad_init, np.zeros(len(influent)))
+    n = len(mixing_ratio)
+    if np.any((mixing_ratio <= 0) | (mixing_ratio >= 1)):
+        raise ValueError("mixing_ratio must be in (0, 1)")
+    if np.any(q_in <= 0):
+        raise ValueError("q_in must be > 0")
+    q_in1 = mixing_ratio * q_in
+    # Same operation order as rescale_influent: value * q_ad_init / q_in per feed group
+    numerator = np.repeat(q_ad_init[:, None], N_INFLUENT, axis=1)
+    denominator = np.repeat(q_in[:, None], N_INFLUENT, axis=1)
+    numerator[:, _FEED1] = (mixing_ratio * q_ad_init)[:, None]
+    denominator[:, _FEED1] = q_in1[:, None]
+    numerator[:, _FEED2] = (q_ad_init - mixing_ratio * q_ad_init)[:, None]
+    denominator[:, _FEED2] = (q_in - q_in1)[:, None]
+    return np.broadcast_to(influent, (n, N_INFLUENT)) * numerator / denominator
+
+
+def influent_matrix(mixing_ratio, mixing_ratio2, q_in=None, q_ad_init=None) -> np.ndarray:
+    """
+    Fresh feed for N (mixing_ratio, mixing_ratio2, q_in) combinations in one call.
+
+    Parameters:
+        mixing_ratio, mixing_ratio2: Scalars or (N,) arrays.
+        q_in: Actual fresh feed flows [m3/d] (scalar or (N,)); None returns the base feed.
+        q_ad_init: Reference flow of the base feed (required with q_in).
+
+    Returns:
+        np.ndarray: (N, 30) in INFLUENT_NAMES order, equal to
+        rescale_influent(get_influent(...)) row by row.
+    """
+    base = get_influent_array(mixing_ratio, mixing_ratio2)
+    if q_in is None:
+        return base
+    if q_ad_init is None:
+        raise ValueError("q_ad_init is required to rescale to q_in")
+    return rescale_influent_array(_columns(mixing_ratio, mixing_ratio2)[0], base, q_in, q_ad_init)
@@ -1,15 +1,129 @@
-#from adm1.params import *  # imports model parameters and initial states
+import numpy as np
+
+from .inhibition import compute_inhibition_factors
+from .petersen import carbon_coefficients
+
+
+# Coefficients of ADM1_ODE that depend on the parameter set only. They are
+# computed once per scenario by compile_ode_params and unpacked by the kernel,
+# so each RHS call does no dictionary lookups or parameter arithmetic.
+ODE_COEFF_NAMES = (
+  # rate constants
+  "k_dis1", "k_dis2", "k_hyd_ch1", "k_hyd_pr1", "k_hyd_li1", "k_hyd_ch2", "k_hyd_pr2", "k_hyd_li2",
+  "k_m_su", "K_S_su", "k_m_aa", "K_S_aa", "k_m_fa", "K_S_fa", "k_m_c4", "K_S_c4",
+  "k_m_pro", "K_S_pro", "k_m_ac", "K_S_ac", "k_m_h2", "K_S_h2",
+  "k_dec_X_su", "k_dec_X_aa", "k_dec_X_fa", "k_dec_X_c4", "k_dec_X_pro", "k_dec_X_ac", "k_dec_X_h2",
+  # gas phase: R*T_op/16, R*T_op/64, R*T_op, 16*K_H_h2, 64*K_H_ch4
+  "RT_16", "RT_64", "RT", "p_gas_h2o", "k_p", "p_atm", "k_L_a", "K_H_h2_16", "K_H_ch4_64", "K_H_co2",
+  # dilution rates: q_ad/V_liq, q_in1/(mixing_ratio*V_liq), q_in2/((1-mixing_ratio)*V_liq)
+  "D_ad", "D_feed1", "D_feed2", "gas_ratio", "inv_V_gas", "mr", "mr_c",
+  # yields and product fractions, named after the consuming process (5..12 as Rho_5..Rho_12)
+  "Y_su", "Y_aa", "Y_fa", "Y_c4", "Y_pro", "Y_ac", "Y_h2",
+  "f_fa_li", "f_su_li",
+  "f_va_6", "f_bu_5", "f_bu_6", "f_pro_5", "f_pro_6", "f_pro_8",
+  "f_ac_5", "f_ac_6", "f_ac_7", "f_ac_8", "f_ac_9", "f_ac_10", "f_ch4_11", "f_ch4_12",
+  "f_sI_xc1", "f_sI_xc2", "f_xI_xc1", "f_xI_xc2", "f_ch_xc1", "f_ch_xc2",
+  "f_pr_xc1", "f_pr_xc2", "f_li_xc1", "f_li_xc2",
+  # carbon stoichiometry (eq10)
+  "s_1", "s_2", "s_3", "s_4", "s_5", "s_6", "s_7", "s_8", "s_9", "s_10", "s_11", "s_12", "s_13",
+  # nitrogen stoichiometry (eq11)
+  "N_dis1", "N_dis2", "N_5", "N_6", "N_7", "N_8", "N_10", "N_11", "N_12", "N_dec",
+)
+
+
+def compile_ode_params(params):
+  """
+  Setup phase of ADM1_ODE: collapse a parameter dict into the coefficient vector.
+
+  params must already hold the reactor flows and volumes (q_ad, q_in1, q_in2,
+  V_liq, V_gas, mixing_ratio), i.e. the dict ADM1_coAD passes to simulate().
+  Returns a float array ordered as ODE_COEFF_NAMES.
+  """
+  p = params
+  mr = p["mixing_ratio"]
+  V_liq = p["V_liq"]
+  RT = p["R"] * p["T_op"]
+  N_bac = p["N_bac"]
+  Y = {k: p[k] for k in ("Y_su", "Y_aa", "Y_fa", "Y_c4", "Y_pro", "Y_ac", "Y_h2")}
+  s = carbon_coefficients(p)
+
+  c = {k: p[k] for k in ODE_COEFF_NAMES[:29]}
+  c.update(Y)
+  c.update({k: p[k] for k in ("f_sI_xc1", "f_sI_xc2", "f_xI_xc1", "f_xI_xc2", "f_ch_xc1", "f_ch_xc2",
+                              "f_pr_xc1", "f_pr_xc2", "f_li_xc1", "f_li_xc2", "f_fa_li",
+                              "p_gas_h2o", "k_p", "p_atm", "k_L_a", "K_H_co2")})
+  c.update({
+    "RT_16": RT / 16,
+    "RT_64": RT / 64,
+    "RT": RT,
+    "K_H_h2_16": 16 * p["K_H_h2"],
+    "K_H_ch4_64": 64 * p["K_H_ch4"],
+    "D_ad": p["q_ad"] / V_liq,
+    "D_feed1": p["q_in1"] / (mr * V_liq),
+    "D_feed2": p["q_in2"] / ((1 - mr) * V_liq),
+    "gas_ratio": V_liq / p["V_gas"],
+    "inv_V_gas": 1 / p["V_gas"],
+    "mr": mr,
+    "mr_c": 1 - mr,
+    "f_su_li": 1 - p["f_fa_li"],
+    "f_va_6": (1 - Y["Y_aa"]) * p["f_va_aa"],
+    "f_bu_5": (1 - Y["Y_su"]) * p["f_bu_su"],
+    "f_bu_6": (1 - Y["Y_aa"]) * p["f_bu_aa"],
+    "f_pro_5": (1 - Y["Y_su"]) * p["f_pro_su"],
+    "f_pro_6": (1 - Y["Y_aa"]) * p["f_pro_aa"],
+    "f_pro_8": (1 - Y["Y_c4"]) * 0.54,
+    "f_ac_5": (1 - Y["Y_su"]) * p["f_ac_su"],
+    "f_ac_6": (1 - Y["Y_aa"]) * p["f_ac_aa"],
+    "f_ac_7": (1 - Y["Y_fa"]) * 0.7,
+    "f_ac_8": (1 - Y["Y_c4"]) * 0.31,
+    "f_ac_9": (1 - Y["Y_c4"]) * 0.8,
+    "f_ac_10": (1 - Y["Y_pro"]) * 0.57,
+    "f_ch4_11": 1 - Y["Y_ac"],
+    "f_ch4_12": 1 - Y["Y_h2"],
+    "s_1": s["dis1"], "s_2": s["hyd_ch1"], "s_3": s["hyd_pr1"], "s_4": s["hyd_li1"],
+    "s_5": s["uptake_su"], "s_6": s["uptake_aa"], "s_7": s["uptake_fa"], "s_8": s["uptake_va"],
+    "s_9": s["uptake_bu"], "s_10": s["uptake_pro"], "s_11": s["uptake_ac"], "s_12": s["uptake_h2"],
+    "s_13": s["decay_X_su"],
+    "N_dis1": p["N_xc"] - p["f_xI_xc1"] * p["N_I"] - p["f_sI_xc1"] * p["N_I"] - p["f_pr_xc1"] * p["N_aa"],
+    "N_dis2": p["N_xc"] - p["f_xI_xc2"] * p["N_I"] - p["f_sI_xc2"] * p["N_I"] - p["f_pr_xc2"] * p["N_aa"],
+    "N_5": Y["Y_su"] * N_bac,
+    "N_6": p["N_aa"] - Y["Y_aa"] * N_bac,
+    "N_7": Y["Y_fa"] * N_bac,
+    "N_8": Y["Y_c4"] * N_bac,
+    "N_10": Y["Y_pro"] * N_bac,
+    "N_11": Y["Y_ac"] * N_bac,
+    "N_12": Y["Y_h2"] * N_bac,
+    "N_dec": N_bac - p["N_xc"],
+  })
+  return np.array([c[k] for k in ODE_COEFF_NAMES], dtype=float)
 
 
 # Function for calculating the derivatives related to ADM1 system of equations from the Rosen et al (2006) BSM2 report.
 # state_zero: current dynamic state vector (length 42)
 # state_input: influent / feed state vector (length 30) for this timestep
-
-
-def ADM1_ODE(t, state_zero, state_input,params):
-  for k, v in params.items():
-    globals()[k] = v
-  global S_nh4_ion, S_co2, p_gas, q_gas, q_ch4
+# coeffs: optional output of compile_ode_params(params); computed on the fly when omitted
+
+
+def ADM1_ODE(t, state_zero, state_input,params, coeffs=None):
+  if coeffs is None:
+    coeffs = compile_ode_params(params)
+  # Work on Python floats: scalar arithmetic on numpy float64 is several times slower
+  if isinstance(state_zero, np.ndarray):
+    state_zero = state_zero.tolist()
+  (k_dis1, k_dis2, k_hyd_ch1, k_hyd_pr1, k_hyd_li1, k_hyd_ch2, k_hyd_pr2, k_hyd_li2,
+   k_m_su, K_S_su, k_m_aa, K_S_aa, k_m_fa, K_S_fa, k_m_c4, K_S_c4,
+   k_m_pro, K_S_pro, k_m_ac, K_S_ac, k_m_h2, K_S_h2,
+   k_dec_X_su, k_dec_X_aa, k_dec_X_fa, k_dec_X_c4, k_dec_X_pro, k_dec_X_ac, k_dec_X_h2,
+   RT_16, RT_64, RT, p_gas_h2o, k_p, p_atm, k_L_a, K_H_h2_16, K_H_ch4_64, K_H_co2,
+   D_ad, D_feed1, D_feed2, gas_ratio, inv_V_gas, mr, mr_c,
+   Y_su, Y_aa, Y_fa, Y_c4, Y_pro, Y_ac, Y_h2,
+   f_fa_li, f_su_li,
+   f_va_6, f_bu_5, f_bu_6, f_pro_5, f_pro_6, f_pro_8,
+   f_ac_5, f_ac_6, f_ac_7, f_ac_8, f_ac_9, f_ac_10, f_ch4_11, f_ch4_12,
+   f_sI_xc1, f_sI_xc2, f_xI_xc1, f_xI_xc2, f_ch_xc1, f_ch_xc2,
+   f_pr_xc1, f_pr_xc2, f_li_xc1, f_li_xc2,
+   s_1, s_2, s_3, s_4, s_5, s_6, s_7, s_8, s_9, s_10, s_11, s_12, s_13,
+   N_dis1, N_dis2, N_5, N_6, N_7, N_8, N_10, N_11, N_12, N_dec) = coeffs.tolist()
   S_su = state_zero[0]
   S_aa = state_zero[1]
   S_fa = state_zero[2]
@@ -93,8 +207,6 @@ def ADM1_ODE(t, state_zero, state_input,params):
   S_co2 =  (S_IC - S_hco3_ion)
 
   # Base inhibition factors via shared utility
-  from .inhibition import compute_inhibition_factors
-
   inhib = compute_inhibition_factors(
     S_H_ion=S_H_ion,
     S_IN=S_IN,
@@ -149,18 +261,10 @@ def ADM1_ODE(t, state_zero, state_input,params):
   Rho_18 =  (k_dec_X_ac * X_ac)  # Decay of X_ac
   Rho_19 =  (k_dec_X_h2 * X_h2)  # Decay of X_h2
 
-  # acid-base rates for the BSM2 ODE implementation from Rosen et al (2006) BSM2 report
-  Rho_A_4 =  (k_A_B_va * (S_va_ion * (K_a_va + S_H_ion) - K_a_va * S_va))
-  Rho_A_5 =  (k_A_B_bu * (S_bu_ion * (K_a_bu + S_H_ion) - K_a_bu * S_bu))
-  Rho_A_6 =  (k_A_B_pro * (S_pro_ion * (K_a_pro + S_H_ion) - K_a_pro * S_pro))
-  Rho_A_7 =  (k_A_B_ac * (S_ac_ion * (K_a_ac + S_H_ion) - K_a_ac * S_ac))
-  Rho_A_10 =  (k_A_B_co2 * (S_hco3_ion * (K_a_co2 + S_H_ion) - K_a_co2 * S_IC))
-  Rho_A_11 =  (k_A_B_IN * (S_nh3 * (K_a_IN + S_H_ion) - K_a_IN * S_IN))
-
   # gas phase algebraic equations from Rosen et al (2006) BSM2 report
-  p_gas_h2 =  (S_gas_h2 * R * T_op / 16)
-  p_gas_ch4 =  (S_gas_ch4 * R * T_op / 64)
-  p_gas_co2 =  (S_gas_co2 * R * T_op)
+  p_gas_h2 =  (S_gas_h2 * RT_16)
+  p_gas_ch4 =  (S_gas_ch4 * RT_64)
+  p_gas_co2 =  (S_gas_co2 * RT)
 
 
   p_gas=  (p_gas_h2 + p_gas_ch4 + p_gas_co2 + p_gas_h2o)
@@ -170,59 +274,33 @@ def ADM1_ODE(t, state_zero, state_input,params):
   q_ch4 = q_gas * (p_gas_ch4/p_gas) # methane flow
 
   # gas transfer rates from Rosen et al (2006) BSM2 report
-  Rho_T_8 =  (k_L_a * (S_h2 - 16 * K_H_h2 * p_gas_h2))
-  Rho_T_9 =  (k_L_a * (S_ch4 - 64 * K_H_ch4 * p_gas_ch4))
+  Rho_T_8 =  (k_L_a * (S_h2 - K_H_h2_16 * p_gas_h2))
+  Rho_T_9 =  (k_L_a * (S_ch4 - K_H_ch4_64 * p_gas_ch4))
   Rho_T_10 =  (k_L_a * (S_co2 - K_H_co2 * p_gas_co2))
 
   ##differential equaitons from Rosen et al (2006) BSM2 report
   # differential equations 1 to 12 (soluble matter)
-  diff_S_su = q_ad / V_liq * (S_su_in - S_su) + Rho_2_1 +Rho_2_2 + (1 - f_fa_li) * Rho_4_1 +(1 - f_fa_li) * Rho_4_2 - Rho_5  # eq1
+  diff_S_su = D_ad * (S_su_in - S_su) + Rho_2_1 +Rho_2_2 + f_su_li * Rho_4_1 + f_su_li * Rho_4_2 - Rho_5  # eq1
 
-  diff_S_aa = q_ad / V_liq * (S_aa_in - S_aa) + Rho_3_1+ Rho_3_2 - Rho_6  # eq2
+  diff_S_aa = D_ad * (S_aa_in - S_aa) + Rho_3_1+ Rho_3_2 - Rho_6  # eq2
 
-  diff_S_fa = q_ad / V_liq * (S_fa_in - S_fa) + (f_fa_li * Rho_4_1)+ (f_fa_li * Rho_4_2) - Rho_7  # eq3
+  diff_S_fa = D_ad * (S_fa_in - S_fa) + (f_fa_li * Rho_4_1)+ (f_fa_li * Rho_4_2) - Rho_7  # eq3
 
-  diff_S_va = q_ad / V_liq * (S_va_in - S_va) + (1 - Y_aa) * f_va_aa * Rho_6 - Rho_8  # eq4
+  diff_S_va = D_ad * (S_va_in - S_va) + f_va_6 * Rho_6 - Rho_8  # eq4
 
-  diff_S_bu = q_ad / V_liq * (S_bu_in - S_bu) + (1 - Y_su) * f_bu_su * Rho_5 + (1 - Y_aa) * f_bu_aa * Rho_6 - Rho_9  # eq5
+  diff_S_bu = D_ad * (S_bu_in - S_bu) + f_bu_5 * Rho_5 + f_bu_6 * Rho_6 - Rho_9  # eq5
 
-  diff_S_pro = q_ad / V_liq * (S_pro_in - S_pro) + (1 - Y_su) * f_pro_su * Rho_5 + (1 - Y_aa) * f_pro_aa * Rho_6 + (1 - Y_c4) * 0.54 * Rho_8 - Rho_10  # eq6
+  diff_S_pro = D_ad * (S_pro_in - S_pro) + f_pro_5 * Rho_5 + f_pro_6 * Rho_6 + f_pro_8 * Rho_8 - Rho_10  # eq6
 
-  diff_S_ac = q_ad / V_liq * (S_ac_in - S_ac) + (1 - Y_su) * f_ac_su * Rho_5 + (1 - Y_aa) * f_ac_aa * Rho_6 + (1 - Y_fa) * 0.7 * Rho_7 + (1 - Y_c4) * 0.31 * Rho_8 + (1 - Y_c4) * 0.8 * Rho_9 + (1 - Y_pro) * 0.57 * Rho_10 - Rho_11  # eq7
+  diff_S_ac = D_ad * (S_ac_in - S_ac) + f_ac_5 * Rho_5 + f_ac_6 * Rho_6 + f_ac_7 * Rho_7 + f_ac_8 * Rho_8 + f_ac_9 * Rho_9 + f_ac_10 * Rho_10 - Rho_11  # eq7
 
   #diff_S_h2 is defined with DAE paralel equaitons
 
-  diff_S_ch4 = q_ad / V_liq * (S_ch4_in - S_ch4) + (1 - Y_ac) * Rho_11 + (1 - Y_h2) * Rho_12 - Rho_T_9  # eq9
+  diff_S_ch4 = D_ad * (S_ch4_in - S_ch4) + f_ch4_11 * Rho_11 + f_ch4_12 * Rho_12 - Rho_T_9  # eq9
 
 
   ## eq10 start##
-  s_1_1 =(-1 * C_xc + f_sI_xc1 * C_sI 
-                  + f_ch_xc1 * C_ch 
-                  + f_pr_xc1 * C_pr 
-                  + f_li_xc1 * C_li 
-                  + f_xI_xc1 * C_xI)
-
-  s_1_2 =(-1 * (C_xc_ref-C_xc) + f_sI_xc2 * (C_sI_ref-C_sI)
-                  + f_ch_xc2 * (C_ch_ref-C_ch)
-                  + f_pr_xc2 * (C_pr_ref-C_pr)
-                  + f_li_xc2 * (C_li_ref-C_li)
-                  + f_xI_xc2 * (C_xI_ref-C_xI))
-
-  s_1= s_1_1+s_1_2
-
-  s_2 =  (-1 * C_ch -1 * (C_ch_ref-C_ch) + C_su)
-  s_3 =  (-1 * C_pr -1 * (C_pr_ref-C_pr) + C_aa)
-  s_4 =  (-1 * C_li -1 * (C_li_ref-C_li) + (1 - f_fa_li) * C_su + f_fa_li * C_fa)
-  s_5 =  (-1 * C_su + (1 - Y_su) * (f_bu_su * C_bu + f_pro_su * C_pro + f_ac_su * C_ac) + Y_su * C_bac)
-  s_6 =  (-1 * C_aa + (1 - Y_aa) * (f_va_aa * C_va + f_bu_aa * C_bu + f_pro_aa * C_pro + f_ac_aa * C_ac) + Y_aa * C_bac)
-  s_7 =  (-1 * C_fa + (1 - Y_fa) * 0.7 * C_ac + Y_fa * C_bac)
-  s_8 =  (-1 * C_va + (1 - Y_c4) * 0.54 * C_pro + (1 - Y_c4) * 0.31 * C_ac + Y_c4 * C_bac)
-  s_9 =  (-1 * C_bu + (1 - Y_c4) * 0.8 * C_ac + Y_c4 * C_bac)
-  s_10 =  (-1 * C_pro + (1 - Y_pro) * 0.57 * C_ac + Y_pro * C_bac)
-  s_11 =  (-1 * C_ac + (1 - Y_ac) * C_ch4 + Y_ac * C_bac)
-  s_12 =  ((1 - Y_h2) * C_ch4 + Y_h2 * C_bac)
-  s_13 =  (-1 * C_bac + C_xc + (C_xc_ref-C_xc)) 
-
+  # carbon stoichiometry s_1 ... s_13 is precomputed in compile_ode_params
   Sigma =  (s_1 * (Rho_1_2 + Rho_1_1)
             + s_2 * (Rho_2_1 + Rho_2_2)
             + s_3 * (Rho_3_1 + Rho_3_2)
@@ -232,54 +310,54 @@ def ADM1_ODE(t, state_zero, state_input,params):
             + s_11 * Rho_11 + s_12 * Rho_12 + s_13 * (Rho_13 + Rho_14 + Rho_15 + Rho_16 + Rho_17 + Rho_18 + Rho_19))
 
 
-  diff_S_IC = q_ad / V_liq * (S_IC_in - S_IC) - Sigma - Rho_T_10
+  diff_S_IC = D_ad * (S_IC_in - S_IC) - Sigma - Rho_T_10
   ## eq10 end## 
 
 
  
-  diff_S_IN = q_ad / V_liq * (S_IN_in - S_IN) + (N_xc - f_xI_xc1 * N_I - f_sI_xc1 * N_I-f_pr_xc1 * N_aa) * Rho_1_1+ (N_xc - f_xI_xc2 * N_I - f_sI_xc2 * N_I-f_pr_xc2 * N_aa) * Rho_1_2 - Y_su * N_bac * Rho_5 + (N_aa - Y_aa * N_bac) * Rho_6 - Y_fa * N_bac * Rho_7 - Y_c4 * N_bac * Rho_8 - Y_c4 * N_bac * Rho_9 - Y_pro * N_bac * Rho_10 - Y_ac * N_bac * Rho_11 - Y_h2 * N_bac * Rho_12 + (N_bac - N_xc) * (Rho_13 + Rho_14 + Rho_15 + Rho_16 + Rho_17 + Rho_18 + Rho_19) # eq11 
+  diff_S_IN = D_ad * (S_IN_in - S_IN) + N_dis1 * Rho_1_1 + N_dis2 * Rho_1_2 - N_5 * Rho_5 + N_6 * Rho_6 - N_7 * Rho_7 - N_8 * Rho_8 - N_8 * Rho_9 - N_10 * Rho_10 - N_11 * Rho_11 - N_12 * Rho_12 + N_dec * (Rho_13 + Rho_14 + Rho_15 + Rho_16 + Rho_17 + Rho_18 + Rho_19) # eq11 
 
 
-  diff_S_I = q_ad / V_liq * (S_I_in - S_I) + f_sI_xc1 * Rho_1_1 + f_sI_xc2 * Rho_1_2  # eq12
+  diff_S_I = D_ad * (S_I_in - S_I) + f_sI_xc1 * Rho_1_1 + f_sI_xc2 * Rho_1_2  # eq12
 
 
   # Differential equations 13 to 24 (particulate matter)
-  diff_X_xc1 = q_in1 / (mixing_ratio * V_liq) * (X_xc1_in - X_xc1) - Rho_1_1 + mixing_ratio * (Rho_13 + Rho_14 + Rho_15 + Rho_16 + Rho_17 + Rho_18 + Rho_19)  # eq13 
+  diff_X_xc1 = D_feed1 * (X_xc1_in - X_xc1) - Rho_1_1 + mr * (Rho_13 + Rho_14 + Rho_15 + Rho_16 + Rho_17 + Rho_18 + Rho_19)  # eq13 
 
-  diff_X_xc2 = q_in2 / ((1-mixing_ratio) * V_liq) * (X_xc2_in - X_xc2) - Rho_1_2 + (1-mixing_ratio) * (Rho_13 + Rho_14 + Rho_15 + Rho_16 + Rho_17 + Rho_18 + Rho_19)  # eq13 
+  diff_X_xc2 = D_feed2 * (X_xc2_in - X_xc2) - Rho_1_2 + mr_c * (Rho_13 + Rho_14 + Rho_15 + Rho_16 + Rho_17 + Rho_18 + Rho_19)  # eq13 
 
-  diff_X_ch1 = q_in1 / (mixing_ratio * V_liq) * (X_ch1_in - X_ch1) + f_ch_xc1 * Rho_1_1 - Rho_2_1  # eq14
+  diff_X_ch1 = D_feed1 * (X_ch1_in - X_ch1) + f_ch_xc1 * Rho_1_1 - Rho_2_1  # eq14
 
-  diff_X_ch2 = q_in2 / ((1-mixing_ratio) * V_liq) * (X_ch2_in - X_ch2) + f_ch_xc2 * Rho_1_2 - Rho_2_2  # eq14
+  diff_X_ch2 = D_feed2 * (X_ch2_in - X_ch2) + f_ch_xc2 * Rho_1_2 - Rho_2_2  # eq14
 
-  diff_X_pr1 = q_in1 / (mixing_ratio * V_liq) * (X_pr1_in - X_pr1) + f_pr_xc1 * Rho_1_1 - Rho_3_1    # eq15 
+  diff_X_pr1 = D_feed1 * (X_pr1_in - X_pr1) + f_pr_xc1 * Rho_1_1 - Rho_3_1    # eq15 
 
-  diff_X_pr2 = q_in2 / ((1-mixing_ratio) * V_liq) * (X_pr2_in - X_pr2) + f_pr_xc2 * Rho_1_2 - Rho_3_2   # eq15 
+  diff_X_pr2 = D_feed2 * (X_pr2_in - X_pr2) + f_pr_xc2 * Rho_1_2 - Rho_3_2   # eq15 
 
-  diff_X_li1 = q_in1 / (mixing_ratio * V_liq) * (X_li1_in - X_li1) + f_li_xc1 * Rho_1_1 - Rho_4_1    # eq16 
+  diff_X_li1 = D_feed1 * (X_li1_in - X_li1) + f_li_xc1 * Rho_1_1 - Rho_4_1    # eq16 
 
-  diff_X_li2 = q_in2 / ((1-mixing_ratio) * V_liq) * (X_li2_in - X_li2) + f_li_xc2 * Rho_1_2 - Rho_4_2   # eq16 
+  diff_X_li2 = D_feed2 * (X_li2_in - X_li2) + f_li_xc2 * Rho_1_2 - Rho_4_2   # eq16 
   
-  diff_X_su = q_ad / V_liq * (X_su_in - X_su) + Y_su * Rho_5 - Rho_13  # eq17
+  diff_X_su = D_ad * (X_su_in - X_su) + Y_su * Rho_5 - Rho_13  # eq17
 
-  diff_X_aa = q_ad / V_liq * (X_aa_in - X_aa) + Y_aa * Rho_6 - Rho_14  # eq18
+  diff_X_aa = D_ad * (X_aa_in - X_aa) + Y_aa * Rho_6 - Rho_14  # eq18
 
-  diff_X_fa = q_ad / V_liq * (X_fa_in - X_fa) + Y_fa * Rho_7 - Rho_15  # eq19
+  diff_X_fa = D_ad * (X_fa_in - X_fa) + Y_fa * Rho_7 - Rho_15  # eq19
 
-  diff_X_c4 = q_ad / V_liq * (X_c4_in - X_c4) + Y_c4 * Rho_8 + Y_c4 * Rho_9 - Rho_16  # eq20
+  diff_X_c4 = D_ad * (X_c4_in - X_c4) + Y_c4 * Rho_8 + Y_c4 * Rho_9 - Rho_16  # eq20
 
-  diff_X_pro = q_ad / V_liq * (X_pro_in - X_pro) + Y_pro * Rho_10 - Rho_17  # eq21
+  diff_X_pro = D_ad * (X_pro_in - X_pro) + Y_pro * Rho_10 - Rho_17  # eq21
 
-  diff_X_ac = q_ad / V_liq * (X_ac_in - X_ac) + Y_ac * Rho_11 - Rho_18  # eq22
+  diff_X_ac = D_ad * (X_ac_in - X_ac) + Y_ac * Rho_11 - Rho_18  # eq22
 
-  diff_X_h2 = q_ad / V_liq * (X_h2_in - X_h2) + Y_h2 * Rho_12 - Rho_19  # eq23
+  diff_X_h2 = D_ad * (X_h2_in - X_h2) + Y_h2 * Rho_12 - Rho_19  # eq23
 
-  diff_X_I = q_ad / V_liq * (X_I_in - X_I) + f_xI_xc1 * Rho_1_1 + f_xI_xc2 * Rho_1_2  # eq24 
+  diff_X_I = D_ad * (X_I_in - X_I) + f_xI_xc1 * Rho_1_1 + f_xI_xc2 * Rho_1_2  # eq24 
 
   # Differential equations 25 and 26 (cations and anions)
-  diff_S_cation = q_ad / V_liq * (S_cation_in - S_cation)  # eq25
+  diff_S_cation = D_ad * (S_cation_in - S_cation)  # eq25
 
-  diff_S_anion = q_ad / V_liq * (S_anion_in - S_anion)  # eq26
+  diff_S_anion = D_ad * (S_anion_in - S_anion)  # eq26
 
 
 
@@ -299,11 +377,11 @@ def ADM1_ODE(t, state_zero, state_input,params):
   diff_S_nh3 = 0  # eq32
 
   # Gas phase equations: Differential equations 33 to 35
-  diff_S_gas_h2 = (q_gas / V_gas * -1 * S_gas_h2) + (Rho_T_8 * V_liq / V_gas)  # eq33
+  diff_S_gas_h2 = (q_gas * inv_V_gas * -1 * S_gas_h2) + (Rho_T_8 * gas_ratio)  # eq33
 
-  diff_S_gas_ch4 = (q_gas / V_gas * -1 * S_gas_ch4) + (Rho_T_9 * V_liq / V_gas)  # eq34
+  diff_S_gas_ch4 = (q_gas * inv_V_gas * -1 * S_gas_ch4) + (Rho_T_9 * gas_ratio)  # eq34
 
-  diff_S_gas_co2 = (q_gas / V_gas * -1 * S_gas_co2) + (Rho_T_10 * V_liq / V_gas)  # eq35
+  diff_S_gas_co2 = (q_gas * inv_V_gas * -1 * S_gas_co2) + (Rho_T_10 * gas_ratio)  # eq35
 
   diff_S_H_ion = diff_S_co2 = diff_S_nh4_ion = 0 #to keep the output same length as input for ADM1_ODE funcion
 
@@ -1,4 +1,7 @@
+import hashlib
+import json
 import numpy as np
+from adm1.constants import STATE_NAMES, INFLUENT_NAMES
 from adm1.initial_state import get_initial_state
 
 
@@ -196,11 +199,38 @@ PARAMETER_SETS = {
 #params = PARAMETER_SETS["mesophilic_solids"]
 
 
+def select_parameter_set(T_ad):
+    # Choose parameter set based on operating temperature (K) -> (°C)
+    # Rule: 20–40°C => MESOPHILIC_SOLIDS, 45–70°C => THERMOPHILIC_SOLIDS, gap (40–45°C) defaults to mesophilic
+    T_C_sel = float(T_ad) - 273.15
+    if 20.0 <= T_C_sel <= 40.0:
+        return "mesophilic_solids"
+    elif 45.0 <= T_C_sel <= 70.0:
+        return "thermophilic_solids"
+    # Default to mesophilic in the transition gap or outside specified bounds
+    return "mesophilic_solids"
+
+
+def params_hash(param_dict):
+    """
+    Short, stable hash of a parameter dict (e.g. param_overrides).
+    Keys are sorted and values serialized with repr, so equal dicts always
+    give the same hash across processes and sessions.
+    """
+    if not param_dict:
+        return "default"
+    payload = json.dumps({str(k): repr(v) for k, v in param_dict.items()}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
 # Extract parameters from the selected parameter set
 
 
 def set_global_params_from_dict(param_dict):
-  #  globals_ = globals()
+    # Notebook convenience only: copies a parameter set into this module's
+    # namespace for `from adm1.params import *`. It mutates module state, so
+    # the simulation path (ADM1_coAD, ADM1_ODE, DAESolve) never calls it and
+    # reads parameters from the params dict instead.
     for k, v in param_dict.items():
         globals()[k] = v
 
@@ -311,6 +341,56 @@ def get_adm1_params(T_ad, T_base, parameter_set, mixing_ratio):
 
 
 
+# COD per unit VS (lambda) of each component counted by get_VSS
+VSS_LAMBDA = {
+    'S_su_in': 1.07,
+    'S_aa_in': 1.53,
+    'S_fa_in': 2.87,
+    'S_va_in': 2.04,
+    'S_bu_in': 1.82,
+    'S_pro_in': 1.51,
+    'S_ac_in': 1.07,
+    'X_ch1_in': 1.18,
+    'X_ch2_in': 1.18,
+    'X_pr1_in': 1.53,
+    'X_pr2_in': 1.53,
+    'X_li1_in': 2.87,
+    'X_li2_in': 2.87,
+    'X_I_in': 1.18,
+    'X_I1_in': 1.18,
+    'X_I2_in': 1.18,
+    #######
+
+    'X_su': 1.41,
+    'X_aa': 1.41,
+    'X_fa': 1.41,
+    'X_c4': 1.41,
+    'X_pro': 1.41,
+    'X_ac': 1.41,
+    'X_h2': 1.41,
+    'S_su': 1.07,
+    'S_aa': 1.53,
+    'S_fa': 2.87,
+    'S_va': 2.04,
+    'S_va_ion': 1.98,
+    'S_bu': 1.82,
+    'S_bu_ion': 1.75,
+    'S_pro': 1.51,
+    'S_pro_ion': 1.42,
+    'S_ac': 1.07,
+    'S_ac_ion': 0.95,
+    'X_ch1': 1.18,
+    'X_ch2': 1.18,
+    'X_pr1': 1.53,
+    'X_pr2': 1.53,
+    'X_li1': 2.87,
+    'X_li2': 2.87,
+    'X_I': 1.18,
+    'S_h2': 7.94,
+    'S_ch4': 3.99
+}
+
+
 def get_VSS(influent, q):
     """
     Calculate VSS as the sum of lambda values multiplied by corresponding influent biomass fractions.
@@ -319,59 +399,41 @@ def get_VSS(influent, q):
     Returns:
         float: Total VSS value.
     """
-    lambda_dict = {
-        'S_su_in': 1.07,
-        'S_aa_in': 1.53,
-        'S_fa_in': 2.87,
-        'S_va_in': 2.04,
-        'S_bu_in': 1.82,
-        'S_pro_in': 1.51,
-        'S_ac_in': 1.07,
-        'X_ch1_in': 1.18,
-        'X_ch2_in': 1.18,
-        'X_pr1_in': 1.53,
-        'X_pr2_in': 1.53,
-        'X_li1_in': 2.87,
-        'X_li2_in': 2.87,
-        'X_I_in': 1.18,
-        'X_I1_in': 1.18,
-        'X_I2_in': 1.18,
-        #######
-
-        'X_su': 1.41,
-        'X_aa': 1.41,
-        'X_fa': 1.41,
-        'X_c4': 1.41,
-        'X_pro': 1.41,
-        'X_ac': 1.41,
-        'X_h2': 1.41,
-        'S_su': 1.07,
-        'S_aa': 1.53,
-        'S_fa': 2.87,
-        'S_va': 2.04,
-        'S_va_ion': 1.98,
-        'S_bu': 1.82,
-        'S_bu_ion': 1.75,
-        'S_pro': 1.51,
-        'S_pro_ion': 1.42,
-        'S_ac': 1.07,
-        'S_ac_ion': 0.95,
-        'X_ch1': 1.18,
-        'X_ch2': 1.18,
-        'X_pr1': 1.53,
-        'X_pr2': 1.53,
-        'X_li1': 2.87,
-        'X_li2': 2.87,
-        'X_I': 1.18,
-        'S_h2': 7.94,
-        'S_ch4': 3.99
-    }
     VSS = 0.0
-    for key, lam in lambda_dict.items():
+    for key, lam in VSS_LAMBDA.items():
         VSS += q*0.001 * influent.get(key, 0)/lam #tonne/day
     return VSS
 
 
+def vss_coefficients(names):
+    """1/lambda for each entry of names (0 where get_VSS ignores the entry), so VSS = q*0.001*values@coeffs."""
+    return np.array([1 / VSS_LAMBDA[name] if name in VSS_LAMBDA else 0.0 for name in names])
+
+
+VSS_STATE_COEFFS = vss_coefficients(STATE_NAMES)
+VSS_INFLUENT_COEFFS = vss_coefficients(INFLUENT_NAMES)
+
+
+def get_VSS_array(values, q, names=STATE_NAMES):
+    """
+    get_VSS for many rows at once: one dot product per row.
+
+    Args:
+        values (array): (..., len(names)), e.g. a trajectory (T, 42) or a sweep of feeds (N, 30).
+        q (float or array): Flow(s) [m3/d], broadcast against the leading dimensions.
+        names (sequence): Column names of values (STATE_NAMES, INFLUENT_NAMES or DataFrame columns).
+    Returns:
+        np.ndarray: VSS [tonne/day] with the leading shape of values.
+    """
+    if names is STATE_NAMES:
+        coeffs = VSS_STATE_COEFFS
+    elif names is INFLUENT_NAMES:
+        coeffs = VSS_INFLUENT_COEFFS
+    else:
+        coeffs = vss_coefficients(names)
+    return np.asarray(q, dtype=float) * 0.001 * (np.asarray(values, dtype=float) @ coeffs)
+
+
 
 # Mass fractions for C and N from Table S.1 (per unit mass)
 # Only main organic components included; extend as needed
@@ -406,4 +468,30 @@ def calculate_CN_ratio(influent, mass_fractions=ADM1_MASS_FRACTIONS):
         cn_ratio = float('inf')
     else:
         cn_ratio = total_C / total_N
-    return {"C/N ratio": cn_ratio, "total_C": total_C, "total_N": total_N}
\ No newline at end of file
+    return {"C/N ratio": cn_ratio, "total_C": total_C, "total_N": total_N}
+
+
+def cn_coefficients(names, mass_fractions=ADM1_MASS_FRACTIONS):
+    """(C, N) content vectors aligned to names (0 for components without mass fractions)."""
+    C = np.array([mass_fractions[name][0] if name in mass_fractions else 0.0 for name in names])
+    N = np.array([mass_fractions[name][1] if name in mass_fractions else 0.0 for name in names])
+    return C, N
+
+
+CN_INFLUENT_COEFFS = cn_coefficients(INFLUENT_NAMES)
+
+
+def calculate_CN_ratio_array(values, names=INFLUENT_NAMES, mass_fractions=ADM1_MASS_FRACTIONS):
+    """
+    calculate_CN_ratio for many feeds at once, e.g. values of shape (N, 30) from influent_matrix.
+    Returns: dict with arrays "C/N ratio" (inf where total_N is 0), "total_C" and "total_N"
+    """
+    if names is INFLUENT_NAMES and mass_fractions is ADM1_MASS_FRACTIONS:
+        C, N = CN_INFLUENT_COEFFS
+    else:
+        C, N = cn_coefficients(names, mass_fractions)
+    values = np.asarray(values, dtype=float)
+    total_C, total_N = values @ C, values @ N
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cn_ratio = np.where(total_N == 0, np.inf, total_C / total_N)
+    return {"C/N ratio": cn_ratio, "total_C": total_C, "total_N": total_N}
@@ -0,0 +1,311 @@
+"""
+Scenario runners for ADM1_coAD.
+
+A scenario is a dict of ADM1_coAD keyword arguments. The runners execute a
+list of scenarios and return the result dicts in input order.
+
+Contract:
+- ADM1_coAD, simulate, ADM1_ODE and DAESolve keep all parameters in local
+  variables and per-call dicts, so independent scenarios can run
+  concurrently in one process without clobbering each other.
+- executor="thread" uses a ThreadPoolExecutor. The Python kernel holds the
+  GIL, so threads pay off when the work around the integration releases it
+  (I/O such as streaming writers via on_result, or GIL-free kernels);
+  executor="process" uses a ProcessPoolExecutor and scales the integration
+  itself with the number of cores; executor="serial" runs in the calling
+  thread.
+- reduce(result) is applied where the scenario ran, so only its (small)
+  return value crosses the process boundary. It must be a module-level
+  function for executor="process".
+- With cache_dir, every finished (reduced) result is pickled under a hash of
+  the scenario and the reduce function; repeated scenarios are loaded
+  instead of simulated. Scenarios without a stable key (e.g. a callable
+  object whose repr is its address) run uncached.
+- transport="mmap" (executor="process" only): the worker writes the large
+  DataFrames of a result (simulate_results, gasflow, ... - any top-level
+  frame with one numeric dtype and a default index) to .npy files under
+  transport_dir (/dev/shm when available, i.e. shared memory). Only their
+  paths and column names travel through the pipe; the parent memory-maps
+  the files copy-on-write and unlinks them, so the frames are backed by the
+  mapping without a copy.
+
+Notes:
+- Progress printing is switched off (verbose=False) unless the scenario
+  sets it explicitly.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from adm1.coAD import ADM1_coAD
+
+
+EXECUTORS = ("serial", "thread", "process")
+TRANSPORTS = ("pickle", "mmap")
+# Frames smaller than this are cheaper to pickle than to map
+MIN_TRANSPORT_BYTES = 1 << 16
+_MMAP_FRAME = "__mmap_frame__"
+
+
+def run_scenario(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a single scenario.
+
+    Parameters:
+        scenario (Dict[str, Any]): ADM1_coAD keyword arguments.
+
+    Returns:
+        Dict[str, Any]: The ADM1_coAD result dict.
+    """
+    kwargs = dict(scenario)
+    kwargs.setdefault("verbose", False)
+    return ADM1_coAD(**kwargs)
+
+
+def _run_reduced(scenario: Dict[str, Any], reduce: Optional[Callable[[Dict[str, Any]], Any]],
+                 transport_dir: Optional[str] = None) -> Any:
+    result = run_scenario(scenario)
+    value = result if reduce is None else reduce(result)
+    return value if transport_dir is None else _export_frames(value, transport_dir)
+
+
+def _mappable(frame: Any) -> bool:
+    """A DataFrame that round-trips exactly through one 2-D array."""
+    import pandas as pd
+    if not isinstance(frame, pd.DataFrame) or frame.size * 8 < MIN_TRANSPORT_BYTES:
+        return False
+    dtypes = set(frame.dtypes)
+    return (len(dtypes) == 1 and next(iter(dtypes)).kind in "fiub"
+            and frame.index.equals(pd.RangeIndex(len(frame))))
+
+
+def _export_frames(value: Any, directory: str) -> Any:
+    """Worker side of transport="mmap": large frames of a result dict go to .npy files."""
+    if not isinstance(value, dict):
+        return value
+    out = dict(value)
+    for key, frame in value.items():
+        if _mappable(frame):
+            path = os.path.join(directory, f"{uuid.uuid4().hex}.npy")
+            np.save(path, np.ascontiguousarray(frame.to_numpy()))
+            out[key] = {_MMAP_FRAME: path, "columns": list(frame.columns)}
+    return out
+
+
+def _import_frames(value: Any) -> Any:
+    """Parent side of transport="mmap": map the files (copy-on-write) and unlink them."""
+    if not isinstance(value, dict):
+        return value
+    import pandas as pd
+    out = dict(value)
+    for key, item in value.items():
+        if isinstance(item, dict) and _MMAP_FRAME in item:
+            data = np.load(item[_MMAP_FRAME], mmap_mode="c")
+            os.unlink(item[_MMAP_FRAME])  # the mapping stays valid
+            out[key] = pd.DataFrame(data, columns=item["columns"], copy=False)
+    return out
+
+
+def _transport_base() -> str:
+    return "/dev/shm" if os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+
+
+def _code_digest(code: Any) -> str:
+    """Bytecode, constants and referenced names of a code object (nested code objects by digest)."""
+    consts = [_code_digest(c) if hasattr(c, "co_code") else repr(c) for c in code.co_consts]
+    return _digest(code.co_code + repr((consts, code.co_names)).encode())
+
+
+def _cell_contents(cell: Any) -> Any:
+    try:
+        return cell.cell_contents
+    except ValueError:  # empty cell
+        return "<empty cell>"
+
+
+def _callable_tag(func: Callable) -> Any:
+    """
+    Identity of a callable for cache keys: its qualified name plus, for
+    Python functions, bytecode, defaults and captured closure values, so
+    closures and lambdas that differ only in what they capture get
+    different keys. Bound methods include their instance.
+    """
+    if isinstance(func, functools.partial):
+        return {"partial": _callable_tag(func.func), "args": list(func.args), "keywords": dict(func.keywords)}
+    if hasattr(func, "__func__") and hasattr(func, "__self__"):
+        return {"method": _callable_tag(func.__func__), "self": func.__self__}
+    name = getattr(func, "__qualname__", type(func).__qualname__)
+    tag = {"callable": f"{getattr(func, '__module__', None)}.{name}"}
+    code = getattr(func, "__code__", None)
+    if code is not None:
+        tag.update(code=_code_digest(code), defaults=func.__defaults__, kwdefaults=func.__kwdefaults__,
+                   closure=[_cell_contents(cell) for cell in func.__closure__ or ()])
+    return tag
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _stable_repr(value: Any) -> Any:
+    # repr abbreviates large arrays and frames with "...", so their contents are hashed instead
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return {"ndarray": "object", "shape": list(value.shape), "values": value.ravel().tolist()}
+        return {"ndarray": value.dtype.str, "shape": list(value.shape),
+                "sha1": _digest(np.ascontiguousarray(value).tobytes())}
+    if isinstance(value, np.generic):
+        return value.item()
+    if type(value).__module__.startswith("pandas") and hasattr(value, "index"):
+        from pandas.util import hash_pandas_object
+        columns = hasattr(value, "columns")  # DataFrame, else Series / Index
+        frame = {"pandas": type(value).__name__, "index": _stable_repr(value.index.to_numpy()),
+                 "columns": [str(c) for c in value.columns] if columns else [],
+                 "dtypes": [str(d) for d in (value.dtypes if columns else [value.dtype])]}
+        try:
+            frame["sha1"] = _digest(hash_pandas_object(value, index=False).to_numpy().tobytes())
+        except TypeError:  # unhashable cells, e.g. lists
+            frame["values"] = value.to_numpy().tolist()
+        return frame
+    if isinstance(value, functools.partial) or (callable(value) and hasattr(value, "__qualname__")):
+        return _callable_tag(value)
+    text = repr(value)
+    if " at 0x" in text:
+        # Default object repr: the key would depend on the memory address
+        raise ValueError(f"no stable representation for {text}")
+    return text
+
+
+def scenario_key(scenario: Dict[str, Any], reduce: Optional[Callable] = None) -> str:
+    """
+    Stable hash of a scenario (and of the reduce function applied to it).
+
+    numpy arrays and pandas objects are hashed through their dtype, shape
+    (or index and columns) and a digest of their contents; other values
+    that are not JSON types through repr. Functions and functools.partial
+    objects (e.g. stop_condition) are hashed through their qualified name,
+    bytecode, defaults, captured values and bound arguments (_callable_tag),
+    so the key does not depend on memory addresses.
+
+    Raises:
+        ValueError: If a value has no stable representation (an object whose
+            repr is its address, or a self-referencing closure).
+    """
+    tag = None if reduce is None else _callable_tag(reduce)
+    try:
+        payload = json.dumps({"scenario": scenario, "reduce": tag}, sort_keys=True, default=_stable_repr)
+    except (RecursionError, ValueError) as exc:
+        raise ValueError(f"Scenario has no stable cache key: {exc}") from None
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key[:2], key + ".pkl")
+
+
+def _cache_load(cache_dir: str, key: str) -> Any:
+    with open(_cache_path(cache_dir, key), "rb") as fh:
+        return pickle.load(fh)
+
+
+def _cache_store(cache_dir: str, key: str, value: Any) -> None:
+    path = _cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def run_scenarios(
+    scenarios: Sequence[Dict[str, Any]],
+    executor: str = "thread",
+    max_workers: Optional[int] = None,
+    on_result: Optional[Callable[[int, Any], None]] = None,
+    reduce: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    cache_dir: Optional[str] = None,
+    transport: str = "pickle",
+    transport_dir: Optional[str] = None,
+) -> List[Any]:
+    """
+    Run many scenarios, optionally side by side on a thread or process pool.
+
+    Parameters:
+        scenarios (Sequence[Dict[str, Any]]): ADM1_coAD keyword-argument dicts.
+        executor (str): "thread", "process" or "serial".
+        max_workers (Optional[int]): Pool size; executor default if None.
+        on_result (Optional[Callable]): Called as on_result(index, result) in the
+            calling thread as soon as a scenario finishes (or is read from the
+            cache), e.g. to stream it to disk.
+        reduce (Optional[Callable]): Maps a result dict to what is returned and
+            cached, e.g. a few summary numbers.
+        cache_dir (Optional[str]): Directory of the on-disk result cache.
+        transport (str): "pickle", or "mmap" to pass large result frames from
+            process workers through memory-mapped files.
+        transport_dir (Optional[str]): Where the transport files live; /dev/shm
+            (or the temp directory) if None.
+
+    Returns:
+        List[Any]: Result dicts (or reduced results) in the order of `scenarios`.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor {executor!r}; expected one of {EXECUTORS}")
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {transport!r}; expected one of {TRANSPORTS}")
+
+    results: List[Any] = [None] * len(scenarios)
+    keys: List[Optional[str]] = [None] * len(scenarios)
+    pending: List[int] = []
+    for i, scenario in enumerate(scenarios):
+        if cache_dir is not None:
+            try:
+                keys[i] = scenario_key(scenario, reduce)
+            except ValueError:
+                pass  # no stable key: run this scenario without the cache
+        if keys[i] is not None and os.path.exists(_cache_path(cache_dir, keys[i])):
+            results[i] = _cache_load(cache_dir, keys[i])
+            if on_result is not None:
+                on_result(i, results[i])
+            continue
+        pending.append(i)
+
+    def _finish(index: int, value: Any) -> None:
+        results[index] = value
+        if keys[index] is not None:
+            _cache_store(cache_dir, keys[index], value)
+        if on_result is not None:
+            on_result(index, value)
+
+    if executor == "serial" or not pending:
+        for i in pending:
+            _finish(i, _run_reduced(scenarios[i], reduce))
+        return results
+
+    # The executor classes pull in threading / multiprocessing; only a pooled run needs them
+    if executor == "thread":
+        from concurrent.futures import ThreadPoolExecutor as pool_type
+    else:
+        from concurrent.futures import ProcessPoolExecutor as pool_type
+    # Threads share memory with the caller already; only process workers use the transport
+    mapped = transport == "mmap" and executor == "process"
+    work_dir = tempfile.mkdtemp(prefix="adm1-", dir=transport_dir or _transport_base()) if mapped else None
+    try:
+        with pool_type(max_workers=max_workers) as pool:
+            futures = {pool.submit(_run_reduced, scenarios[i], reduce, work_dir): i for i in pending}
+            for future in as_completed(futures):
+                value = future.result()
+                _finish(futures[future], _import_frames(value) if mapped else value)
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
@@ -0,0 +1,174 @@
+"""
+Piecewise operating schedules for ADM1_coAD.
+
+A schedule is a list of changes, each a dict with "time" [d] and any of:
+- "q_in": fresh feed flow [m3/d];
+- "OLR": organic loading rate [kg VS/m3/d]; the fresh feed flow is scaled by
+  OLR / current OLR (same feed, same volume);
+- "mixing_ratio": feed-1 share of the fresh feed;
+- "T_ad": digester temperature [K];
+- "influent": a base feed dict in the format of ADM1_coAD's `influent`
+  argument (e.g. get_influent output), rescaled to the actual flow like the
+  scenario feed (feed switch);
+- fresh-feed components (*_in names), absolute values as entering the
+  reactor (e.g. a step in S_cation_in).
+
+ADM1_coAD(..., schedule=...) integrates exactly to each breakpoint (output
+steps are split there), applies the changes and continues from the state
+reached, so the result is one contiguous run on the usual output grid.
+
+Contract:
+- prepare_schedule(schedule) -> validated changes sorted by time (stable).
+- ramp(name, start, end, t_start, t_end, n_steps=10) -> changes that follow
+  a linear ramp as a staircase of n_steps steps.
+- operating_point(setup, ...) -> the mutable operating state ADM1_coAD
+  keeps for a scheduled run; apply_change(op, change, cache) applies one
+  change and returns which derived parts ("flows", "params", "influent")
+  were recomputed.
+
+Notes:
+- Only what a change affects is recomputed: q_in / OLR touch the flows and
+  dilution rates; T_ad and mixing_ratio rebuild the temperature- and
+  carbon-content-dependent parameters, cached per (T_ad, mixing_ratio), with
+  the param_overrides of the scenario re-applied.
+- T_op keeps its offset to T_ad. A mixing_ratio change regenerates the feed
+  with get_influent only when the scenario uses the default feed.
+- VS_in, HRT and the volumes keep their set-up values, so yields stay
+  normalized to the set-up VS load.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from adm1.constants import INFLUENT_NAMES
+from adm1.influent import feed_flows, get_influent, rescale_influent
+from adm1.params import PARAMETER_SETS, get_adm1_params, select_parameter_set
+
+
+SCHEDULE_KEYS = ("q_in", "OLR", "mixing_ratio", "T_ad", "influent")
+SCALAR_KEYS = ("q_in", "OLR", "mixing_ratio", "T_ad") + tuple(INFLUENT_NAMES)
+
+# Entries of params that come from the reactor set-up, not from the parameter set
+REACTOR_KEYS = ("q_in", "q_in1", "q_in2", "q_ad", "q_out", "q_r", "VS_in", "HRT", "V_liq", "V_gas", "V_ad",
+                "OLR", "density", "mixing_ratio", "disable_inhibition")
+
+
+def prepare_schedule(schedule: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Validate a schedule and sort it by time (changes at equal times keep their order)."""
+    events = []
+    for change in schedule:
+        if "time" not in change:
+            raise ValueError(f"Schedule entry without 'time': {change}")
+        if float(change["time"]) < 0:
+            raise ValueError(f"Schedule times must be >= 0, got {change['time']}")
+        unknown = [k for k in change if k != "time" and k not in SCHEDULE_KEYS and k not in INFLUENT_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown schedule keys {unknown}; expected {SCHEDULE_KEYS} or *_in names")
+        for key in ("q_in", "OLR", "T_ad"):
+            if key in change and float(change[key]) < 0:
+                raise ValueError(f"{key} must be >= 0, got {change[key]}")
+        if "mixing_ratio" in change and not 0 < float(change["mixing_ratio"]) < 1:
+            raise ValueError(f"mixing_ratio must be in (0, 1), got {change['mixing_ratio']}")
+        events.append(dict(change, time=float(change["time"])))
+    return sorted(events, key=lambda e: e["time"])
+
+
+def ramp(name: str, start: float, end: float, t_start: float, t_end: float, n_steps: int = 10) -> List[Dict[str, Any]]:
+    """
+    Staircase approximation of a linear ramp of `name` from start (at t_start) to end (at t_end).
+
+    Returns n_steps + 1 changes; concatenate with other changes to build a schedule.
+    """
+    if name not in SCALAR_KEYS:
+        raise ValueError(f"Cannot ramp {name!r}; expected one of {SCALAR_KEYS[:4]} or *_in names")
+    if n_steps < 1 or t_end < t_start:
+        raise ValueError("ramp needs n_steps >= 1 and t_end >= t_start")
+    return [{"time": t_start + (t_end - t_start) * k / n_steps, name: start + (end - start) * k / n_steps}
+            for k in range(n_steps + 1)]
+
+
+def operating_point(setup: Dict[str, Any], T_ad: float, T_base: float, T_op: float, mixing_ratio2: float,
+                    recycle_ratio: float, param_overrides: Optional[Dict[str, Any]], q_ad_init: float,
+                    default_influent: bool) -> Dict[str, Any]:
+    """
+    Operating state of a scheduled run, starting from setup_scenario output.
+
+    op["params"] and op["new_influent"] are the objects ADM1_coAD integrates with.
+    """
+    return {
+        "params": setup["params"],
+        "new_influent": setup["new_influent"],
+        "influent": setup["influent"],
+        "default_influent": default_influent,
+        "T_ad": float(T_ad),
+        "T_base": T_base,
+        "T_op": float(T_op),
+        "mixing_ratio2": mixing_ratio2,
+        "recycle_ratio": recycle_ratio,
+        "param_overrides": param_overrides,
+        "q_ad_init": q_ad_init,
+        "q_in_setup": setup["reactor"]["q_in"],
+    }
+
+
+def _base_params(op: Dict[str, Any], T_ad: float, mixing_ratio: float, cache: Dict) -> Dict[str, Any]:
+    """Temperature- and mixing-ratio-dependent parameters (with overrides), cached."""
+    key = (T_ad, mixing_ratio)
+    if key not in cache:
+        params = get_adm1_params(T_ad, op["T_base"], PARAMETER_SETS[select_parameter_set(T_ad)], mixing_ratio)
+        if isinstance(op["param_overrides"], dict) and op["param_overrides"]:
+            params.update(op["param_overrides"])
+        cache[key] = params
+    return cache[key]
+
+
+def _rescaled(op: Dict[str, Any], influent: Dict[str, float], mixing_ratio: float) -> Dict[str, float]:
+    return rescale_influent(mixing_ratio, influent, op["q_in_setup"], op["q_ad_init"])
+
+
+def apply_change(op: Dict[str, Any], change: Dict[str, Any], cache: Dict) -> Set[str]:
+    """
+    Apply one schedule change to the operating state.
+
+    Returns:
+        Set[str]: Recomputed parts: "flows" (flows and dilution rates),
+        "params" (parameter set; implies flows) and/or "influent".
+    """
+    params = op["params"]
+    changed: Set[str] = set()
+    mixing_ratio = float(change.get("mixing_ratio", params["mixing_ratio"]))
+    T_ad = float(change.get("T_ad", op["T_ad"]))
+
+    if T_ad != op["T_ad"] or mixing_ratio != params["mixing_ratio"]:
+        reactor = {k: params[k] for k in REACTOR_KEYS if k in params}
+        params = dict(_base_params(op, T_ad, mixing_ratio, cache), **reactor)
+        params["mixing_ratio"] = mixing_ratio
+        op["T_op"] += T_ad - op["T_ad"]
+        op["T_ad"] = T_ad
+        op["params"] = params
+        changed |= {"params", "flows"}
+
+    q_in = params["q_in"]
+    if "OLR" in change:
+        if params["OLR"] > 0:
+            q_in = q_in * float(change["OLR"]) / params["OLR"]
+        params["OLR"] = float(change["OLR"])
+    if "q_in" in change:
+        q_in = float(change["q_in"])
+    if q_in != params["q_in"] or "flows" in changed:
+        params.update(feed_flows(q_in, mixing_ratio, op["recycle_ratio"]))
+        changed.add("flows")
+
+    if "influent" in change:
+        op["influent"] = dict(op["influent"], **change["influent"])
+        op["default_influent"] = False
+        op["new_influent"] = _rescaled(op, op["influent"], mixing_ratio)
+        changed.add("influent")
+    elif "mixing_ratio" in change and op["default_influent"]:
+        op["influent"] = get_influent(mixing_ratio, op["mixing_ratio2"])
+        op["new_influent"] = _rescaled(op, op["influent"], mixing_ratio)
+        changed.add("influent")
+    components = {k: float(v) for k, v in change.items() if k in INFLUENT_NAMES}
+    if components:
+        op["new_influent"] = dict(op["new_influent"], **components)
+        changed.add("influent")
+    return changed
@@ -0,0 +1,247 @@
+"""
+Global sensitivity analysis of ADM1_coAD with respect to kinetic parameters.
+
+Samples the kinetic entries of PARAMETER_SETS (k_m_*, K_S_*, k_dis*, k_hyd_*,
+K_I_*) as param_overrides of a base scenario, evaluates the samples through
+adm1.runner.run_scenarios (process pool + on-disk cache) and returns
+sensitivity indices for each output in OUTPUTS.
+
+Contract:
+- make_problem(base_scenario, names=None, spread=0.5, bounds=None) -> problem
+  dict {"base", "names", "nominal", "bounds"}.
+- morris_sample / morris_analyze: Morris elementary-effects screening
+  (r trajectories on a `levels` grid) -> DataFrame of mu, mu_star, sigma.
+- saltelli_sample / sobol_analyze: Saltelli design A, B, AB_i built on a
+  scrambled Sobol sequence, first-order (Saltelli 2010) and total (Jansen)
+  indices with bootstrap confidence -> DataFrame of S1, S1_conf, ST, ST_conf.
+- morris(...) and sobol(...) chain sampling, evaluation and analysis.
+
+Notes:
+- Cost: Morris needs r * (k + 1) runs, Sobol n * (k + 2) runs for k
+  parameters. Keep `days` of the base scenario as short as the question
+  allows, use executor="process" and a cache_dir so interrupted or repeated
+  studies only simulate new points.
+- Parameters are sampled uniformly on [nominal * (1 - spread),
+  nominal * (1 + spread)] unless explicit bounds are given.
+"""
+
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from adm1.params import PARAMETER_SETS, select_parameter_set
+from adm1.runner import run_scenarios
+
+
+KINETIC_PREFIXES = ("k_m_", "K_S_", "k_dis", "k_hyd_", "K_I_")
+OUTPUTS = ("methane_yield", "VS_reduction", "min_pH")
+
+
+def kinetic_parameters(parameter_set: str = "mesophilic_solids") -> Dict[str, float]:
+    """Nominal values of the kinetic entries of a PARAMETER_SETS entry."""
+    return {name: float(value) for name, value in PARAMETER_SETS[parameter_set].items()
+            if name.startswith(KINETIC_PREFIXES)}
+
+
+def sensitivity_outputs(result: Dict[str, Any]) -> Dict[str, float]:
+    """Reduce an ADM1_coAD result to the scalar outputs analysed here."""
+    return {
+        "methane_yield": float(result["biomethane_yield"]),
+        "VS_reduction": float(result["VS_reduction"]),
+        "min_pH": float(result["simulate_results"]["pH"].min()),
+    }
+
+
+def make_problem(base_scenario: Dict[str, Any], names: Optional[Sequence[str]] = None,
+                 spread: float = 0.5,
+                 bounds: Optional[Dict[str, Tuple[float, float]]] = None) -> Dict[str, Any]:
+    """
+    Define the sampled parameters and their ranges.
+
+    Parameters:
+        base_scenario (Dict[str, Any]): ADM1_coAD keyword arguments of the reference run.
+        names (Optional[Sequence[str]]): Parameters to vary; all kinetic ones if None.
+        spread (float): Relative half-width of the default uniform range.
+        bounds (Optional[Dict]): Explicit (low, high) per parameter, overriding spread.
+
+    Returns:
+        Dict[str, Any]: Problem description used by the samplers and analysers.
+    """
+    nominal = kinetic_parameters(select_parameter_set(base_scenario["T_ad"]))
+    nominal.update({k: float(v) for k, v in (base_scenario.get("param_overrides") or {}).items()
+                    if k in nominal})
+    names = list(nominal) if names is None else list(names)
+    unknown = [n for n in names if n not in nominal]
+    if unknown:
+        raise ValueError(f"Not kinetic parameters of the selected set: {unknown}")
+    bounds = bounds or {}
+    table = np.array([bounds.get(n, (nominal[n] * (1 - spread), nominal[n] * (1 + spread)))
+                      for n in names], dtype=float)
+    if np.any(table[:, 1] <= table[:, 0]):
+        raise ValueError("Each parameter needs low < high")
+    return {"base": dict(base_scenario), "names": names,
+            "nominal": np.array([nominal[n] for n in names]), "bounds": table}
+
+
+def _scale(problem: Dict[str, Any], U: np.ndarray) -> np.ndarray:
+    lo, hi = problem["bounds"][:, 0], problem["bounds"][:, 1]
+    return lo + U * (hi - lo)
+
+
+def _unscale(problem: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    lo, hi = problem["bounds"][:, 0], problem["bounds"][:, 1]
+    return (X - lo) / (hi - lo)
+
+
+def evaluate(problem: Dict[str, Any], X: np.ndarray, executor: str = "process",
+             max_workers: Optional[int] = None, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """
+    Run the base scenario once per sample row and collect OUTPUTS.
+
+    Returns:
+        pd.DataFrame: One row per sample, one column per output.
+    """
+    base = problem["base"]
+    overrides = dict(base.get("param_overrides") or {})
+    scenarios = [
+        dict(base, param_overrides=dict(overrides, **dict(zip(problem["names"], map(float, row)))))
+        for row in X
+    ]
+    rows = run_scenarios(scenarios, executor=executor, max_workers=max_workers,
+                         reduce=sensitivity_outputs, cache_dir=cache_dir)
+    return pd.DataFrame(rows, columns=list(OUTPUTS))
+
+
+def morris_sample(problem: Dict[str, Any], r: int = 10, levels: int = 4,
+                  seed: Optional[int] = None) -> np.ndarray:
+    """
+    Morris one-at-a-time trajectories.
+
+    Returns:
+        np.ndarray: (r * (k + 1), k) parameter values; each block of k + 1 rows
+        is one trajectory that moves one parameter per row by delta.
+    """
+    k = len(problem["names"])
+    rng = np.random.default_rng(seed)
+    delta = levels / (2.0 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    U = np.empty((r * (k + 1), k))
+    for t in range(r):
+        x = rng.choice(grid, size=k)
+        rows = [x.copy()]
+        for j in rng.permutation(k):
+            up_ok, down_ok = x[j] + delta <= 1.0 + 1e-12, x[j] - delta >= -1e-12
+            step = delta if (up_ok and (not down_ok or rng.random() < 0.5)) else -delta
+            x[j] += step
+            rows.append(x.copy())
+        U[t * (k + 1):(t + 1) * (k + 1)] = rows
+    return _scale(problem, np.clip(U, 0.0, 1.0))
+
+
+def morris_analyze(problem: Dict[str, Any], X: np.ndarray, Y: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Elementary-effect statistics per output.
+
+    mu and sigma are the mean and standard deviation of the elementary effects
+    (per unit of the scaled [0, 1] range), mu_star the mean absolute effect.
+    """
+    k = len(problem["names"])
+    U = _unscale(problem, np.asarray(X, dtype=float))
+    r = len(U) // (k + 1)
+    indices = {}
+    for output in Y.columns:
+        y = Y[output].to_numpy(dtype=float)
+        effects = np.full((r, k), np.nan)
+        for t in range(r):
+            block = slice(t * (k + 1), (t + 1) * (k + 1))
+            dU, dy = np.diff(U[block], axis=0), np.diff(y[block])
+            j = np.argmax(np.abs(dU), axis=1)
+            effects[t, j] = dy / dU[np.arange(k), j]
+        indices[output] = pd.DataFrame({
+            "mu": np.nanmean(effects, axis=0),
+            "mu_star": np.nanmean(np.abs(effects), axis=0),
+            "sigma": np.nanstd(effects, axis=0, ddof=1) if r > 1 else np.zeros(k),
+        }, index=problem["names"])
+    return indices
+
+
+def saltelli_sample(problem: Dict[str, Any], n: int = 256, seed: Optional[int] = None) -> np.ndarray:
+    """
+    Saltelli design for first-order and total Sobol indices.
+
+    Returns:
+        np.ndarray: (n * (k + 2), k) rows ordered as blocks A, B, AB_1 .. AB_k.
+        n should be a power of two for the Sobol sequence to stay balanced.
+    """
+    k = len(problem["names"])
+    base = qmc.Sobol(d=2 * k, scramble=True, seed=seed).random(n)
+    A, B = base[:, :k], base[:, k:]
+    blocks = [A, B]
+    for i in range(k):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+    return _scale(problem, np.vstack(blocks))
+
+
+def sobol_analyze(problem: Dict[str, Any], Y: pd.DataFrame, n_resamples: int = 100,
+                  seed: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+    """First-order (S1) and total (ST) indices with 95% bootstrap half-widths."""
+    k = len(problem["names"])
+    n = len(Y) // (k + 2)
+    rng = np.random.default_rng(seed)
+    boot = rng.integers(0, n, size=(n_resamples, n))
+
+    def _indices(fA, fB, fAB):
+        V = np.var(np.concatenate([fA, fB], axis=-1), axis=-1)
+        S1 = np.mean(fB[..., None, :] * (fAB - fA[..., None, :]), axis=-1) / V[..., None]
+        ST = 0.5 * np.mean((fA[..., None, :] - fAB) ** 2, axis=-1) / V[..., None]
+        return S1, ST
+
+    indices = {}
+    for output in Y.columns:
+        y = Y[output].to_numpy(dtype=float)
+        fA, fB = y[:n], y[n:2 * n]
+        fAB = y[2 * n:].reshape(k, n)
+        S1, ST = _indices(fA, fB, fAB)
+        S1_b, ST_b = _indices(fA[boot], fB[boot], fAB[:, boot].transpose(1, 0, 2))
+        indices[output] = pd.DataFrame({
+            "S1": S1, "S1_conf": 1.96 * S1_b.std(axis=0, ddof=1),
+            "ST": ST, "ST_conf": 1.96 * ST_b.std(axis=0, ddof=1),
+        }, index=problem["names"])
+    return indices
+
+
+def morris(base_scenario: Dict[str, Any], names: Optional[Sequence[str]] = None, spread: float = 0.5,
+           r: int = 10, levels: int = 4, seed: Optional[int] = None,
+           **run_kwargs: Any) -> Dict[str, Any]:
+    """
+    Morris screening of the kinetic parameters.
+
+    run_kwargs are passed to evaluate (executor, max_workers, cache_dir).
+
+    Returns:
+        Dict[str, Any]: {"problem", "X", "Y", "indices"}.
+    """
+    problem = make_problem(base_scenario, names=names, spread=spread)
+    X = morris_sample(problem, r=r, levels=levels, seed=seed)
+    Y = evaluate(problem, X, **run_kwargs)
+    return {"problem": problem, "X": X, "Y": Y, "indices": morris_analyze(problem, X, Y)}
+
+
+def sobol(base_scenario: Dict[str, Any], names: Optional[Sequence[str]] = None, spread: float = 0.5,
+          n: int = 256, seed: Optional[int] = None, **run_kwargs: Any) -> Dict[str, Any]:
+    """
+    Sobol variance decomposition of the kinetic parameters.
+
+    run_kwargs are passed to evaluate (executor, max_workers, cache_dir).
+
+    Returns:
+        Dict[str, Any]: {"problem", "X", "Y", "indices"}.
+    """
+    problem = make_problem(base_scenario, names=names, spread=spread)
+    X = saltelli_sample(problem, n=n, seed=seed)
+    Y = evaluate(problem, X, **run_kwargs)
+    return {"problem": problem, "X": X, "Y": Y, "indices": sobol_analyze(problem, Y, seed=seed)}
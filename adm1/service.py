@@ -0,0 +1,574 @@
+"""
+Local simulation service: a job queue in front of a warm worker pool.
+
+One process per host owns a ProcessPoolExecutor whose workers have imported
+the model, its dependencies and run a short warm-up simulation, so requests
+from notebooks and dashboards start simulating at once and share the cores
+instead of competing for them. Clients talk JSON over HTTP, on localhost or
+on a Unix socket; nothing leaves the host.
+
+    python -m adm1 serve --socket /tmp/adm1.sock --workers 4 --cache .adm1_cache
+
+Requests (POST /jobs):
+- {"kind": "scenario", "scenario": {ADM1_coAD arguments}, "outputs":
+  "summary" | "full", "warm_start": library path (optional)}: one ADM1_coAD
+  run, validated like a scenario file (see adm1.cli); "full" adds the
+  state, gasflow and inhibition tables as columns;
+- {"kind": "bmp", "bottles": [...], other simulate_bmp arguments}: a BMP
+  batch (see adm1.bmp);
+- optional "priority" (higher runs first, default 0).
+
+Endpoints:
+- POST /jobs -> {"id", "status", "deduplicated"}
+- GET /jobs -> status of all jobs (no results)
+- GET /jobs/<id> -> status, progress, result or error
+- GET /jobs/<id>/events -> newline-delimited JSON progress events until the
+  job ends; the last event carries the final status
+- DELETE /jobs/<id> -> cancel a queued job
+- GET /health -> workers, queued and running counts
+
+Contract:
+- new_service(workers, cache_dir) -> service dict; submit(service, request)
+  / job_view(service, job_id) / list_jobs(service) / cancel(service, job_id)
+  / shutdown(service) work without the HTTP layer.
+- make_server(service, host, port, socket_path) / serve(...) run the HTTP
+  front end; submit_job / get_job / wait_job are the matching client calls
+  (address "http://host:port" or a Unix socket path).
+
+Notes:
+- Identical requests (same kind, arguments and outputs; priority aside) share
+  one job: the job id is the request hash, which covers the contents of a
+  warm-start library, not just its path. With cache_dir, finished results
+  are stored through the adm1.runner cache and served without simulating,
+  also after a restart. A failed or cancelled job is rerun on resubmission.
+- At most `workers` jobs are handed to the pool; the rest wait in the
+  priority queue, so a late high-priority job overtakes queued ones.
+- Scenario progress is reported from the worker through the per-step
+  stop_condition hook, at most every 1 % of the run. A scenario submitted
+  in-process (not over HTTP) may bring its own picklable stop_condition;
+  the hook calls it after reporting. It is part of the job id like any
+  other argument; one without a stable cache key (see
+  adm1.runner.scenario_key) is rejected with ValueError.
+"""
+
+import hashlib
+import heapq
+import http.client
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from adm1.runner import _cache_load, _cache_path, _cache_store, scenario_key
+
+
+KINDS = ("scenario", "bmp")
+OUTPUTS = ("summary", "full")
+FINAL_STATUSES = ("done", "failed", "cancelled")
+RESULT_TABLES = ("simulate_results", "gasflow", "inhibition")
+
+WARMUP_SCENARIO = dict(
+    q_ad_init=193.3, density=1.0, VS_per_TS_PS=0.986, VS_per_TS_SS=0.851, TS_fraction=0.1,
+    mixing_ratio=0.7, mixing_ratio2=0.9, OLR=4.0, T_ad=308.15, T_base=298.15, T_op=308.15,
+    recycle_ratio=0.0, days=2, timesteps="Day(s)",
+)
+
+# Worker-process state, set by _init_worker
+_progress_queue = None
+_libraries: Dict[str, Any] = {}
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+
+
+def _init_worker(progress_queue) -> None:
+    """Pool initializer: keep the progress queue, import everything and run a short simulation."""
+    global _progress_queue
+    _progress_queue = progress_queue
+    from adm1.cli import complete_scenario
+    from adm1.coAD import ADM1_coAD
+    importlib.import_module("adm1.bmp")
+    ADM1_coAD(**dict(complete_scenario(WARMUP_SCENARIO), verbose=False))
+
+
+def _jsonable(value: Any) -> Any:
+    """Results as JSON types: arrays to lists, DataFrames to {column: list}."""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, "to_dict") and hasattr(value, "columns"):
+        return {str(c): value[c].tolist() for c in value.columns}
+    return value
+
+
+def _warm_library(path: str) -> Dict[str, Any]:
+    """Warm-start library of `path`, loaded once per worker and reloaded when the file changes."""
+    from adm1.warmstart import load_library
+    mtime = os.path.getmtime(path)
+    cached = _libraries.get(path)
+    if cached is None or cached[0] != mtime:
+        _libraries[path] = (mtime, load_library(path))
+    return _libraries[path][1]
+
+
+def _progress_hook(job_id: str, days: float,
+                   user_stop: Optional[Callable[[float, Any], bool]] = None) -> Callable[[float, Any], bool]:
+    last = [-1.0]
+
+    def stop_condition(t, state):
+        fraction = min(float(t) / days, 1.0) if days > 0 else 1.0
+        if _progress_queue is not None and fraction - last[0] >= 0.01:
+            last[0] = fraction
+            _progress_queue.put((job_id, fraction, float(t)))
+        return bool(user_stop(t, state)) if user_stop is not None else False
+    return stop_condition
+
+
+def _run_job(job_id: str, kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute one request in a worker and return its JSON-ready result."""
+    if kind == "bmp":
+        from adm1.bmp import simulate_bmp
+        return _jsonable(simulate_bmp(**request))
+
+    from adm1.cli import summarize
+    from adm1.coAD import ADM1_coAD
+    from adm1.warmstart import is_converged, warm_started
+    scenario = request["scenario"]
+    if request.get("warm_start"):
+        scenario = warm_started(scenario, _warm_library(request["warm_start"]))
+    hook = _progress_hook(job_id, scenario["days"], scenario.get("stop_condition"))
+    result = ADM1_coAD(**dict(scenario, verbose=False, stop_condition=hook))
+    out = dict(summarize(result), converged=is_converged(result), warm_started=scenario.get("initials") is not None)
+    if request.get("outputs") == "full":
+        out["u"] = result["u"]
+        out.update({table: result[table] for table in RESULT_TABLES})
+    return _jsonable(out)
+
+
+# ---------------------------------------------------------------------------
+# Service side
+
+
+def _normalize(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Validated request without the scheduling fields; raises ValueError."""
+    from adm1.cli import complete_scenario
+    request = dict(request)
+    kind = request.pop("kind", "scenario")
+    request.pop("priority", None)
+    if kind not in KINDS:
+        raise ValueError(f"Unknown job kind {kind!r}; expected one of {KINDS}")
+    if kind == "bmp":
+        if not request.get("bottles"):
+            raise ValueError("A bmp job needs a non-empty 'bottles' list")
+        return dict(request, kind=kind)
+    unknown = sorted(set(request) - {"scenario", "outputs", "warm_start"})
+    if unknown:
+        raise ValueError(f"Unknown scenario job fields {unknown}")
+    if not isinstance(request.get("scenario"), dict):
+        raise ValueError("A scenario job needs a 'scenario' dict of ADM1_coAD arguments")
+    outputs = request.get("outputs", "summary")
+    if outputs not in OUTPUTS:
+        raise ValueError(f"Unknown outputs {outputs!r}; expected one of {OUTPUTS}")
+    warm_start = request.get("warm_start")
+    if warm_start is not None and not os.path.exists(warm_start):
+        raise ValueError(f"Warm-start library {warm_start!r} not found")
+    # A stop_condition cannot come through a scenario file or JSON, only from in-process callers
+    scenario = dict(request["scenario"])
+    user_stop = scenario.pop("stop_condition", None)
+    if user_stop is not None and not callable(user_stop):
+        raise ValueError("stop_condition must be callable")
+    scenario = complete_scenario(scenario)
+    if user_stop is not None:
+        scenario["stop_condition"] = user_stop
+    return {"kind": kind, "scenario": scenario, "outputs": outputs, "warm_start": warm_start}
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _job_id(request: Dict[str, Any]) -> str:
+    """Hash of a normalized request, including the warm-start library contents."""
+    if request.get("warm_start"):
+        request = dict(request, warm_start_digest=_file_digest(request["warm_start"]))
+    return scenario_key(request)[:20]
+
+
+def new_service(workers: Optional[int] = None, cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Start the warm worker pool and the progress listener.
+
+    Parameters:
+        workers (Optional[int]): Worker processes; one per core if None.
+        cache_dir (Optional[str]): Result cache directory (adm1.runner format).
+
+    Returns:
+        Dict[str, Any]: Service state for submit / job_view / cancel / shutdown.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    progress_queue = multiprocessing.Queue()
+    service = {
+        "workers": workers,
+        "cache_dir": cache_dir,
+        "pool": ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(progress_queue,)),
+        "progress_queue": progress_queue,
+        "jobs": {},
+        "queue": [],
+        "sequence": itertools.count(),
+        "running": 0,
+        "closed": False,
+    }
+    # One lock guards the job table; the condition on it wakes event streams
+    service["lock"] = threading.Lock()
+    service["changed"] = threading.Condition(service["lock"])
+    listener = threading.Thread(target=_listen_progress, args=(service,), daemon=True)
+    listener.start()
+    service["listener"] = listener
+    return service
+
+
+def _listen_progress(service: Dict[str, Any]) -> None:
+    while True:
+        message = service["progress_queue"].get()
+        if message is None:
+            return
+        job_id, fraction, t = message
+        with service["changed"]:
+            job = service["jobs"].get(job_id)
+            if job is not None and job["status"] == "running":
+                job["progress"], job["t"] = fraction, t
+                job["version"] += 1
+                service["changed"].notify_all()
+
+
+def _new_job(job_id: str, request: Dict[str, Any], priority: float) -> Dict[str, Any]:
+    return {"id": job_id, "kind": request["kind"], "request": request, "priority": priority,
+            "status": "queued", "progress": 0.0, "t": 0.0, "submitted": time.time(), "started": None,
+            "finished": None, "result": None, "error": None, "version": 0}
+
+
+def submit(service: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Queue a request, or attach to an identical one.
+
+    Returns:
+        Dict[str, Any]: {"id", "status", "deduplicated"}.
+    """
+    priority = float(request.get("priority", 0))
+    request = _normalize(request)
+    job_id = _job_id(request)
+    with service["changed"]:
+        if service["closed"]:
+            raise ValueError("Service is shut down")
+        job = service["jobs"].get(job_id)
+        if job is not None and job["status"] not in ("failed", "cancelled"):
+            if job["status"] == "queued" and priority > job["priority"]:
+                job["priority"] = priority
+                heapq.heappush(service["queue"], (-priority, next(service["sequence"]), job_id))
+            return {"id": job_id, "status": job["status"], "deduplicated": True}
+        job = _new_job(job_id, request, priority)
+        service["jobs"][job_id] = job
+        cache_dir = service["cache_dir"]
+        if cache_dir is not None and os.path.exists(_cache_path(cache_dir, job_id)):
+            job.update(status="done", progress=1.0, result=_cache_load(cache_dir, job_id), finished=time.time())
+            service["changed"].notify_all()
+            return {"id": job_id, "status": "done", "deduplicated": True}
+        heapq.heappush(service["queue"], (-priority, next(service["sequence"]), job_id))
+        _dispatch(service)
+        return {"id": job_id, "status": job["status"], "deduplicated": False}
+
+
+def _dispatch(service: Dict[str, Any]) -> None:
+    """Hand queued jobs to the pool while workers are free (lock held)."""
+    while service["running"] < service["workers"] and service["queue"]:
+        _, _, job_id = heapq.heappop(service["queue"])
+        job = service["jobs"][job_id]
+        if job["status"] != "queued":
+            continue  # cancelled, or a stale entry of a re-prioritized job
+        request = dict(job["request"])
+        kind = request.pop("kind")
+        job.update(status="running", started=time.time())
+        job["version"] += 1
+        service["running"] += 1
+        future = service["pool"].submit(_run_job, job_id, kind, request)
+        future.add_done_callback(lambda f, job_id=job_id: _finished(service, job_id, f))
+    service["changed"].notify_all()
+
+
+def _finished(service: Dict[str, Any], job_id: str, future) -> None:
+    error = future.exception()
+    result = None if error is not None else future.result()
+    if error is None and service["cache_dir"] is not None:
+        _cache_store(service["cache_dir"], job_id, result)
+    with service["changed"]:
+        job = service["jobs"][job_id]
+        service["running"] -= 1
+        if error is None:
+            job.update(status="done", progress=1.0, result=result)
+        else:
+            job.update(status="failed", error=f"{type(error).__name__}: {error}")
+        job["finished"] = time.time()
+        job["version"] += 1
+        if not service["closed"]:
+            _dispatch(service)
+        service["changed"].notify_all()
+
+
+def _view(job: Dict[str, Any], with_result: bool) -> Dict[str, Any]:
+    """Public fields of a job (lock held)."""
+    view = {k: job[k] for k in ("id", "kind", "priority", "status", "progress", "t", "submitted", "started",
+                                "finished", "error")}
+    if with_result:
+        view["result"] = job["result"]
+    return view
+
+
+def job_view(service: Dict[str, Any], job_id: str, with_result: bool = True) -> Dict[str, Any]:
+    """Public fields of a job; raises KeyError for unknown ids."""
+    with service["lock"]:
+        return _view(service["jobs"][job_id], with_result)
+
+
+def list_jobs(service: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Status of all jobs (no results), from one snapshot of the job table."""
+    with service["lock"]:
+        return [_view(job, with_result=False) for job in service["jobs"].values()]
+
+
+def cancel(service: Dict[str, Any], job_id: str) -> bool:
+    """Cancel a queued job; False if it is already running or finished."""
+    with service["changed"]:
+        job = service["jobs"][job_id]
+        if job["status"] != "queued":
+            return False
+        job.update(status="cancelled", finished=time.time())
+        job["version"] += 1
+        service["changed"].notify_all()
+        return True
+
+
+def events(service: Dict[str, Any], job_id: str, timeout: float = 30.0) -> Iterator[Dict[str, Any]]:
+    """Yield a job's status whenever it changes, ending with its final state (keep-alive every timeout s)."""
+    version = -1
+    while True:
+        with service["changed"]:
+            job = service["jobs"][job_id]
+            service["changed"].wait_for(lambda: job["version"] != version, timeout)
+            version = job["version"]
+        view = job_view(service, job_id, with_result=False)
+        yield view
+        if view["status"] in FINAL_STATUSES:
+            return
+
+
+def shutdown(service: Dict[str, Any]) -> None:
+    """Cancel queued jobs, wait for the running ones and stop the workers."""
+    with service["changed"]:
+        service["closed"] = True
+        for job in service["jobs"].values():
+            if job["status"] == "queued":
+                job.update(status="cancelled", finished=time.time())
+                job["version"] += 1
+        service["changed"].notify_all()
+    service["pool"].shutdown(wait=True)
+    service["progress_queue"].put(None)
+    service["listener"].join()
+
+
+# ---------------------------------------------------------------------------
+# HTTP front end
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "adm1-service"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_path(self):
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if len(parts) >= 2 and parts[0] == "jobs":
+            return parts[1], parts[2:]
+        return None, parts
+
+    def do_GET(self):
+        service = self.server.service
+        job_id, rest = self._job_path()
+        if job_id is None:
+            if rest == ["health"]:
+                with service["lock"]:
+                    queued = sum(j["status"] == "queued" for j in service["jobs"].values())
+                    body = {"workers": service["workers"], "running": service["running"], "queued": queued}
+                return self._send(200, body)
+            if rest == ["jobs"]:
+                return self._send(200, list_jobs(service))
+            return self._send(404, {"error": f"Unknown path {self.path}"})
+        if job_id not in service["jobs"]:
+            return self._send(404, {"error": f"Unknown job {job_id}"})
+        if rest == ["events"]:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            try:
+                for event in events(service, job_id):
+                    self.wfile.write(json.dumps(event).encode() + b"\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            self.close_connection = True
+            return None
+        if rest:
+            return self._send(404, {"error": f"Unknown path {self.path}"})
+        return self._send(200, job_view(service, job_id))
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send(404, {"error": f"Unknown path {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Expected a JSON object")
+            return self._send(202, submit(self.server.service, request))
+        except ValueError as exc:
+            return self._send(400, {"error": str(exc)})
+
+    def do_DELETE(self):
+        service = self.server.service
+        job_id, rest = self._job_path()
+        if job_id is None or rest or job_id not in service["jobs"]:
+            return self._send(404, {"error": f"Unknown path {self.path}"})
+        if not cancel(service, job_id):
+            return self._send(409, {"error": f"Job {job_id} is {service['jobs'][job_id]['status']}"})
+        return self._send(200, {"id": job_id, "status": "cancelled"})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: Dict[str, Any], host: str = "127.0.0.1", port: int = 8765,
+                socket_path: Optional[str] = None, verbose: bool = False):
+    """HTTP server for `service` on host:port, or on a Unix socket when socket_path is given."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def serve(workers: Optional[int] = None, cache_dir: Optional[str] = None, host: str = "127.0.0.1",
+          port: int = 8765, socket_path: Optional[str] = None, verbose: bool = False) -> None:
+    """Run the service until interrupted."""
+    service = new_service(workers, cache_dir)
+    server = make_server(service, host, port, socket_path, verbose)
+    where = socket_path or f"http://{host}:{port}"
+    print(f"adm1 service on {where} with {service['workers']} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+        shutdown(service)
+
+
+# ---------------------------------------------------------------------------
+# Client
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connection(address: str, timeout: Optional[float] = None) -> http.client.HTTPConnection:
+    if address.startswith("http://"):
+        return http.client.HTTPConnection(address[len("http://"):].rstrip("/"), timeout=timeout)
+    return _UnixHTTPConnection(address, timeout=timeout)
+
+
+def _call(address: str, method: str, path: str, body: Any = None) -> Any:
+    conn = _connection(address)
+    try:
+        data = None if body is None else json.dumps(body).encode()
+        conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        payload = json.loads(response.read() or b"null")
+    finally:
+        conn.close()
+    if response.status >= 400:
+        raise ValueError(payload.get("error") if isinstance(payload, dict) else payload)
+    return payload
+
+
+def submit_job(address: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """POST a request; returns {"id", "status", "deduplicated"}."""
+    return _call(address, "POST", "/jobs", request)
+
+
+def get_job(address: str, job_id: str) -> Dict[str, Any]:
+    """Status, progress and (when done) the result of a job."""
+    return _call(address, "GET", f"/jobs/{job_id}")
+
+
+def wait_job(address: str, job_id: str, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+             ) -> Dict[str, Any]:
+    """Follow a job's event stream until it ends and return the final job (with result)."""
+    conn = _connection(address)
+    try:
+        conn.request("GET", f"/jobs/{job_id}/events")
+        response = conn.getresponse()
+        if response.status >= 400:
+            raise ValueError(json.loads(response.read()).get("error"))
+        for line in response:
+            if line.strip() and on_progress is not None:
+                on_progress(json.loads(line))
+    finally:
+        conn.close()
+    return get_job(address, job_id)
@@ -0,0 +1,344 @@
+"""
+Gaussian-process surrogate of ADM1_coAD over the design space.
+
+Trains one GP per target on ADM1_coAD runs spread over DESIGN_VARIABLES
+(mixing_ratio, mixing_ratio2, OLR, TS_fraction, T_ad) and predicts
+biomethane_yield, VS_reduction and final pH with a standard deviation, at
+the cost of a few small matrix-vector products per query.
+
+Contract:
+- design_scenario(base_scenario, x) -> ADM1_coAD kwargs with the design
+  variables set from x (T_op follows T_ad).
+- sample_design(bounds, n, seed) -> (n, 5) Latin hypercube design.
+- run_design(base_scenario, X, ...) -> (n, 3) targets, evaluated through
+  adm1.runner.run_scenarios (process pool + optional on-disk cache).
+- train(X, Y, bounds) -> model dict; predict(model, X) -> (mean, std).
+- adaptive_fit(base_scenario, ...) grows the design where the surrogate is
+  least certain and returns the trained model.
+- save_model(model, path) / load_model(path) write and read JSON.
+
+Notes:
+- Kernel: anisotropic squared exponential plus a noise term on inputs
+  scaled to the unit box and targets standardized per column;
+  hyperparameters maximize the log marginal likelihood (L-BFGS-B with
+  restarts). The noise variance is kept at or above NOISE_FLOOR times the
+  signal variance, which bounds the condition number of K.
+- Query cost is O(n) for the mean and O(n^2) for the variance with n
+  training runs; the variance uses a triangular solve with the Cholesky
+  factor of K kept in the model (never an explicit K^-1, which loses the
+  small posterior variances near training points), so keep n in the
+  hundreds.
+- T_ad crosses the mesophilic/thermophilic parameter-set switch of
+  select_parameter_set; bounds that straddle 40-45 C give a surrogate with
+  a steep step there and correspondingly wide uncertainty. Fit the two
+  regimes separately when both matter.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.linalg import cho_solve, cholesky, solve_triangular
+from scipy.optimize import minimize
+from scipy.stats import qmc
+
+from adm1.runner import run_scenarios
+
+
+DESIGN_VARIABLES = ("mixing_ratio", "mixing_ratio2", "OLR", "TS_fraction", "T_ad")
+DEFAULT_BOUNDS = {
+    "mixing_ratio": (0.3, 0.9),
+    "mixing_ratio2": (0.5, 1.0),
+    "OLR": (2.0, 6.0),
+    "TS_fraction": (0.05, 0.15),
+    "T_ad": (303.15, 313.15),
+}
+TARGETS = ("biomethane_yield", "VS_reduction", "final_pH")
+
+MODEL_VERSION = 1
+# Lower bound of noise_var / signal_var
+NOISE_FLOOR = 1e-6
+_JITTER = 1e-8
+
+
+def surrogate_outputs(result: Dict[str, Any]) -> Tuple[float, float, float]:
+    """Reduce an ADM1_coAD result to TARGETS."""
+    return (float(result["biomethane_yield"]), float(result["VS_reduction"]),
+            float(result["simulate_results"]["pH"].iloc[-1]))
+
+
+def _bounds_table(bounds: Optional[Dict[str, Tuple[float, float]]]) -> np.ndarray:
+    merged = dict(DEFAULT_BOUNDS, **(bounds or {}))
+    unknown = [name for name in merged if name not in DESIGN_VARIABLES]
+    if unknown:
+        raise ValueError(f"Not design variables: {unknown}")
+    table = np.array([merged[name] for name in DESIGN_VARIABLES], dtype=float)
+    if np.any(table[:, 1] <= table[:, 0]):
+        raise ValueError("Each design variable needs low < high")
+    return table
+
+
+def design_scenario(base_scenario: Dict[str, Any], x: Sequence[float]) -> Dict[str, Any]:
+    """Copy of base_scenario with the design variables taken from x."""
+    scenario = dict(base_scenario, **{name: float(v) for name, v in zip(DESIGN_VARIABLES, x)})
+    scenario["T_op"] = scenario["T_ad"]
+    return scenario
+
+
+def sample_design(bounds: Optional[Dict[str, Tuple[float, float]]] = None, n: int = 20,
+                  seed: Optional[int] = None) -> np.ndarray:
+    """Latin hypercube sample of n design points within bounds."""
+    table = _bounds_table(bounds)
+    U = qmc.LatinHypercube(d=len(DESIGN_VARIABLES), seed=seed).random(n)
+    return table[:, 0] + U * (table[:, 1] - table[:, 0])
+
+
+def run_design(base_scenario: Dict[str, Any], X: np.ndarray, executor: str = "process",
+               max_workers: Optional[int] = None, cache_dir: Optional[str] = None) -> np.ndarray:
+    """High-fidelity runs at the design points X; returns (n, len(TARGETS))."""
+    scenarios = [design_scenario(base_scenario, x) for x in np.atleast_2d(X)]
+    rows = run_scenarios(scenarios, executor=executor, max_workers=max_workers,
+                         reduce=surrogate_outputs, cache_dir=cache_dir)
+    return np.array(rows, dtype=float).reshape(len(scenarios), len(TARGETS))
+
+
+def _kernel(A: np.ndarray, B: np.ndarray, lengthscales: np.ndarray, signal_var: float) -> np.ndarray:
+    d2 = (((A[:, None, :] - B[None, :, :]) / lengthscales) ** 2).sum(axis=-1)
+    return signal_var * np.exp(-0.5 * d2)
+
+
+def _nugget(signal_var: float, noise_var: float) -> float:
+    """Diagonal term added to K: the noise variance (floored) plus jitter."""
+    return max(noise_var, NOISE_FLOOR * signal_var) + _JITTER
+
+
+def _neg_log_likelihood(theta: np.ndarray, U: np.ndarray, y: np.ndarray) -> float:
+    d = U.shape[1]
+    lengthscales, signal_var = np.exp(theta[:d]), np.exp(theta[d])
+    noise_var = signal_var * np.exp(theta[d + 1])
+    K = _kernel(U, U, lengthscales, signal_var) + _nugget(signal_var, noise_var) * np.eye(len(U))
+    try:
+        L = cholesky(K, lower=True)
+    except np.linalg.LinAlgError:
+        return 1e25
+    alpha = cho_solve((L, True), y)
+    return float(0.5 * y @ alpha + np.log(np.diag(L)).sum() + 0.5 * len(y) * np.log(2 * np.pi))
+
+
+def fit_gp(U: np.ndarray, y: np.ndarray, restarts: int = 4, seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fit one GP to standardized targets y at unit-box inputs U.
+
+    Returns:
+        Dict[str, Any]: {"lengthscales", "signal_var", "noise_var", "alpha", "L"}.
+    """
+    n, d = U.shape
+    rng = np.random.default_rng(seed)
+    # The last hyperparameter is log(noise_var / signal_var)
+    box = [(np.log(1e-2), np.log(1e2))] * d + [(np.log(1e-2), np.log(1e2)), (np.log(NOISE_FLOOR), np.log(1.0))]
+    starts = [np.r_[np.zeros(d), 0.0, np.log(1e-4)]]
+    starts += [np.array([rng.uniform(lo, hi) for lo, hi in box]) for _ in range(restarts)]
+    best = None
+    for theta0 in starts:
+        res = minimize(_neg_log_likelihood, theta0, args=(U, y), method="L-BFGS-B", bounds=box)
+        if best is None or res.fun < best.fun:
+            best = res
+    theta = best.x
+    gp = {"lengthscales": np.exp(theta[:d]), "signal_var": float(np.exp(theta[d])),
+          "noise_var": float(np.exp(theta[d] + theta[d + 1]))}
+    return _condition(gp, U, y)
+
+
+def _condition(gp: Dict[str, Any], U: np.ndarray, y: np.ndarray) -> Dict[str, Any]:
+    K = _kernel(U, U, gp["lengthscales"], gp["signal_var"])
+    K[np.diag_indices_from(K)] += _nugget(gp["signal_var"], gp["noise_var"])
+    gp["L"] = cholesky(K, lower=True)
+    gp["alpha"] = cho_solve((gp["L"], True), y)
+    return gp
+
+
+def _whiten(gp: Dict[str, Any], k: np.ndarray) -> np.ndarray:
+    """L^-1 k^T for cross-covariances k (m, n); its squared column sums are k K^-1 k^T."""
+    return solve_triangular(gp["L"], k.T, lower=True, check_finite=False)
+
+
+def _stack(gps: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Per-target GP arrays stacked along a leading target axis for predict."""
+    return {key: np.array([gp[key] for gp in gps], dtype=float)
+            for key in ("lengthscales", "signal_var", "alpha")}
+
+
+def train(X: np.ndarray, Y: np.ndarray, bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+          restarts: int = 4, seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fit one GP per target to design points X (n, 5) and targets Y (n, 3).
+
+    Returns:
+        Dict[str, Any]: Model dict used by predict, save_model and adaptive_fit.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    Y = np.asarray(Y, dtype=float).reshape(len(X), len(TARGETS))
+    if not np.all(np.isfinite(Y)):
+        raise ValueError("Training targets contain NaN or inf")
+    table = _bounds_table(bounds)
+    U = (X - table[:, 0]) / (table[:, 1] - table[:, 0])
+    y_mean = Y.mean(axis=0)
+    y_std = np.where(Y.std(axis=0) > 0, Y.std(axis=0), 1.0)
+    gps = [fit_gp(U, (Y[:, j] - y_mean[j]) / y_std[j], restarts=restarts, seed=seed)
+           for j in range(len(TARGETS))]
+    return {"variables": list(DESIGN_VARIABLES), "targets": list(TARGETS), "bounds": table,
+            "X": X, "Y": Y, "U": U, "y_mean": y_mean, "y_std": y_std, "gps": gps, "stack": _stack(gps)}
+
+
+def predict(model: Dict[str, Any], X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Surrogate mean and standard deviation at design points X.
+
+    Parameters:
+        model (Dict[str, Any]): Trained model.
+        X (np.ndarray): (5,) point or (m, 5) points in DESIGN_VARIABLES order.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: mean and std, (3,) or (m, 3) in TARGETS order.
+    """
+    X = np.asarray(X, dtype=float)
+    single = X.ndim == 1
+    table, stack = model["bounds"], model["stack"]
+    U = (np.atleast_2d(X) - table[:, 0]) / (table[:, 1] - table[:, 0])
+    # All targets at once: k is (targets, m, n)
+    scaled = (U[None, :, None, :] - model["U"][None, None, :, :]) / stack["lengthscales"][:, None, None, :]
+    k = stack["signal_var"][:, None, None] * np.exp(-0.5 * (scaled ** 2).sum(axis=-1))
+    mean = (k @ stack["alpha"][:, :, None])[..., 0].T
+    var = np.array([gp["signal_var"] - (_whiten(gp, k_j) ** 2).sum(axis=0)
+                    for gp, k_j in zip(model["gps"], k)]).T
+    mean = model["y_mean"] + mean * model["y_std"]
+    std = np.sqrt(np.maximum(var, 0.0)) * model["y_std"]
+    return (mean[0], std[0]) if single else (mean, std)
+
+
+def _pick_batch(model: Dict[str, Any], candidates: np.ndarray, batch_size: int) -> np.ndarray:
+    """
+    Greedy maximum-variance batch: after each pick, the posterior covariance
+    of the candidates is conditioned on the pick as if it had been observed
+    (the update does not need its target value), so a batch does not
+    cluster around one uncertain spot.
+    """
+    table = model["bounds"]
+    Uc = (candidates - table[:, 0]) / (table[:, 1] - table[:, 0])
+    chosen = []
+    whitened = []  # L^-1 k(train, candidates) per target
+    updates = []   # rank-one covariance updates of the picks so far, per target
+    var = []
+    for gp in model["gps"]:
+        V = _whiten(gp, _kernel(Uc, model["U"], gp["lengthscales"], gp["signal_var"]))
+        whitened.append(V)
+        updates.append([])
+        var.append(gp["signal_var"] - (V ** 2).sum(axis=0))
+    var = np.maximum(np.array(var), 0.0)  # (targets, candidates), standardized units
+    for _ in range(min(batch_size, len(candidates))):
+        score = var.max(axis=0)
+        score[chosen] = -np.inf
+        i = int(np.argmax(score))
+        chosen.append(i)
+        for j, gp in enumerate(model["gps"]):
+            V = whitened[j]
+            # Current posterior covariance between every candidate and the pick
+            cov = _kernel(Uc, Uc[i:i + 1], gp["lengthscales"], gp["signal_var"])[:, 0] - V.T @ V[:, i]
+            for w in updates[j]:
+                cov -= w * w[i]
+            w = cov / np.sqrt(var[j, i] + _nugget(gp["signal_var"], gp["noise_var"]))
+            updates[j].append(w)
+            var[j] = np.maximum(var[j] - w ** 2, 0.0)
+    return candidates[chosen]
+
+
+def adaptive_fit(base_scenario: Dict[str, Any], bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                 n_initial: int = 20, n_max: int = 80, batch_size: int = 4,
+                 n_candidates: int = 2000, tol: float = 0.05, seed: Optional[int] = None,
+                 executor: str = "process", max_workers: Optional[int] = None,
+                 cache_dir: Optional[str] = None, verbose: bool = False) -> Dict[str, Any]:
+    """
+    Train a surrogate, adding high-fidelity runs where it is least certain.
+
+    Starts from a Latin hypercube of n_initial runs. Each round scores a fresh
+    candidate set by the largest predictive std over the targets (relative to
+    each target's spread), runs the batch_size most uncertain candidates and
+    refits, until that std falls below tol or n_max runs are spent.
+
+    Parameters:
+        base_scenario (Dict[str, Any]): ADM1_coAD kwargs for everything but the design variables.
+        bounds (Optional[Dict]): (low, high) per design variable, DEFAULT_BOUNDS otherwise.
+        tol (float): Stop when max std / target std over the candidates is below this.
+        executor, max_workers, cache_dir: Passed to run_scenarios.
+
+    Returns:
+        Dict[str, Any]: Trained model; model["history"] lists (n_runs, max relative std).
+    """
+    if n_initial < 2 or n_max < n_initial:
+        raise ValueError("Need 2 <= n_initial <= n_max")
+    rng = np.random.default_rng(seed)
+    run_kwargs = dict(executor=executor, max_workers=max_workers, cache_dir=cache_dir)
+    X = sample_design(bounds, n_initial, seed=rng.integers(2**32))
+    Y = run_design(base_scenario, X, **run_kwargs)
+    history = []
+    while True:
+        model = train(X, Y, bounds, seed=rng.integers(2**32))
+        candidates = sample_design(bounds, n_candidates, seed=rng.integers(2**32))
+        _, std = predict(model, candidates)
+        score = float((std / model["y_std"]).max())
+        history.append((len(X), score))
+        if verbose:
+            print(f"surrogate: {len(X)} runs, max relative std {score:.4f}")
+        if score < tol or len(X) >= n_max:
+            break
+        new_X = _pick_batch(model, candidates, min(batch_size, n_max - len(X)))
+        X = np.vstack([X, new_X])
+        Y = np.vstack([Y, run_design(base_scenario, new_X, **run_kwargs)])
+    model["history"] = history
+    return model
+
+
+def save_model(model: Dict[str, Any], path: str) -> None:
+    """Write the model (training data and hyperparameters) atomically as JSON."""
+    payload = {
+        "version": MODEL_VERSION,
+        "variables": model["variables"],
+        "targets": model["targets"],
+        "bounds": model["bounds"].tolist(),
+        "X": model["X"].tolist(),
+        "Y": model["Y"].tolist(),
+        "gps": [{"lengthscales": gp["lengthscales"].tolist(), "signal_var": gp["signal_var"],
+                 "noise_var": gp["noise_var"]} for gp in model["gps"]],
+        "history": model.get("history", []),
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh)
+    os.replace(tmp_path, path)
+
+
+def load_model(path: str) -> Dict[str, Any]:
+    """Read a model written by save_model and rebuild its prediction arrays."""
+    with open(path, "r", encoding="utf-8") as fh:
+        payload = json.load(fh)
+    if payload.get("version") != MODEL_VERSION:
+        raise ValueError(f"Unsupported surrogate model version in {path}: {payload.get('version')}")
+    if tuple(payload["variables"]) != DESIGN_VARIABLES or tuple(payload["targets"]) != TARGETS:
+        raise ValueError(f"Surrogate model in {path} was trained on different variables or targets")
+    table = np.array(payload["bounds"], dtype=float)
+    X = np.array(payload["X"], dtype=float)
+    Y = np.array(payload["Y"], dtype=float)
+    U = (X - table[:, 0]) / (table[:, 1] - table[:, 0])
+    y_mean = Y.mean(axis=0)
+    y_std = np.where(Y.std(axis=0) > 0, Y.std(axis=0), 1.0)
+    gps = []
+    for j, stored in enumerate(payload["gps"]):
+        gp = {"lengthscales": np.array(stored["lengthscales"]), "signal_var": stored["signal_var"],
+              "noise_var": stored["noise_var"]}
+        gps.append(_condition(gp, U, (Y[:, j] - y_mean[j]) / y_std[j]))
+    return {"variables": list(DESIGN_VARIABLES), "targets": list(TARGETS), "bounds": table,
+            "X": X, "Y": Y, "U": U, "y_mean": y_mean, "y_std": y_std, "gps": gps,
+            "stack": _stack(gps), "history": [tuple(h) for h in payload.get("history", [])]}
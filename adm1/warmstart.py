@@ -0,0 +1,190 @@
+"""
+Steady-state warm-start library for ADM1_coAD.
+
+Converged end states of finished runs are stored on disk, indexed by the
+scenario features (mixing_ratio, mixing_ratio2, OLR, T_ad) and by a
+parameter key (temperature-selected parameter set + hash of
+param_overrides). New runs look up the nearest stored state, or an
+inverse-distance interpolation of the k nearest, and pass it as `initials`
+so they start close to their attractor instead of from get_initial_state.
+
+Contract:
+- load_library(path) / save_library(library, path) read and write a JSON file.
+- add_to_library(library, scenario, result) stores result's end state when
+  is_converged(result) holds; returns True if stored. add_end_state stores
+  an already extracted end state.
+- lookup_initial_state(library, scenario, k=1) returns a dict in the
+  get_initial_state format (including 'pH'), or None without a match.
+- warm_started(scenario, library) returns a copy of the scenario with
+  `initials` filled in when a match exists.
+
+Notes:
+- Only entries with the same parameter key are candidates; states from a
+  different kinetic parameter set are never mixed in.
+- Features are compared on FEATURE_SCALES, so 0.1 in mixing ratio weighs the
+  same as 1 kg VS/m3/d in OLR and 3 K in T_ad.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from adm1.constants import STATE_NAMES
+from adm1.params import select_parameter_set, params_hash
+
+
+FEATURE_NAMES = ("mixing_ratio", "mixing_ratio2", "OLR", "T_ad")
+FEATURE_SCALES = {"mixing_ratio": 0.1, "mixing_ratio2": 0.1, "OLR": 1.0, "T_ad": 3.0}
+
+LIBRARY_VERSION = 1
+
+
+def parameter_key(scenario: Dict[str, Any]) -> str:
+    """Parameter set selected by T_ad plus a hash of param_overrides."""
+    overrides = scenario.get("param_overrides") or {}
+    inhibition = "noinhib" if scenario.get("disable_inhibition") else "inhib"
+    return f"{select_parameter_set(scenario['T_ad'])}:{params_hash(overrides)}:{inhibition}"
+
+
+def _features(scenario: Dict[str, Any]) -> np.ndarray:
+    return np.array([float(scenario[name]) / FEATURE_SCALES[name] for name in FEATURE_NAMES])
+
+
+def new_library() -> Dict[str, Any]:
+    """Empty in-memory library."""
+    return {"version": LIBRARY_VERSION, "entries": []}
+
+
+def load_library(path: str) -> Dict[str, Any]:
+    """Load a library from JSON; a missing file gives an empty library."""
+    if not os.path.exists(path):
+        return new_library()
+    with open(path, "r", encoding="utf-8") as fh:
+        library = json.load(fh)
+    if library.get("version") != LIBRARY_VERSION:
+        raise ValueError(f"Unsupported warm-start library version in {path}: {library.get('version')}")
+    return library
+
+
+def save_library(library: Dict[str, Any], path: str) -> None:
+    """Write the library atomically (temporary file + rename)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(library, fh)
+    os.replace(tmp_path, path)
+
+
+def end_state(result: Dict[str, Any]) -> Dict[str, float]:
+    """Final reactor state of an ADM1_coAD result in the get_initial_state format."""
+    state = {name: float(result[name]) for name in STATE_NAMES}
+    state["pH"] = float(-np.log10(state["S_H_ion"]))
+    return state
+
+
+def is_converged(result: Dict[str, Any], window_days: float = 5.0, rtol: float = 1e-3,
+                 atol: float = 1e-8) -> bool:
+    """
+    True if no state moved by more than rtol (relative) over the last window_days.
+
+    The check covers all stored state columns of simulate_results; the run must
+    be longer than the window.
+    """
+    t = np.asarray(result["u"], dtype=float)
+    if len(t) < 2 or t[-1] - t[0] <= window_days:
+        return False
+    i = int(np.searchsorted(t, t[-1] - window_days, side="right")) - 1
+    values = result["simulate_results"].to_numpy(dtype=float)
+    last, past = values[-1], values[max(i, 0)]
+    return bool(np.all(np.abs(last - past) <= rtol * np.abs(last) + atol))
+
+
+def add_to_library(library: Dict[str, Any], scenario: Dict[str, Any], result: Dict[str, Any],
+                   require_converged: bool = True) -> bool:
+    """
+    Store the end state of `result` under the features of `scenario`.
+
+    An existing entry with identical features and parameter key is replaced.
+    Returns False (nothing stored) if require_converged and the run has not
+    settled.
+    """
+    if require_converged and not is_converged(result):
+        return False
+    add_end_state(library, scenario, end_state(result), float(np.asarray(result["u"])[-1]))
+    return True
+
+
+def add_end_state(library: Dict[str, Any], scenario: Dict[str, Any], state: Dict[str, float],
+                  days: float) -> None:
+    """
+    Store an end state (end_state format) under the features of `scenario`.
+
+    For callers that only kept the end state of a run, e.g. a reduce function
+    of run_scenarios; the convergence check is up to them.
+    """
+    key = parameter_key(scenario)
+    features = {name: float(scenario[name]) for name in FEATURE_NAMES}
+    entry = {"features": features, "parameter_key": key, "state": dict(state), "days": float(days)}
+    entries: List[Dict[str, Any]] = library["entries"]
+    for i, old in enumerate(entries):
+        if old["parameter_key"] == key and old["features"] == features:
+            entries[i] = entry
+            return
+    entries.append(entry)
+
+
+def lookup_initial_state(library: Dict[str, Any], scenario: Dict[str, Any], k: int = 1,
+                         max_distance: Optional[float] = None) -> Optional[Dict[str, float]]:
+    """
+    Nearest-neighbour (k=1) or inverse-distance interpolated (k>1) initial state.
+
+    Parameters:
+        library (Dict[str, Any]): Library from load_library/new_library.
+        scenario (Dict[str, Any]): Needs mixing_ratio, mixing_ratio2, OLR, T_ad
+            (and optionally param_overrides / disable_inhibition).
+        k (int): Number of neighbours to blend.
+        max_distance (Optional[float]): Ignore neighbours farther than this in
+            scaled feature units.
+
+    Returns:
+        Optional[Dict[str, float]]: Initial state dict, or None without a match.
+    """
+    key = parameter_key(scenario)
+    candidates = [e for e in library["entries"] if e["parameter_key"] == key]
+    if not candidates:
+        return None
+
+    target = _features(scenario)
+    X = np.array([_features(e["features"]) for e in candidates])
+    distance = np.sqrt(((X - target) ** 2).sum(axis=1))
+    order = np.argsort(distance)[:max(1, k)]
+    if max_distance is not None:
+        order = order[distance[order] <= max_distance]
+        if len(order) == 0:
+            return None
+
+    if distance[order[0]] == 0.0 or len(order) == 1:
+        return dict(candidates[order[0]]["state"])
+
+    weights = 1.0 / distance[order]
+    weights /= weights.sum()
+    names = list(candidates[order[0]]["state"])
+    S = np.array([[candidates[j]["state"][n] for n in names] for j in order])
+    blended = dict(zip(names, (weights @ S).tolist()))
+    # pH is not additive; rebuild it from the blended proton concentration
+    blended["pH"] = float(-np.log10(blended["S_H_ion"]))
+    return blended
+
+
+def warm_started(scenario: Dict[str, Any], library: Dict[str, Any], k: int = 1,
+                 max_distance: Optional[float] = None) -> Dict[str, Any]:
+    """Copy of `scenario` with `initials` taken from the library when it has none."""
+    if scenario.get("initials") is not None:
+        return dict(scenario)
+    initials = lookup_initial_state(library, scenario, k=k, max_distance=max_distance)
+    if initials is None:
+        return dict(scenario)
+    return dict(scenario, initials=initials)
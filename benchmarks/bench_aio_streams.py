@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Concurrent streaming check for adm1.aio.stream_scenario.
+
+Starts many stream_scenario calls at once on a small pool (more streams
+than pending slots, so runs finish while others are still queued) and
+verifies that every stream ends with a "result" item whose final step
+matches the result, that a scenario which fails in the worker raises
+its own error promptly instead of hanging until the timeout, and that a
+reduce returning None gives None rather than a cancellation. Exits with
+status 1 on any failure.
+
+Usage:
+    python benchmarks/bench_aio_streams.py [--streams N] [--workers N] [--days N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adm1.aio import new_pool, run_scenario, shutdown_pool, stream_scenario
+from adm1.constants import STATE_INDEX
+from bench_thread_runner import make_scenarios
+
+# simulate_results stores pH where the streamed state has S_H_ion
+PH = STATE_INDEX["S_H_ion"]
+
+
+def discard(result):
+    return None
+
+
+async def consume(scenario, pool, timeout):
+    return [item async for item in stream_scenario(scenario, pool=pool, timeout=timeout)]
+
+
+async def check(args):
+    pool = new_pool(max_workers=args.workers)
+    ok = True
+    try:
+        base = make_scenarios(args.days)
+        scenarios = [base[i % len(base)] for i in range(args.streams)]
+        t0 = time.perf_counter()
+        streams = await asyncio.gather(*(consume(s, pool, args.timeout) for s in scenarios), return_exceptions=True)
+        elapsed = time.perf_counter() - t0
+        for i, items in enumerate(streams):
+            if isinstance(items, BaseException):
+                print(f"stream {i}: raised {items!r}")
+                ok = False
+            elif not items or "result" not in items[-1]:
+                print(f"stream {i}: ended without a result after {len(items)} items")
+                ok = False
+            elif not np.allclose(np.delete(items[-1]["state"], PH),
+                                 np.delete(items[-1]["result"]["simulate_results"].to_numpy()[-1], PH)):
+                print(f"stream {i}: last streamed state differs from the result")
+                ok = False
+        print(f"{len(streams)} streams on {args.workers} workers: {elapsed:6.2f} s")
+
+        t0 = time.perf_counter()
+        try:
+            await consume(dict(base[0], timesteps="Fortnight(s)"), pool, args.timeout)
+            print("failing scenario: no error raised")
+            ok = False
+        except asyncio.TimeoutError:
+            print("failing scenario: hit the timeout instead of raising its error")
+            ok = False
+        except Exception as exc:
+            print(f"failing scenario: {type(exc).__name__} after {time.perf_counter() - t0:.2f} s")
+
+        try:
+            value = await run_scenario(base[0], pool=pool, timeout=args.timeout, reduce=discard)
+            print(f"reduce returning None: got {value!r}")
+            ok = ok and value is None
+        except asyncio.CancelledError:
+            print("reduce returning None: reported as cancelled")
+            ok = False
+    finally:
+        shutdown_pool(pool)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+    ok = asyncio.run(check(args))
+    print("all streams complete" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Cache-key collision check for adm1.runner.scenario_key.
+
+Builds pairs of scenarios that differ in a single detail which a naive
+repr-based key would miss, and verifies that every pair gets two different
+keys while identical scenarios keep the same key. The same check runs on
+adm1.service job ids, which decide whether two submissions share a job.
+Also times key computation for a scenario carrying large arrays. Exits
+with status 1 on any collision.
+
+Usage:
+    python benchmarks/bench_cache_keys.py [--size N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adm1.runner import scenario_key
+from adm1.service import WARMUP_SCENARIO, _job_id, _normalize
+
+
+def stop_above(threshold):
+    """A stop_condition closure; instances differ only in the captured threshold."""
+    def stop_condition(t, state):
+        return state[30] > threshold
+    return stop_condition
+
+
+def pairs(size):
+    """(label, (scenario, reduce) a, (scenario, reduce) b) that must not share a key."""
+    base = {"days": 10, "timesteps": "Day(s)"}
+    initials = np.linspace(0.0, 1.0, size)
+    changed = initials.copy()
+    changed[size // 2] += 1e-9
+    frame = pd.DataFrame(np.arange(100 * 30, dtype=float).reshape(100, 30))
+    frame_changed = frame.copy()
+    frame_changed.iloc[50, 15] += 1.0
+    return [
+        (f"{size}-element array, one entry changed", (dict(base, initials=initials), None),
+         (dict(base, initials=changed), None)),
+        ("100x30 DataFrame, one cell changed", (dict(base, influent=frame), None),
+         (dict(base, influent=frame_changed), None)),
+        ("same values, int vs float array", (dict(base, VSS=np.arange(size)), None),
+         (dict(base, VSS=np.arange(size) * 1.0), None)),
+        ("closures with different thresholds", (dict(base, stop_condition=stop_above(1e-6)), None),
+         (dict(base, stop_condition=stop_above(1e-5)), None)),
+        ("reduce lambdas with different bodies", (base, lambda r: r["VS_out"]), (base, lambda r: r["q_ch4"])),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=2000)
+    args = parser.parse_args()
+
+    ok = True
+    for label, a, b in pairs(args.size):
+        same = scenario_key(*a) == scenario_key(dict(a[0]), a[1])
+        distinct = scenario_key(*a) != scenario_key(*b)
+        print(f"{label:<45} {'ok' if same and distinct else 'COLLISION' if not distinct else 'UNSTABLE'}")
+        ok = ok and same and distinct
+
+    # Service submissions differing only in their stop_condition closure must not be merged
+    requests = [{"scenario": dict(WARMUP_SCENARIO, stop_condition=stop_above(limit))} for limit in (1e-6, 1e-5)]
+    ids = [_job_id(_normalize(request)) for request in requests]
+    same = _job_id(_normalize(requests[0])) == ids[0]
+    print(f"{'service jobs with different closures':<45} "
+          f"{'ok' if same and ids[0] != ids[1] else 'COLLISION' if ids[0] == ids[1] else 'UNSTABLE'}")
+    ok = ok and same and ids[0] != ids[1]
+
+    big = {"initials": np.random.default_rng(0).random((args.size, 42))}
+    t0 = time.perf_counter()
+    for _ in range(100):
+        scenario_key(big)
+    print(f"key of a ({args.size}, 42) array: {(time.perf_counter() - t0) * 10:.3f} ms")
+    print("all keys distinct" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
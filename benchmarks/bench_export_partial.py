@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Interrupted-export check for ADM1_coAD(..., export_path=...).
+
+Runs a scenario whose stop_condition hook raises part-way through and
+verifies, for every available store format, that the error reaches the
+caller, that the partial store still loads with one state row per step
+completed before the hook raised, and that metadata.json records the
+error. Exits with status 1 on any failure.
+
+Usage:
+    python benchmarks/bench_export_partial.py [--days N] [--fail-at T]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adm1.coAD import ADM1_coAD
+from adm1.export import FORMATS, _arrow, read_metadata, read_table
+from bench_thread_runner import make_scenarios
+
+
+class HookFailed(RuntimeError):
+    pass
+
+
+def fail_after(limit):
+    def hook(t, state):
+        if t >= limit:
+            raise HookFailed(f"hook raised at t={t:g}")
+        return False
+    return hook
+
+
+def check(fmt, args, directory):
+    path = os.path.join(directory, fmt)
+    scenario = dict(make_scenarios(args.days)[0], timesteps="Hour(s)")
+    try:
+        ADM1_coAD(**scenario, verbose=False, stop_condition=fail_after(args.fail_at), export_path=path,
+                  export_format=fmt)
+        print(f"{fmt}: the hook error did not reach the caller")
+        return False
+    except HookFailed:
+        pass
+    try:
+        state = read_table(path, "state")
+        metadata = read_metadata(path)
+    except Exception as exc:
+        print(f"{fmt}: partial store does not load: {exc!r}")
+        return False
+    # t0 plus every step up to (not including) the one whose hook raised
+    expected = int((state["time"] < args.fail_at).sum()) + 1
+    ok = len(state) == expected and state["time"].iloc[-1] >= args.fail_at
+    ok = ok and "HookFailed" in str(metadata["metadata"].get("error"))
+    print(f"{fmt}: {len(state)} state rows up to t={state['time'].iloc[-1]:.3f} d, "
+          f"error recorded: {metadata['metadata'].get('error')!r} -> {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument("--fail-at", type=float, default=60.0)
+    args = parser.parse_args()
+
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in FORMATS:
+            if fmt == "parquet" and _arrow()[1] is None:
+                print("parquet: skipped (pyarrow not installed)")
+                continue
+            ok = check(fmt, args, directory) and ok
+    print("partial stores load" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
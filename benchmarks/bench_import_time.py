@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the adm1 package.
+
+Runs each case in a fresh interpreter under `python -X importtime`, reports
+the cumulative import time of the adm1 modules, the wall time of the whole
+process, and whether pandas / SciPy were loaded. The cases are no-op runs:
+importing the package, a runner worker importing the driver, and the CLI
+validating a one-run scenario file.
+
+Usage:
+    python benchmarks/bench_import_time.py [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIO = dict(
+    q_ad_init=193.3, density=1.0, VS_per_TS_PS=0.986, VS_per_TS_SS=0.851, TS_fraction=0.1,
+    mixing_ratio=0.7, mixing_ratio2=0.9, OLR=4.0, T_ad=308.15, T_base=298.15, T_op=308.15,
+    recycle_ratio=0.0, days=1, timesteps="Day(s)",
+)
+
+# Appended to every case: which heavy dependencies ended up loaded
+PROBE = "import sys; print('loaded:' + ','.join(m for m in ('pandas', 'scipy') if m in sys.modules))"
+
+
+def cases(scenario_file):
+    return {
+        "import adm1": "import adm1",
+        "worker import": "import adm1.runner, adm1.coAD",
+        "cli validate": f"from adm1.cli import main; main(['validate', {scenario_file!r}])",
+    }
+
+
+def measure(code):
+    """Wall time [s], adm1 import time [s] and the loaded heavy modules for one fresh interpreter."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"{code}\n{PROBE}"], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - t0
+    cumulative = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line.split("|")
+        name = fields[2].rstrip()
+        # Top-level adm1 entries are not indented; their cumulative time includes everything below
+        if name.strip().startswith("adm1") and name == " " + name.strip() and fields[1].strip().isdigit():
+            cumulative += int(fields[1])
+    loaded = proc.stdout.splitlines()[-1][len("loaded:"):]
+    return wall, cumulative / 1e6, loaded or "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scenario_file = os.path.join(tmp, "scenario.json")
+        with open(scenario_file, "w", encoding="utf-8") as fh:
+            json.dump(SCENARIO, fh)
+        measure("import adm1")  # warm the bytecode cache
+        print(f"{'case':<16} {'wall [ms]':>10} {'adm1 imports [ms]':>18}  loaded")
+        for name, code in cases(scenario_file).items():
+            runs = [measure(code) for _ in range(args.repeat)]
+            wall = min(r[0] for r in runs)
+            imports = min(r[1] for r in runs)
+            print(f"{name:<16} {wall * 1e3:10.1f} {imports * 1e3:18.1f}  {runs[-1][2]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the ADM1_ODE right-hand side.
+
+Compares one RHS evaluation with the parameter-only coefficients compiled
+on every call (ADM1_ODE(..., coeffs=None)) against the same call with the
+coefficient vector compiled once per scenario, as ADM1_coAD does.
+
+Usage:
+    python benchmarks/bench_ode_kernel.py [--calls N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adm1.constants import STATE_NAMES, INFLUENT_NAMES
+from adm1.influent import reactor_setup, get_influent, rescale_influent
+from adm1.initial_state import get_initial_state
+from adm1.params import PARAMETER_SETS, get_adm1_params
+from adm1.ode import ADM1_ODE, compile_ode_params
+
+
+def build_case(mixing_ratio=0.7, mixing_ratio2=0.9, T_ad=308.15, T_base=298.15):
+    """Parameter dict, state and influent for a representative co-digestion scenario."""
+    influent = get_influent(mixing_ratio, mixing_ratio2)
+    initial_state = get_initial_state(mixing_ratio)
+    reactor = reactor_setup(influent, initial_state, 193.3, 1.0, 0.986, 0.851, 0.1,
+                            mixing_ratio, mixing_ratio2, 4.0, 0.0, False, None, V_liq=None)
+    params = get_adm1_params(T_ad, T_base, PARAMETER_SETS["mesophilic_solids"], mixing_ratio)
+    params.update({k: reactor[k] for k in ("q_in", "q_in1", "q_in2", "q_ad", "q_out", "q_r",
+                                           "V_liq", "V_gas", "mixing_ratio")})
+    new_influent = rescale_influent(mixing_ratio, influent, reactor["q_in"], 193.3)
+    y = [initial_state[name] for name in STATE_NAMES]
+    y_in = [new_influent[name] for name in INFLUENT_NAMES]
+    return params, y, y_in
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    params, y, y_in = build_case()
+    coeffs = compile_ode_params(params)
+
+    per_call = timeit.timeit(lambda: ADM1_ODE(0.0, y, y_in, params), number=args.calls)
+    hoisted = timeit.timeit(lambda: ADM1_ODE(0.0, y, y_in, params, coeffs), number=args.calls)
+    setup = timeit.timeit(lambda: compile_ode_params(params), number=args.calls)
+
+    print(f"ADM1_ODE, coefficients compiled per call : {1e6 * per_call / args.calls:8.2f} us/call")
+    print(f"ADM1_ODE, coefficients compiled once     : {1e6 * hoisted / args.calls:8.2f} us/call")
+    print(f"compile_ode_params (once per scenario)   : {1e6 * setup / args.calls:8.2f} us")
+    print(f"saving per RHS call                      : {1e6 * (per_call - hoisted) / args.calls:8.2f} us "
+          f"({100 * (per_call - hoisted) / per_call:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Result transport benchmark for adm1.runner.run_scenarios on process workers.
+
+Runs the same high-resolution scenarios (15-minute output steps) with
+transport="pickle" and transport="mmap", checks that the results are
+identical, and reports the wall time and how many bytes of trajectory
+frames each run returned. With "mmap" those bytes are mapped from
+/dev/shm instead of being pickled through the worker pipe.
+
+Usage:
+    python benchmarks/bench_transport.py [--days N] [--workers N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adm1.runner import run_scenarios
+from bench_thread_runner import make_scenarios
+
+
+def frame_bytes(results):
+    return sum(v.to_numpy().nbytes for r in results for v in r.values() if hasattr(v, "to_numpy"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    scenarios = [dict(s, timesteps="15 Minute(s)") for s in make_scenarios(args.days)]
+    runs = {}
+    for transport in ("pickle", "mmap"):
+        t0 = time.perf_counter()
+        results = run_scenarios(scenarios, executor="process", max_workers=args.workers, transport=transport)
+        runs[transport] = (results, time.perf_counter() - t0)
+
+    ok = True
+    for i, (a, b) in enumerate(zip(runs["pickle"][0], runs["mmap"][0])):
+        for table in ("simulate_results", "gasflow", "inhibition"):
+            if not np.array_equal(a[table].to_numpy(), b[table].to_numpy(), equal_nan=True):
+                print(f"scenario {i}: {table} differs between transports")
+                ok = False
+
+    size = frame_bytes(runs["pickle"][0]) / 2 ** 20
+    for transport, (_, elapsed) in runs.items():
+        print(f"{transport:<7}: {elapsed:6.2f} s for {len(scenarios)} scenarios ({size:.1f} MiB of frames)")
+    print("results identical" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()